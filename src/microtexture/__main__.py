@@ -1,10 +1,16 @@
-"""Allow running the package as: python -m microtexture [gui]"""
+"""Allow running the package as: python -m microtexture [gui | watch DIR | serve]"""
 import sys
 
 if __name__ == "__main__":
     if len(sys.argv) > 1 and sys.argv[-1].endswith("gui"):
         from microtexture.gui import main as gui_main
         gui_main()
+    elif len(sys.argv) > 1 and sys.argv[1] == "watch":
+        from microtexture.watch import main as watch_main
+        watch_main(sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == "serve":
+        from microtexture.serve import main as serve_main
+        serve_main(sys.argv[2:])
     else:
         from microtexture.cli import main as cli_main
         cli_main()
@@ -0,0 +1,103 @@
+"""
+MTR classification by c-axis misalignment to the stress axis.
+
+A ClassScheme maps misalignment angles (deg) to integer class codes using
+np.digitize on a set of bin edges. Several bins may share a label (e.g. the two
+"Misc" bins of the default scheme); codes index the unique labels, in order of
+first appearance, and -1 marks values outside of the bins (or NaN).
+
+Bins are right-closed, (a, b], except for the first one which also includes its
+lower edge, [a, b], so that a misalignment of exactly 0 deg is still classified.
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+
+DEFAULT_EDGES = (0, 25, 40, 60, 70, 90)
+DEFAULT_LABELS = ("Hard", "Misc", "Initiator", "Misc", "Soft")
+
+# RGB colors of class maps, by label; other labels take the next fallback color
+CLASS_COLORS = {
+    "Hard": (31, 119, 180),
+    "Soft": (44, 160, 44),
+    "Initiator": (214, 39, 40),
+    "Misc": (150, 150, 150),
+}
+FALLBACK_COLORS = (
+    (255, 127, 14),
+    (148, 103, 189),
+    (140, 86, 75),
+    (227, 119, 194),
+    (188, 189, 34),
+    (23, 190, 207),
+)
+
+
+@dataclass(frozen=True)
+class ClassScheme:
+    edges: tuple[float, ...] = DEFAULT_EDGES
+    bin_labels: tuple[str, ...] = DEFAULT_LABELS
+
+    def __post_init__(self):
+        object.__setattr__(self, "edges", tuple(float(x) for x in self.edges))
+        object.__setattr__(self, "bin_labels", tuple(map(str, self.bin_labels)))
+
+        if len(self.edges) != len(self.bin_labels) + 1:
+            raise ValueError(
+                f"Expected {len(self.edges) - 1} MTR class labels (one per bin), "
+                f"got {len(self.bin_labels)}: {self.bin_labels}"
+            )
+        if np.any(np.diff(self.edges) <= 0):
+            raise ValueError(f"MTR class edges must be increasing, got: {self.edges}")
+
+    @classmethod
+    def from_config(cls, cfg) -> "ClassScheme":
+        """From a config dict / Namespace with mtr_class_edges & mtr_class_labels"""
+        if not isinstance(cfg, dict):
+            cfg = vars(cfg)
+        return cls(
+            edges=cfg.get("mtr_class_edges") or DEFAULT_EDGES,
+            bin_labels=cfg.get("mtr_class_labels") or DEFAULT_LABELS,
+        )
+
+    @property
+    def labels(self) -> tuple[str, ...]:
+        """Unique class labels, in order of first appearance"""
+        return tuple(dict.fromkeys(self.bin_labels))
+
+    @property
+    def bin_codes(self) -> np.ndarray:
+        """Class code of every bin, plus -1 for out-of-range values"""
+        codes = [self.labels.index(x) for x in self.bin_labels]
+        return np.array(codes + [-1], dtype=np.int8)
+
+    def classify(self, angles) -> np.ndarray:
+        """
+        Class codes (int8, same shape as angles) for misalignment angles in deg.
+        Any shape works, e.g. (n_axes, n_mtrs) to classify all axes in one call.
+        """
+        shape = np.shape(angles)
+        angles = np.atleast_1d(angles)  # np.digitize returns a scalar for a scalar
+        edges = np.asarray(self.edges)
+        bins = np.digitize(angles, edges, right=True) - 1
+        bins[angles == edges[0]] = 0
+        bins[(bins < 0) | (bins >= len(self.bin_labels))] = -1
+        return self.bin_codes[bins.reshape(shape)]
+
+    @property
+    def colors(self) -> np.ndarray:
+        """
+        uint8 RGB color of every class code, plus black for -1 (last row),
+        so that colors[codes] colors a map of class codes
+        """
+        fallback = iter(FALLBACK_COLORS)
+        colors = [
+            CLASS_COLORS.get(x) or next(fallback, (255, 255, 255)) for x in self.labels
+        ]
+        return np.array(colors + [(0, 0, 0)], dtype=np.uint8)
+
+    def label(self, codes) -> np.ndarray:
+        """Labels (object array) for class codes, None where unclassified"""
+        lut = np.array(list(self.labels) + [None], dtype=object)
+        return lut[codes]
@@ -5,7 +5,10 @@ Command-line interface replacement for the old Tk GUI.
 
 import os
 from glob import glob
+from functools import partial
+import sys
 import json
+import tempfile
 import subprocess
 from importlib.resources import files
 
@@ -14,21 +17,91 @@ from jinja2 import Environment, FileSystemLoader
 
 
 def main():
-    args = parse_args()
+    batch = parse_args()
+    args = batch[0]
+
+    if args.server:
+        from .serve import submit_job, wait_for_job
+
+        jobs = [submit_job(args.server, a) for a in batch]
+        for job in jobs:
+            print(f"Submitted job {job['id']} to {args.server}: {job['input_file']}")
+        for job in jobs:
+            job = wait_for_job(args.server, job["id"])
+            if job["status"] != "done":
+                raise RuntimeError(f"Job {job['id']} {job['status']}: {job.get('error')}")
+            print(f"Results in: {job['output_dir']}")
+    elif len(batch) == 1:
+        process(args)
+    else:
+        from .pipelined import PipelinedExecutor
+
+        schedule = None
+        if args.max_memory:
+            from .scheduler import MemoryModel, MemoryScheduler, estimate_pixels, GiB
+
+            scheduler = MemoryScheduler(
+                MemoryModel(args.memory_model),
+                max_memory=args.max_memory * GiB,
+                max_jobs=args.runner_jobs,
+            )
+            schedule = partial(
+                scheduler.run,
+                pixels=lambda a: estimate_pixels(a.input_file),
+                name=lambda a: a.input_file,
+            )
+
+        executor = PipelinedExecutor(
+            run_runner,
+            run_analysis,
+            queue_depth=args.queue_depth,
+            name=lambda a: a.input_file,
+            schedule=schedule,
+        )
+        executor.run(batch)
+        if executor.failed:
+            raise RuntimeError(f"{len(executor.failed)} of {len(batch)} scans failed")
+
+
+def process(args: Namespace):
+    """Render the pipeline template, run PipelineRunner, and run the analysis"""
+    run_runner(args)
+    run_analysis(args)
+
+
+def run_runner(args: Namespace) -> int | None:
+    """
+    Render the pipeline template and run PipelineRunner (first stage of process).
+    Returns PipelineRunner's peak memory in bytes, if known.
+    """
     render_template(args.pipeline_template, vars(args), args.json_path)
 
+    usage = {}
     if not args.no_runner and args.pipeline_runner:
-        run_pipeline(args.json_path, runner_path=args.pipeline_runner)
+        if not run_pipeline(args.json_path, runner_path=args.pipeline_runner, usage=usage):
+            raise RuntimeError(f"PipelineRunner failed for: {args.json_path}")
+    return usage.get("peak_memory")
 
+
+def run_analysis(args: Namespace):
+    """Analyze the .dream3d file produced by run_runner (second stage of process)"""
     if not args.no_analysis:
 
         from .postprocess import analyzeData
+        from .classify import ClassScheme
 
         analyzeData(
             dream3d_file=os.path.join(args.output_dir, args.basename + ".dream3d"),
             output_dir=args.output_dir,
             stress_axis=args.stress_axis,
             min_mtr_size=args.min_mtr_size,
+            mtr_classes=ClassScheme.from_config(args),
+            worst_case_axis=args.worst_case_axis,
+            worst_case_class=args.worst_case_class,
+            heatmap_windows=args.heatmaps,
+            correlations=args.correlations,
+            spacing_radius=args.spacing_radius,
+            roi=args.roi,
         )
 
 
@@ -52,8 +125,11 @@ def render_template(template_name: str, context: dict, json_path: str) -> dict:
     print(f"Generated JSON input file: {json_path}")
 
 
-def run_pipeline(json_path: str, runner_path: str):
-    """Run the DREAM3D PipelineRunner with the given JSON input file"""
+def run_pipeline(json_path: str, runner_path: str, usage: dict = None) -> bool:
+    """
+    Run the DREAM3D PipelineRunner with the given JSON input file, return success.
+    Where supported, the runner's peak memory (bytes) is stored in usage["peak_memory"].
+    """
 
     if not os.path.isfile(runner_path):
         raise FileNotFoundError(f"PipelineRunner not found or invalid: {runner_path}")
@@ -61,7 +137,12 @@ def run_pipeline(json_path: str, runner_path: str):
         raise FileNotFoundError(f"JSON input file not found or invalid: {json_path}")
 
     cmd = [runner_path, "-p", json_path]
-    status = subprocess.run(cmd, capture_output=True)
+    if hasattr(os, "wait4"):
+        status, peak = _run_measured(cmd)
+        if usage is not None:
+            usage["peak_memory"] = peak
+    else:
+        status = subprocess.run(cmd, capture_output=True)
 
     if status.returncode == 0:
         print(f"PipelineRunner executed successfully for: {json_path}")
@@ -72,8 +153,54 @@ def run_pipeline(json_path: str, runner_path: str):
         print("STDERR:")
         print(status.stderr.decode())
 
+    return status.returncode == 0
+
+
+def _run_measured(cmd: list[str]) -> tuple[subprocess.CompletedProcess, int]:
+    """subprocess.run(cmd, capture_output=True), plus the peak RSS of the process"""
+    with tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+        proc = subprocess.Popen(cmd, stdout=out, stderr=err)
+        _, status, rusage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        out.seek(0)
+        err.seek(0)
+        result = subprocess.CompletedProcess(cmd, proc.returncode, out.read(), err.read())
+
+    # ru_maxrss is in kB on Linux, bytes on macOS
+    peak = rusage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    return result, peak
+
+
+def parse_args(argv: list[str] = None) -> list[Namespace]:
+    """Arguments for each input file, in order"""
+    p = get_parser()
+    p.add_argument(
+        "input_file",
+        nargs="+",
+        help="Path(s) to .ang or .ctf files, or glob patterns (required)",
+    )
+    args = p.parse_args(argv)
 
-def parse_args() -> Namespace:
+    inputs = []
+    for pattern in args.input_file:
+        pattern = os.path.expanduser(os.path.expandvars(pattern))
+        inputs += [pattern] if os.path.isfile(pattern) else sorted(glob(pattern)) or [pattern]
+
+    batch = [check_args(Namespace(**{**vars(args), "input_file": f})) for f in inputs]
+
+    outputs = [a.output_dir for a in batch]
+    if len(set(outputs)) < len(outputs):
+        raise ValueError(
+            f"Input files share an output directory ({args.output_dir}), "
+            "use {basename} in --output-dir"
+        )
+    return batch
+
+
+def get_parser(**kwargs) -> ArgumentParser:
+    """Parser with all options, but no positional arguments"""
+    from .loading import axis_argument
+    from .roi import roi_argument
 
     def_config_file = os.path.join(
         os.path.dirname(os.path.realpath(__file__)), "defaults.yaml"
@@ -81,12 +208,12 @@ def parse_args() -> Namespace:
     with open(def_config_file, "r") as f:
         cfg = YAMLConfigFileParser().parse(f)
 
+    kwargs.setdefault("description", "CLI for executing Dream3D pipeline templates")
     p = ArgumentParser(
-        description="CLI for executing Dream3D pipeline templates",
         config_file_parser_class=YAMLConfigFileParser,
         default_config_files=["./.microtexture", "~/.microtexture"],
+        **kwargs,
     )
-    p.add_argument("input_file", help="Path to a single .ang or .ctf file (required)")
     p.add_argument(
         "-c",
         "--config",
@@ -125,6 +252,19 @@ def parse_args() -> Namespace:
         help="Overwrite existing files in OUTPUT_DIR",
     )
     p.add_argument("-v", "--verbose", action="store_true")
+    p.add_argument(
+        "--queue-depth",
+        type=int,
+        default=2,
+        help="With several input files, max. number of scans that have been through "
+        "PipelineRunner but are still waiting for analysis [%(default)s]",
+    )
+    p.add_argument(
+        "--server",
+        default=os.getenv("MICROTEXTURE_SERVER"),
+        help="Submit to a job server (see `python -m microtexture serve`) instead of "
+        "running locally, e.g. http://127.0.0.1:8765 [$MICROTEXTURE_SERVER]",
+    )
 
     ang = p.add_argument_group("cleanup parameters for .ang files")
     ang._extension = "ang"  # see check_explicit_args
@@ -189,9 +329,63 @@ def parse_args() -> Namespace:
     )
     ana.add_argument(
         "--stress-axis",
-        choices=["100", "010", "001"],
+        type=axis_argument,
+        nargs="+",
         default=cfg["stress_axis"],
-        help="Stress axis direction (x='100', y='010', z='001') ['%(default)s']",
+        help="Stress axis direction: x='100', y='010', z='001', components "
+        "('0.3,0,0.95') or Euler angles of the coupon ('euler:phi1,Phi,phi2', deg). "
+        "Class area fractions are also written for any further axes ['%(default)s']",
+    )
+    ana.add_argument(
+        "--worst-case-axis",
+        action="store_true",
+        help="Also search the loading direction maximizing the area fraction of "
+        "--worst-case-class MTRs",
+    )
+    ana.add_argument(
+        "--worst-case-class",
+        default="Initiator",
+        help="MTR class of --worst-case-axis ['%(default)s']",
+    )
+    ana.add_argument(
+        "--heatmaps",
+        type=float,
+        nargs="+",
+        metavar="UM",
+        help="Also write heatmaps of the MTR class area fractions and MTR intensity "
+        "over windows of these sizes, um",
+    )
+    ana.add_argument(
+        "--no-correlations",
+        dest="correlations",
+        action="store_false",
+        help="Skip the two-point correlations and correlation lengths of the MTR classes",
+    )
+    ana.add_argument(
+        "--spacing-radius",
+        type=float,
+        metavar="UM",
+        help="Also count the MTRs of each class within this distance of every MTR, um",
+    )
+    ana.add_argument(
+        "--roi",
+        type=roi_argument,
+        metavar="X0,Y0,X1,Y1",
+        help="Analyze only this region of the scans, from the top left corner: "
+        "x (columns) and y (rows) ranges in um, or in pixels with a 'px' suffix",
+    )
+    ana.add_argument(
+        "--mtr-class-edges",
+        type=float,
+        nargs="+",
+        default=cfg["mtr_class_edges"],
+        help="C-Axis misalignment bin edges (deg) for MTR classes %(default)s",
+    )
+    ana.add_argument(
+        "--mtr-class-labels",
+        nargs="+",
+        default=cfg["mtr_class_labels"],
+        help="MTR class label for each bin %(default)s",
     )
 
     d3d = p.add_argument_group("DREAM3D execution")
@@ -209,8 +403,44 @@ def parse_args() -> Namespace:
         help="Path to DREAM3D PipelineRunner [%(default)s]. "
         "Override default by setting DREAM3D_PIPELINE_RUNNER.",
     )
+    d3d.add_argument(
+        "--max-memory",
+        type=float,
+        default=cfg["max_memory"],
+        help="With several input files, run PipelineRunner on as many scans at once "
+        "as their estimated peak memory allows, in GiB [%(default)s], 0: one at a time",
+    )
+    d3d.add_argument(
+        "--runner-jobs",
+        type=int,
+        default=cfg["runner_jobs"],
+        help="Max. concurrent PipelineRunner jobs with --max-memory [%(default)s], "
+        "0: CPU count",
+    )
+    d3d.add_argument(
+        "--memory-model",
+        default=cfg["memory_model"],
+        help="File of observed PipelineRunner peak memory vs. scan size, used to "
+        "estimate the memory of new jobs ['%(default)s']",
+    )
+
+    return p
+
+
+def check_args(args: Namespace) -> Namespace:
+    """
+    Resolve and validate input / output paths for args.input_file. With --server,
+    the pipeline template, output directory and PipelineRunner are the job
+    server's, and checked there.
+    """
+    from .loading import parse_axes
+    from .roi import parse_roi
+
+    remote = bool(getattr(args, "server", None))
 
-    args = p.parse_args()
+    parse_axes(args.stress_axis)  # ValueError if invalid, e.g. given as a job parameter
+    if getattr(args, "roi", None):
+        parse_roi(args.roi)
 
     args.input_file = os.path.expanduser(os.path.expandvars(args.input_file))
     if not os.path.isfile(args.input_file):
@@ -234,7 +464,7 @@ def parse_args() -> Namespace:
         ext=ext.lower(),
         microtexture=files("microtexture"),
     )
-    if not os.path.isfile(args.pipeline_template):
+    if not remote and not os.path.isfile(args.pipeline_template):
         raise FileNotFoundError(
             f"Template file {args.pipeline_template} does not exist."
         )
@@ -248,7 +478,8 @@ def parse_args() -> Namespace:
     )
 
     if (
-        not args.overwrite
+        not remote
+        and not args.overwrite
         and os.path.isdir(args.output_dir)
         and os.listdir(args.output_dir)
     ):
@@ -259,7 +490,7 @@ def parse_args() -> Namespace:
 
     args.json_path = os.path.join(args.output_dir, basename + ".json")
 
-    if not args.no_runner and not os.path.isfile(args.pipeline_runner):
+    if not remote and not args.no_runner and not os.path.isfile(args.pipeline_runner):
         raise FileNotFoundError(
             f"DREAM3D PipelineRunner not found at: {args.pipeline_runner}"
         )
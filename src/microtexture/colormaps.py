@@ -0,0 +1,126 @@
+"""
+Colormaps as precomputed 256-entry uint8 RGB lookup tables.
+
+The control points are those of matplotlib's colormaps of the same name, and
+the tables are built the same way, so that colorize(x, name) gives the same
+colors as matplotlib's get_cmap(name)(x, bytes=True), without importing
+matplotlib (and its start-up time and memory) for post-processing.
+Coloring is a single gather from the table.
+"""
+
+import numpy as np
+
+N = 256
+
+# Matplotlib's (x, y) control points of each channel
+_JET = dict(
+    red=((0.0, 0), (0.35, 0), (0.66, 1), (0.89, 1), (1.0, 0.5)),
+    green=((0.0, 0), (0.125, 0), (0.375, 1), (0.64, 1), (0.91, 0), (1.0, 0)),
+    blue=((0.0, 0.5), (0.11, 1), (0.34, 1), (0.65, 0), (1.0, 0)),
+)
+
+# RGB at x = 0, 0.05, ..., 1
+_NIPY_SPECTRAL_RGB = (
+    (0.0, 0.0, 0.0),
+    (0.4667, 0.0, 0.5333),
+    (0.5333, 0.0, 0.6),
+    (0.0, 0.0, 0.6667),
+    (0.0, 0.0, 0.8667),
+    (0.0, 0.4667, 0.8667),
+    (0.0, 0.6, 0.8667),
+    (0.0, 0.6667, 0.6667),
+    (0.0, 0.6667, 0.5333),
+    (0.0, 0.6, 0.0),
+    (0.0, 0.7333, 0.0),
+    (0.0, 0.8667, 0.0),
+    (0.0, 1.0, 0.0),
+    (0.7333, 1.0, 0.0),
+    (0.9333, 0.9333, 0.0),
+    (1.0, 0.8, 0.0),
+    (1.0, 0.6, 0.0),
+    (1.0, 0.0, 0.0),
+    (0.8667, 0.0, 0.0),
+    (0.8, 0.0, 0.0),
+    (0.8, 0.8, 0.8),
+)
+_NIPY_SPECTRAL = {
+    channel: tuple((i / 20, rgb[c]) for i, rgb in enumerate(_NIPY_SPECTRAL_RGB))
+    for c, channel in enumerate(("red", "green", "blue"))
+}
+
+# Matplotlib's single letter colors, for nan_color
+BASE_COLORS = dict(
+    b=(0, 0, 1),
+    g=(0, 0.5, 0),
+    r=(1, 0, 0),
+    c=(0, 0.75, 0.75),
+    m=(0.75, 0, 0.75),
+    y=(0.75, 0.75, 0),
+    k=(0, 0, 0),
+    w=(1, 1, 1),
+)
+
+
+def _channel(points) -> np.ndarray:
+    """Values at N evenly spaced x in [0, 1], interpolated as matplotlib does"""
+    x, y = np.array(points, dtype=float).T
+    x = x * (N - 1)
+    xs = (N - 1) * np.linspace(0, 1, N)
+    ind = np.searchsorted(x, xs)[1:-1]
+    distance = (xs[1:-1] - x[ind - 1]) / (x[ind] - x[ind - 1])
+    values = np.concatenate([[y[0]], distance * (y[ind] - y[ind - 1]) + y[ind - 1], [y[-1]]])
+    return np.clip(values, 0.0, 1.0)
+
+
+def _lookup_table(data: dict) -> np.ndarray:
+    rgb = np.stack([_channel(data[c]) for c in ("red", "green", "blue")], axis=-1)
+    return (rgb * 255).astype(np.uint8)
+
+
+LUTS = {
+    "jet": _lookup_table(_JET),
+    "nipy_spectral": _lookup_table(_NIPY_SPECTRAL),
+}
+
+
+def get_lut(name: str) -> np.ndarray:
+    """(N, 3) uint8 RGB table of a colormap"""
+    try:
+        return LUTS[name]
+    except KeyError:
+        raise ValueError(f"Unknown colormap {name!r}, use one of {sorted(LUTS)}") from None
+
+
+def to_rgb_bytes(color) -> np.ndarray:
+    """uint8 RGB of a single letter color name or an RGB tuple in [0, 1]"""
+    rgb = BASE_COLORS.get(color, color) if isinstance(color, str) else color
+    if isinstance(rgb, str) or len(rgb) < 3:
+        raise ValueError(f"Unsupported color {color!r}, use {list(BASE_COLORS)} or RGB")
+    return np.round(np.asarray(rgb[:3], dtype=float) * 255).astype(np.uint8)
+
+
+def colorize(x, cmap: str = "jet", nan_color="k") -> np.ndarray:
+    """
+    uint8 RGB colors (shape of x + (3,)) of values x in [0, 1] (clipped),
+    nan_color for NaN
+    """
+    lut = np.vstack([get_lut(cmap), to_rgb_bytes(nan_color)])  # last row: NaN
+    idx = np.asarray(x, dtype=float) * N
+    np.clip(idx, 0, N - 1, out=idx)
+    np.nan_to_num(idx, copy=False, nan=N)
+    return np.take(lut, idx.astype(np.intp), axis=0)
+
+
+def label_colors(
+    lo: int, hi: int, cmap: str = "jet", vmin=0, vmax=1, nan_color="k"
+) -> np.ndarray:
+    """
+    uint8 RGB colors of the integers 0 .. hi, for integer maps whose values
+    lo .. hi are scaled to vmin .. vmax (values below lo take the color of lo,
+    all of them take nan_color if lo == hi).
+    Integer maps are then colored by a gather, colors[map].
+    """
+    values = np.clip(np.arange(hi + 1), lo, hi)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        scaled = (values - lo) / (hi - lo) * (vmax - vmin) + vmin
+    return colorize(scaled, cmap, nan_color)
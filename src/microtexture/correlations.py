@@ -0,0 +1,110 @@
+"""
+Two-point statistics of MTR class maps, by FFT.
+
+The two-point correlation S_ab(r) of classes a and b is the probability that
+a pixel is of class a and the pixel at displacement r of class b, over the
+pairs of sample (mask) pixels:
+
+    S_ab(r) = sum_x I_a(x) I_b(x + r) / sum_x m(x) m(x + r)
+
+with I_a the indicator map of class a (0 outside the mask) and m the mask.
+Both sums are cross-correlations, computed for every displacement at once as
+products of the Fourier transforms of the maps, zero-padded by the largest
+displacement so that they don't wrap around. Each map is transformed once for
+all class pairs.
+
+Auto-correlations fall from the class fraction f_a at r = 0 to f_a^2 for
+uncorrelated pixels; the correlation length of a class is the distance at
+which its normalized auto-covariance (S_aa - f_a^2) / (f_a - f_a^2) falls to
+1/e, radially averaged or along x (columns) and y (rows).
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+from scipy.fft import next_fast_len
+
+DECAY = 1 / np.e  # normalized auto-covariance at the correlation length
+
+
+@dataclass(frozen=True)
+class TwoPointStatistics:
+    fractions: np.ndarray  # (n classes,) class fractions of the sample pixels
+    distances: np.ndarray  # (m,) displacements 0, 1, ... max_lag (px)
+    radial: np.ndarray  # (n, n, m) S_ab averaged over the displacements |r| ~ distance
+    x: np.ndarray  # (n, m) S_aa along x (columns)
+    y: np.ndarray  # (n, m) S_aa along y (rows)
+
+    def lengths(self, profiles: np.ndarray) -> np.ndarray:
+        """
+        Correlation lengths (n,) (px) of the auto-correlation profiles (n, m),
+        e.g. self.x, or the diagonal of self.radial. NaN for absent classes, or
+        if the auto-covariance does not decay to 1/e within max_lag.
+        """
+        f = self.fractions[:, None]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            covariance = (profiles - f**2) / (f - f**2)
+        lengths = np.full(len(profiles), np.nan)
+        for a, c in enumerate(covariance):
+            below = np.flatnonzero(c <= DECAY)
+            if len(below) and below[0] > 0 and np.isfinite(c[below[0] - 1]):
+                k = below[0]  # linear interpolation between k - 1 and k
+                lengths[a] = k - 1 + (c[k - 1] - DECAY) / (c[k - 1] - c[k])
+        return lengths
+
+    @property
+    def radial_lengths(self) -> np.ndarray:
+        """Correlation lengths (n,) (px) of the radially averaged auto-correlations"""
+        return self.lengths(np.diagonal(self.radial).T)
+
+
+def two_point_statistics(class_map, n_classes: int, mask, max_lag: int = None):
+    """
+    TwoPointStatistics of a map of class codes (-1: none) over the sample
+    pixels (mask), for displacements up to max_lag (px, by default half the
+    smaller side of the map)
+    """
+    mask = np.asarray(mask, dtype=bool)
+    H, W = mask.shape
+    if max_lag is None:
+        max_lag = min(H, W) // 2
+    max_lag = int(min(max_lag, H - 1, W - 1))
+    shape = (next_fast_len(H + max_lag, real=True), next_fast_len(W + max_lag, real=True))
+
+    # Displacements (dy, dx) within max_lag, and their ring of |r|
+    lags = np.r_[0 : max_lag + 1, -max_lag:0]
+    dy, dx = np.meshgrid(lags, lags, indexing="ij")
+    rings = np.rint(np.hypot(dy, dx)).astype(np.intp)
+    inside = rings <= max_lag
+    rings = rings[inside]
+    m = max_lag + 1
+
+    def window(Fc, G):
+        """sum_x f(x) g(x + r) for the displacements r within max_lag, Fc = conj(F)"""
+        c = np.fft.irfft2(Fc * G, shape)
+        return c[np.ix_(lags, lags)]
+
+    M = np.fft.rfft2(mask.astype(np.float64), shape)
+    pairs = np.rint(window(M.conj(), M))
+    pairs[pairs < 1] = np.nan  # no pair of sample pixels at this displacement
+    ring_pairs = np.bincount(rings, weights=np.nan_to_num(pairs[inside]), minlength=m)
+
+    codes = np.where(mask, class_map, -1)
+    n_pixels = mask.sum()
+    fractions = np.array([(codes == a).sum() / n_pixels for a in range(n_classes)])
+    F = [np.fft.rfft2((codes == a).astype(np.float64), shape) for a in range(n_classes)]
+
+    radial = np.full((n_classes, n_classes, m), np.nan)
+    x, y = np.full((n_classes, m), np.nan), np.full((n_classes, m), np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for a in range(n_classes):
+            Fc = F[a].conj()
+            for b in range(a, n_classes):
+                counts = np.rint(window(Fc, F[b]))  # integer pair counts
+                S = counts / pairs
+                # pooled over the pairs of each ring, symmetric in a, b
+                ring = np.bincount(rings, weights=counts[inside], minlength=m)
+                radial[a, b] = radial[b, a] = ring / ring_pairs
+                if a == b:
+                    x[a], y[a] = S[0, :m], S[:m, 0]
+    return TwoPointStatistics(fractions, np.arange(m), radial, x, y)
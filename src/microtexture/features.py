@@ -0,0 +1,213 @@
+"""
+Compact, typed per-feature (grain / MTR) data read from a .dream3d file.
+
+Columns are stored as a struct-of-arrays (float32 / int32), neighbor lists in
+CSR form (offsets + indices), and classes as integer codes into a tuple of
+labels. Row i corresponds to feature ID ids[i] in the MTRIds map.
+"""
+
+from dataclasses import dataclass, fields, replace
+
+import numpy as np
+
+from .orientation import c_axes
+
+FEATURE_DATA = "DataContainers/ImageDataContainer/CellFeatureData"
+
+# Datasets read by FeatureTable.from_dream3d (e.g. for h5io.Prefetcher)
+FEATURE_DATASETS = tuple(
+    f"{FEATURE_DATA}/{name}"
+    for name in (
+        "Volumes",
+        "NumNeighbors2",
+        "NeighborList2",
+        "SharedSurfaceAreaList2",
+        "AvgEuler",
+        "Phases",
+        "NumCells",
+        "EquivalentDiameters",
+        "Centroids",
+        "AvgCAxes",
+        "FeatureAvgCAxisMisorientations",
+    )
+)
+
+
+@dataclass(eq=False)
+class FeatureTable:
+    ids: np.ndarray  # int32 (n,) feature IDs, as found in MTRIds
+    eulers: np.ndarray  # float32 (n, 3) average Bunge Euler angles, rad
+    phases: np.ndarray  # int32 (n,)
+    volumes: np.ndarray  # float32 (n,) area, um^2
+    cells: np.ndarray  # int32 (n,) number of pixels
+    sizes: np.ndarray  # float32 (n,) equivalent diameters, um
+    centroids: np.ndarray  # float32 (n, 3)
+    avg_caxis: np.ndarray  # float32 (n, 3)
+    misorientation: np.ndarray  # float32 (n,) avg. c-axis misorientation, deg
+    num_neighbors: np.ndarray  # int32 (n,)
+    neighbor_offsets: np.ndarray  # int64 (n + 1,) CSR row pointers
+    neighbor_ids: np.ndarray  # int32 (nnz,) neighbor feature IDs
+    shared_surfaces: np.ndarray  # float32 (nnz,) shared boundary length, um
+    class_codes: np.ndarray | None = None  # int8 (n,), -1 = unclassified
+    class_labels: tuple = ()
+
+    @classmethod
+    def from_dream3d(cls, data) -> "FeatureTable":
+        """
+        Read CellFeatureData from an open .dream3d file (h5py.File or MappedFile).
+        Feature 0 (background) is dropped. Missing neighbor lists give empty CSR,
+        missing AvgCAxes are those of AvgEuler, and missing c-axis misorientations
+        are NaN (see orientation.feature_caxis_misorientations).
+        """
+
+        def read(name, dtype):
+            return np.asarray(data[f"{FEATURE_DATA}/{name}"][1:], dtype=dtype)
+
+        def optional(name, dtype):
+            return read(name, dtype) if f"{FEATURE_DATA}/{name}" in data else None
+
+        volumes = read("Volumes", np.float32).ravel()
+        n = len(volumes)
+        eulers = read("AvgEuler", np.float32)
+        avg_caxis = optional("AvgCAxes", np.float32)
+        misorientation = optional("FeatureAvgCAxisMisorientations", np.float32)
+
+        num_neighbors = read("NumNeighbors2", np.int32).ravel()
+        offsets, neighbor_ids, shared = _empty_csr(n)
+        try:
+            flat_ids = data[f"{FEATURE_DATA}/NeighborList2"]
+            flat_shared = data[f"{FEATURE_DATA}/SharedSurfaceAreaList2"]
+        except KeyError:
+            num_neighbors = np.zeros(n, dtype=np.int32)
+        else:
+            # Flat lists include the (empty) list of feature 0, if any
+            start = flat_ids.shape[0] - int(num_neighbors.sum())
+            if start >= 0:
+                offsets = np.zeros(n + 1, dtype=np.int64)
+                np.cumsum(num_neighbors, out=offsets[1:])
+                neighbor_ids = np.asarray(flat_ids[start:], dtype=np.int32).ravel()
+                shared = np.asarray(flat_shared[start:], dtype=np.float32).ravel()
+
+        return cls(
+            ids=np.arange(1, n + 1, dtype=np.int32),
+            eulers=eulers,
+            phases=read("Phases", np.int32).ravel(),
+            volumes=volumes,
+            cells=read("NumCells", np.int32).ravel(),
+            sizes=read("EquivalentDiameters", np.float32).ravel(),
+            centroids=read("Centroids", np.float32),
+            avg_caxis=c_axes(eulers) if avg_caxis is None else avg_caxis,
+            misorientation=(
+                np.full(n, np.nan, np.float32) if misorientation is None else misorientation.ravel()
+            ),
+            num_neighbors=num_neighbors,
+            neighbor_offsets=offsets,
+            neighbor_ids=neighbor_ids,
+            shared_surfaces=shared,
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def neighbors(self, i: int) -> tuple[np.ndarray, np.ndarray]:
+        """Neighbor feature IDs and shared boundary lengths of row i"""
+        s = slice(self.neighbor_offsets[i], self.neighbor_offsets[i + 1])
+        return self.neighbor_ids[s], self.shared_surfaces[s]
+
+    def take(self, rows) -> "FeatureTable":
+        """
+        Subset of rows (index array or boolean mask). Neighbor lists are kept
+        whole, i.e. they may refer to features outside of the subset.
+        """
+        rows = np.arange(len(self))[rows]
+        counts = np.diff(self.neighbor_offsets)[rows]
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        gather = np.repeat(self.neighbor_offsets[rows] - offsets[:-1], counts)
+        gather += np.arange(offsets[-1])
+
+        columns = {
+            f.name: getattr(self, f.name)[rows]
+            for f in fields(self)
+            if f.name not in CSR_FIELDS and isinstance(getattr(self, f.name), np.ndarray)
+        }
+        return replace(
+            self,
+            **columns,
+            neighbor_offsets=offsets,
+            neighbor_ids=self.neighbor_ids[gather],
+            shared_surfaces=self.shared_surfaces[gather],
+        )
+
+    def with_classes(self, codes, labels) -> "FeatureTable":
+        """Copy of the table with (categorical) class codes into labels"""
+        codes = np.asarray(codes, dtype=np.int8)
+        assert codes.shape == (len(self),)
+        return replace(self, class_codes=codes, class_labels=tuple(labels))
+
+    def within(self, labels, stepsize: float, offset=(0, 0)) -> "FeatureTable":
+        """
+        Copy of the table with the sizes, centroids and neighbor lists of the
+        features measured on the label map (e.g. a region of interest of the
+        MTRIds map, whose top left pixel is at (row, col) offset in the scan),
+        with pixels of stepsize (um). Orientations are kept. Features outside
+        of the map have 0 cells and NaN centroids. Rows must be in ID order.
+        """
+        labels = np.asarray(labels)
+        size = int(max(self.ids.max(initial=0), labels.max(initial=0))) + 1
+        flat = labels.ravel()
+        cells = np.bincount(flat, minlength=size)
+        rows, cols = np.indices(labels.shape)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            x, y = (
+                (np.bincount(flat, weights=c.ravel(), minlength=size) / cells + o + 0.5)
+                * stepsize
+                for c, o in ((cols, offset[1]), (rows, offset[0]))
+            )
+        centroids = self.centroids.copy()
+        centroids[:, 0], centroids[:, 1] = x[self.ids], y[self.ids]
+
+        # Neighbors: boundaries between pixels of different features, along
+        # rows and columns, counted both ways (feature 0 is background)
+        pairs = [(labels[:, :-1], labels[:, 1:]), (labels[:-1], labels[1:])]
+        a = np.concatenate([u[(u != v) & (u > 0) & (v > 0)] for u, v in pairs])
+        b = np.concatenate([v[(u != v) & (u > 0) & (v > 0)] for u, v in pairs])
+        keys, counts = np.unique(
+            np.concatenate([a, b]).astype(np.int64) * size + np.concatenate([b, a]),
+            return_counts=True,
+        )
+        first, second = np.divmod(keys, size)
+        num_neighbors = np.bincount(first, minlength=size)[self.ids].astype(np.int32)
+        offsets = np.zeros(len(self) + 1, dtype=np.int64)
+        np.cumsum(num_neighbors, out=offsets[1:])
+
+        cells = cells[self.ids]
+        volumes = (cells * stepsize**2).astype(np.float32)
+        return replace(
+            self,
+            cells=cells.astype(np.int32),
+            volumes=volumes,
+            sizes=np.sqrt(4 * volumes / np.pi),
+            centroids=centroids,
+            num_neighbors=num_neighbors,
+            neighbor_offsets=offsets,
+            neighbor_ids=second.astype(np.int32),
+            shared_surfaces=(counts * stepsize).astype(np.float32),
+        )
+
+    @property
+    def classes(self) -> np.ndarray:
+        """Class labels as an object array (None for unclassified)"""
+        lut = np.array(list(self.class_labels) + [None], dtype=object)
+        return lut[self.class_codes]
+
+
+CSR_FIELDS = ("neighbor_offsets", "neighbor_ids", "shared_surfaces")
+
+
+def _empty_csr(n: int):
+    return (
+        np.zeros(n + 1, dtype=np.int64),
+        np.zeros(0, dtype=np.int32),
+        np.zeros(0, dtype=np.float32),
+    )
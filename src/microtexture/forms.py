@@ -4,23 +4,20 @@ import glob
 import time
 import re
 import subprocess
-import warnings
 from functools import partial
 from types import SimpleNamespace
 
-import numpy as np
 import psutil
-from imageio import imsave
-from skimage.segmentation import mark_boundaries
-from pandas import DataFrame, concat, ExcelWriter
 from tkinter import Text, TOP, BOTH, X, LEFT, RIGHT, StringVar, END, NW, WORD
 from tkinter.ttk import Frame, Label, Entry, Button, Style, Progressbar, Radiobutton
 from tkinter import filedialog, messagebox, IntVar
 
 from .utils import setup_directories, create_d3d_input_files_v65_ang, create_d3d_input_files_v65_ctf
-from .utils import read_dream3d_file, add_scalebar, array2rgb
+from .loading import parse_axis
 from .config import Config
 
+POLL_MS = 200  # progress polling interval of the analysis tab
+
 _FONTS = SimpleNamespace(
     label=("DejaVu Sans", 14, "bold"),
     small=("DejaVu Sans", 14),
@@ -34,6 +31,7 @@ class Dream3dMicrotextureAnalysis(Frame):
         super().__init__()
         # self allow the variable to be used anywhere in the class
         self.file_paths = []
+        self.job = None  # BackgroundBatch, while running
         self.lw = 30
         self.initUI()
 
@@ -90,6 +88,23 @@ class Dream3dMicrotextureAnalysis(Frame):
         self.entry4.insert(-1, '[0,0,1]')
         # ========================================================================================================================
 
+        frame5 = Frame(self)
+        frame5.pack(fill=X)
+        lbl5 = Label(
+            frame5,
+            text="Files Analyzed in Parallel:",
+            width=self.lw,
+            anchor='e',
+            justify=RIGHT,
+            font=_FONTS.label,
+            background='#f2f2f2',
+        )
+        lbl5.pack(side=LEFT, padx=5, pady=10)
+        self.entry5 = Entry(frame5)
+        self.entry5.pack(fill=X, padx=5, expand=True)
+        self.entry5.insert(-1, str(max(1, (os.cpu_count() or 2) // 2)))
+        # ========================================================================================================================
+
         frame6 = Frame(self)
         frame6.pack(fill=X)
         self.progresstext = StringVar()
@@ -106,19 +121,27 @@ class Dream3dMicrotextureAnalysis(Frame):
         frame7.pack(fill=X)
         btn1 = Button(frame7, text='Submit Analysis', command=self.onSubmit)
         btn1.pack(in_=frame7, padx=5, pady=5)
+        self.btn_cancel = Button(frame7, text='Cancel', command=self.onCancel)
+        self.btn_cancel.pack(in_=frame7, padx=5, pady=5)
+        self.btn_cancel.state(['disabled'])
         # ========================================================================================================================
 
         frame8 = Frame(self)
         frame8.pack(fill=X)
 
+        self.idle_note = "* Files are analyzed in the background. Cancel stops after the files in progress."
         self.note = StringVar()
-        self.note.set(
-            "* The GUI may appear to freeze during this analysis, but it's usually still working in the background. Please be patient."
-        )
+        self.note.set(self.idle_note)
         label1 = Label(self, textvariable=self.note)
         label1.pack(in_=frame8, padx=5, pady=20, side=LEFT)
         # ========================================================================================================================
 
+    def onCancel(self):
+        if self.job is not None:
+            self.job.cancel.set()
+            self.btn_cancel.state(['disabled'])
+            self.note.set('Cancelling: waiting for the files in progress to finish...')
+
     def set_progressbar_value(self, value):
         self.pb['value'] = value
         self.progresstext.set("Current Progress: %d" % value + '% complete')
@@ -134,10 +157,28 @@ class Dream3dMicrotextureAnalysis(Frame):
 
     def onSubmit(self):
 
+        if self.job is not None:
+            return
         if len(self.file_paths) > 0:
             # do something
             self.min_mtr_size = int(self.entry2.get())
-            self.stress_axis_direction = self.entry4.get()
+            self.stress_axis_direction = self.entry4.get().strip()
+            try:
+                parse_axis(self.stress_axis_direction)
+            except ValueError as e:
+                messagebox.showerror(title='Invalid Stress Axis', message=str(e))
+                return
+            try:
+                self.workers = int(self.entry5.get())
+                if self.workers < 1:
+                    raise ValueError
+            except ValueError:
+                messagebox.showerror(
+                    title='Invalid Workers',
+                    message='Workers must be a whole number of at least 1, got %r'
+                    % self.entry5.get(),
+                )
+                return
             self.analyzeData()
         else:
             response = messagebox.showwarning(
@@ -149,168 +190,77 @@ class Dream3dMicrotextureAnalysis(Frame):
                 self.quit()
 
     def analyzeData(self):
-
-        warnings.simplefilter(action='ignore', category=RuntimeWarning)
-        # Write Input Files
-        if len(self.file_paths):
-
-            str_stress_axis_direction = ''.join(list(map(str, re.findall(r'\d', self.stress_axis_direction))))  # string format
-            int_stress_axis_direction = list(map(int, str_stress_axis_direction))  # self. format
-
-            min_mtr_size = self.min_mtr_size
-            d3d_paths = self.file_paths
-
-            raw_data = DataFrame()
-            scan_areas = {}
-            pct_altered = {}
-
-            # Do something
-            self.progresstext.set('Loading File...')
-            self.update_idletasks()
-
-            for n, fid in enumerate(d3d_paths):
-                if os.path.exists(fid):
-                    d3d = read_dream3d_file(fid, ref_dir=int_stress_axis_direction, mtr_size=min_mtr_size)
-
-                    # Load Raw Data and Add to Single Dataframe
-                    data = np.c_[
-                        d3d['mtr_sizes'],
-                        d3d['mtr_misorientations'],
-                        d3d['mtr_caxis_misalignments'],
-                        d3d['mtr_solidity'],
-                        d3d['mtr_intensity'],
-                        d3d['mtr_aspect_ratios'],
-                    ]
-                    new_raw_data = DataFrame(
-                        data,
-                        columns=[
-                            'MTR Area, um^2',
-                            'MTR Misorientation, deg',
-                            'MTR Caxis Misalignment, deg',
-                            'Solidity',
-                            'MTR Intensity',
-                            'MTR Aspect Ratio',
-                        ],
-                    )
-                    new_raw_data['Sample'] = d3d['fname']
-                    new_raw_data['MTR Class'] = d3d['mtr_class']
-                    raw_data = concat([raw_data, new_raw_data], axis=0)
-
-                    # Generate and Save IPF Image with Scalebar
-
-                    # Generate MTR ID Map and Save
-                    mtr_id_map = array2rgb(d3d['mtr_id_map'], cmap='nipy_spectral')
-                    mtr_id_map_w_boundaries = (
-                        mark_boundaries(mtr_id_map, d3d['mtr_id_map'], color=(1, 1, 1), mode='inner') * 255
-                    ).astype('uint8')
-                    mtr_id_map_with_scalebar = add_scalebar(
-                        d3d=None, rgb_image=mtr_id_map_w_boundaries, stepsize=d3d['stepsize'], plot=False
-                    )
-                    imsave(os.path.join(os.path.dirname(fid), 'Individual_MTRs.png'), np.array(mtr_id_map_with_scalebar))
-
-                    for ref in ['x', 'y', 'z']:
-                        ipf_with_scalebar = add_scalebar(
-                            d3d=None, rgb_image=d3d[f'ipf_cleaned_{ref.lower()}'], stepsize=d3d['stepsize'], plot=False
-                        )
-                        imsave(
-                            os.path.join(
-                                os.path.dirname(fid), 'IPF_Images', ref.upper(), f'IPF_Cleaned_{ref.upper()}_Image_w_Scalebar.png'
-                            ),
-                            ipf_with_scalebar,
-                        )
-
-                        # Generate MTR Only IPF Map and Save
-                        mtr_ipf_with_scalebar = add_scalebar(
-                            d3d=None, rgb_image=d3d[f'ipf_mtr_{ref.lower()}'], stepsize=d3d['stepsize'], plot=False
-                        )
-                        imsave(
-                            os.path.join(
-                                os.path.dirname(fid), 'IPF_Images', ref.upper(), f'IPF_MTR_{ref.upper()}_Image_w_Scalebar.png'
-                            ),
-                            mtr_ipf_with_scalebar,
-                        )
-
-                    scan_areas[d3d['fname']] = d3d['scan_area_mm2']
-                    pct_altered[d3d['fname']] = d3d['pixel_fraction_altered_by_cleanup']
-
-                    progress = int((n + 1) / len(d3d_paths) * 100)
-                    self.set_progressbar_value(progress)
-                    self.update()
-                    self.update_idletasks()
-
-            if len(raw_data):
-                # Get Groups by Scan and MTR Class
-                raw_data.replace([np.inf, -np.inf], np.nan, inplace=True)
-                raw_data.dropna(inplace=True)
-
-                grps = raw_data.groupby(['Sample', 'MTR Class'])
-
-                # Calculate Descriptive Statistics
-                stats = grps.describe()
-
-                # Calculate Area Fraction
-                stats2 = grps.agg(Total_Area_um2=('MTR Area, um^2', sum)).reset_index()
-                stats2['Area Fraction'] = stats2.apply(lambda x: x['Total_Area_um2'] / 1000**2 / scan_areas[x['Sample']], axis=1)
-
-                # Calculate Number Density
-                counts = grps.agg(Count=('MTR Area, um^2', len)).reset_index()
-                stats2['Count'] = counts['Count']
-                stats2['Number Density (Qty/mm)'] = counts.apply(lambda x: x['Count'] / scan_areas[x['Sample']], axis=1)
-
-                scan_areas = DataFrame.from_dict(scan_areas, orient='index', columns=['Scan Area, mm2'])
-                pct_altered = DataFrame.from_dict(pct_altered, orient='index', columns=['Pixel Fraction Altered By Cleanup'])
-
-                scan_areas = scan_areas.join(pct_altered)
-
-                # Save Summary Statistics to Results Folder
-                output_path = os.path.join(self.parent_dir, 'Microtexture Statistics Summary.xlsx')
-
-                writer = ExcelWriter(output_path)
-
-                # Unroll Multi-index columns and write each dataset to its own tab
-                columns = np.unique([n[0] for n in stats.columns])
-
-                for col in columns:
-                    stats = stats.rename(columns={'count': 'number_of_mtrs'})
-                    stats[col].to_excel(writer, sheet_name=col, float_format='%.4f')
-
-                stats2.to_excel(writer, sheet_name='Area Fractions', float_format='%.4f')
-                scan_areas.to_excel(writer, sheet_name='Scan Areas and Cleanup Summary', float_format='%.4f')
-                writer.close()
-
-                raw_data_output_path = os.path.join(self.parent_dir, 'Raw Data.csv')
-                raw_data = raw_data[
-                    [
-                        'Sample',
-                        'MTR Class',
-                        'MTR Area, um^2',
-                        'MTR Caxis Misalignment, deg',
-                        'MTR Misorientation, deg',
-                        'Solidity',
-                        'MTR Intensity',
-                        'MTR Aspect Ratio',
-                    ]
-                ]
-                raw_data.to_csv(raw_data_output_path)
-
-            else:
-                response = messagebox.showwarning(
-                    title='Warning',
-                    message="No MTRs identified using current settings. Hit 'Yes' to Exit. Hit 'No' remain and adjust settings.",
-                    type='yesno',
-                )
-                if response == 'yes':
-                    self.quit()
-
-            response = messagebox.showinfo(
+        """Start the analysis of all files on a background pool, see pollProgress"""
+        from .postprocess import BackgroundBatch  # analysis stack, only once needed
+
+        self.job = BackgroundBatch(
+            self.file_paths,
+            self.parent_dir,
+            workers=self.workers,
+            stress_axis=self.stress_axis_direction,  # e.g. '[0,0,1]', '0.3,0,0.95'
+            min_mtr_size=self.min_mtr_size,
+            scan_summary=False,  # only the campaign summary, in parent_dir
+        )
+        self.job.start()
+        self.btn_cancel.state(['!disabled'])
+        self.progresstext.set('Loading Files...')
+        self.after(POLL_MS, self.pollProgress)
+
+    def pollProgress(self):
+        """Update progress from the events of the background job, until it finishes"""
+        job = self.job
+        for path, stage, info in job.events():
+            name = os.path.basename(os.path.dirname(path))
+            if stage == 'failed':
+                print(f'{name}: {info}')
+            self.progresstext.set(f'{name}: {stage}')
+
+        running = sum(s not in ('queued', 'done', 'failed', 'cancelled') for s in job.stage.values())
+        done = sum(s == 'done' for s in job.stage.values())
+        if not job.finished:
+            if not job.cancel.is_set():
+                self.note.set(f'{done} of {len(job.files)} files analyzed, {running} in progress')
+            self.pb['value'] = job.progress
+            self.after(POLL_MS, self.pollProgress)
+            return
+
+        self.job = None
+        self.btn_cancel.state(['disabled'])
+        self.set_progressbar_value(0.0)
+        self.note.set(self.idle_note)
+
+        if job.cancel.is_set():
+            self.progresstext.set('Analysis cancelled.')
+            return
+        if job.error is not None:
+            self.progresstext.set('Analysis failed.')
+            messagebox.showerror(title='Microtexture Analysis Status', message=str(job.error))
+            return
+
+        self.progresstext.set('Analysis complete.')
+        if job.errors:
+            messagebox.showwarning(
                 title='Microtexture Analysis Status',
-                message="Program has completed successfully. Click 'Yes' to Exit or 'No' to remain.",
+                message=f'{len(job.errors)} of {len(job.files)} files failed:\n'
+                + '\n'.join(f'{os.path.basename(k)}: {v}' for k, v in job.errors.items()),
+            )
+        if not len(job.summary['raw_data']):
+            response = messagebox.showwarning(
+                title='Warning',
+                message="No MTRs identified using current settings. Hit 'Yes' to Exit. Hit 'No' remain and adjust settings.",
                 type='yesno',
             )
             if response == 'yes':
                 self.quit()
-            self.set_progressbar_value(0.0)
-            self.progresstext.set('Analysis complete.')
+            return
+
+        response = messagebox.showinfo(
+            title='Microtexture Analysis Status',
+            message="Program has completed successfully. Click 'Yes' to Exit or 'No' to remain.",
+            type='yesno',
+        )
+        if response == 'yes':
+            self.quit()
 
 
 class GenericPipelineBuilderUI(Frame):
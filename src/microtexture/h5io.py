@@ -0,0 +1,243 @@
+"""
+Zero-copy access to uncompressed HDF5 datasets (e.g. .dream3d files).
+
+DREAM3D writes its data arrays as contiguous, unfiltered datasets, which can be
+mapped straight from the file with np.memmap instead of being copied into new
+arrays by h5py on every slice. Anything else (chunked, compressed, external,
+variable-length...) falls back to the regular h5py.Dataset.
+
+For batches on slow (e.g. network-mounted) storage, Prefetcher reads the
+datasets needed by the analysis of the next few files into memory on a
+background thread, while the current file is being analyzed. CroppedFile
+restricts the image datasets of an open file to a region of interest.
+"""
+
+import threading
+
+import h5py
+import numpy as np
+
+
+def is_mappable(dset: h5py.Dataset) -> bool:
+    """True if dset is a single contiguous, unfiltered block at a known file offset"""
+    if dset.chunks is not None or dset.compression is not None:
+        return False
+    if dset.dtype.hasobject or dset.size == 0:
+        return False
+    if dset.file.driver != "sec2":
+        return False
+
+    dcpl = dset.id.get_create_plist()
+    if dcpl.get_layout() != h5py.h5d.CONTIGUOUS or dcpl.get_external_count() > 0:
+        return False
+
+    return dset.id.get_offset() is not None
+
+
+def memmap_dataset(dset: h5py.Dataset) -> np.memmap | None:
+    """Read-only np.memmap view of dset, or None if the dataset can't be mapped"""
+    if not is_mappable(dset):
+        return None
+    return np.memmap(
+        dset.file.filename,
+        dtype=dset.dtype,
+        mode="r",
+        offset=dset.id.get_offset(),
+        shape=dset.shape,
+    )
+
+
+class MappedFile:
+    """
+    Read-only h5py.File wrapper. Items are returned as np.memmap views where
+    possible, otherwise as h5py.Dataset / h5py.Group (set mmap=False to always
+    get the latter). Both can be sliced the same way, e.g. f["path"][0, :, :, 0]
+    """
+
+    def __init__(self, path: str, mmap: bool = True):
+        self.file = h5py.File(path, "r")
+        self.mmap = mmap
+
+    def __getitem__(self, key: str):
+        obj = self.file[key]
+        if self.mmap and isinstance(obj, h5py.Dataset):
+            view = memmap_dataset(obj)
+            if view is not None:
+                return view
+        return obj
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.file
+
+    def close(self):
+        """Close the HDF5 handle; memmap views remain valid"""
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PreloadedFile:
+    """
+    Datasets read into memory, with the same item access as MappedFile.
+    Only the preloaded datasets are available (KeyError for anything else).
+    """
+
+    def __init__(self, path: str, arrays: dict):
+        self.filename = path
+        self.arrays = arrays  # dataset path (no leading "/"): np.ndarray
+
+    @classmethod
+    def read(cls, path: str, datasets) -> "PreloadedFile":
+        """Read datasets (those present in the file) from path"""
+        arrays = {}
+        with h5py.File(path, "r") as f:
+            for key in datasets:
+                obj = f.get(key)
+                if isinstance(obj, h5py.Dataset):
+                    arrays[key.lstrip("/")] = obj[()]
+        return cls(path, arrays)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in self.arrays.values())
+
+    def __getitem__(self, key: str):
+        return self.arrays[key.lstrip("/")]
+
+    def __contains__(self, key: str) -> bool:
+        return key.lstrip("/") in self.arrays
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CroppedFile:
+    """
+    Item access of an open file (MappedFile, PreloadedFile...) with the
+    datasets under prefix, of shape (z, y, x[, ...]), cropped to rows and cols:
+    h5py datasets are read as hyperslabs, memmap views stay views (of which
+    only the pages in the region are read).
+    """
+
+    def __init__(self, data, prefix: str, rows: slice, cols: slice):
+        self.data = data
+        self.prefix = prefix.strip("/") + "/"
+        self.rows, self.cols = rows, cols
+
+    def __getitem__(self, key: str):
+        obj = self.data[key]
+        if key.lstrip("/").startswith(self.prefix):
+            return obj[:, self.rows, self.cols]
+        return obj
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.data
+
+    def close(self):
+        self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def datasets_nbytes(path: str, datasets) -> int:
+    """Size in memory of datasets (those present in the file), from the metadata"""
+    with h5py.File(path, "r") as f:
+        return sum(
+            obj.size * obj.dtype.itemsize
+            for obj in map(f.get, datasets)
+            if isinstance(obj, h5py.Dataset)
+        )
+
+
+class Prefetcher:
+    """
+    Iterate over (path, PreloadedFile) in order, reading datasets of up to
+    depth files ahead on a background thread. Files held in memory, including
+    the one last yielded (until the next is requested), take at most max_bytes
+    (None: no limit), except that a file larger than max_bytes is still read
+    once nothing else is held.
+    Files that can't be read are yielded as (path, None), for the caller to
+    open (and report errors) the usual way.
+    """
+
+    def __init__(self, paths, datasets, depth: int = 2, max_bytes: int = None):
+        if depth < 1:
+            raise ValueError(f"depth must be at least 1, got {depth}")
+        self.paths = list(paths)
+        self.datasets = tuple(datasets)
+        self.depth = depth
+        self.max_bytes = max_bytes
+
+        self._ready = {}  # path index: PreloadedFile or None
+        self._held = {}  # path index: bytes, of ready and yielded files
+        self._stop = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._reader, name="prefetch", daemon=True)
+
+    def __iter__(self):
+        self._thread.start()
+        try:
+            for i, path in enumerate(self.paths):
+                with self._cond:
+                    self._held.pop(i - 1, None)  # previous file is done with
+                    self._cond.notify_all()
+                    while i not in self._ready:
+                        self._cond.wait()
+                    data = self._ready.pop(i)
+                yield path, data
+        finally:
+            self.close()
+
+    def close(self):
+        """Stop reading ahead"""
+        with self._cond:
+            self._stop = True
+            self._ready.clear()
+            self._held.clear()
+            self._cond.notify_all()
+
+    def _fits(self, nbytes: int) -> bool:
+        if len(self._held) >= self.depth + 1:  # + 1: the file being analyzed
+            return False
+        if not self._held or self.max_bytes is None:
+            return True
+        return sum(self._held.values()) + nbytes <= self.max_bytes
+
+    def _reader(self):
+        for i, path in enumerate(self.paths):
+            try:
+                nbytes = datasets_nbytes(path, self.datasets)
+            except Exception:
+                nbytes = 0
+
+            with self._cond:
+                while not self._stop and not self._fits(nbytes):
+                    self._cond.wait()
+                if self._stop:
+                    return
+                self._held[i] = nbytes
+
+            try:
+                data = PreloadedFile.read(path, self.datasets)
+            except Exception:
+                data = None
+
+            with self._cond:
+                if self._stop:
+                    return
+                self._ready[i] = data
+                self._cond.notify_all()
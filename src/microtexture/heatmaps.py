@@ -0,0 +1,76 @@
+"""
+Spatial heatmaps of MTR classes and intensity, from summed-area tables.
+
+The summed-area table (integral image) of a map gives the sum over any
+rectangular window from 4 lookups, so windowed area fractions and means cost
+O(pixels) whatever the window size, and the tables are computed once for all
+window sizes. Windows are centered on each pixel and clipped at the edges of
+the map; fractions and means are taken over the sample (mask) pixels of each
+window, NaN where there are none.
+"""
+
+import numpy as np
+
+
+def summed_area_table(values, dtype=None) -> np.ndarray:
+    """
+    Integral image (..., H + 1, W + 1) of values (..., H, W), with
+    sat[..., i, j] = values[..., :i, :j].sum() (so the first row / column is 0)
+    """
+    values = np.asarray(values)
+    if dtype is None:
+        dtype = np.int64 if values.dtype.kind in "biu" else np.float64
+    sat = np.zeros(values.shape[:-2] + (values.shape[-2] + 1, values.shape[-1] + 1), dtype)
+    np.cumsum(values, axis=-2, dtype=dtype, out=sat[..., 1:, 1:])
+    np.cumsum(sat[..., 1:, 1:], axis=-1, out=sat[..., 1:, 1:])
+    return sat
+
+
+def window_sums(sat: np.ndarray, size: int) -> np.ndarray:
+    """
+    Sums (..., H, W) over the size x size windows centered on every pixel
+    (clipped at the edges), from a summed-area table (..., H + 1, W + 1)
+    """
+    H, W = sat.shape[-2] - 1, sat.shape[-1] - 1
+    half = size // 2
+    # Repeating the first and last rows / columns of the table clips the
+    # windows, so the 4 lookups of every pixel are plain shifted slices
+    pad = [(0, 0)] * (sat.ndim - 2) + [(half, size - half)] * 2
+    sat = np.pad(sat, pad, mode="edge")
+    rows = sat[..., size : size + H, :] - sat[..., :H, :]  # sums over the window rows
+    return rows[..., size : size + W] - rows[..., :W]
+
+
+def class_fractions(class_map, n_classes: int, mask, sizes) -> dict[int, np.ndarray]:
+    """
+    {size: float32 (n_classes, H, W)} area fraction of every class code in
+    the windows of each size (pixels), for a map of class codes (-1: none)
+    """
+    mask = np.asarray(mask, dtype=bool)
+    codes = np.arange(n_classes)[:, None, None]
+    classes = summed_area_table((class_map == codes) & mask)
+    valid = summed_area_table(mask)
+    fractions = {}
+    for size in sizes:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            fractions[size] = (window_sums(classes, size) / window_sums(valid, size)).astype(
+                np.float32
+            )
+    return fractions
+
+
+def window_means(values, mask, sizes) -> dict[int, np.ndarray]:
+    """
+    {size: float32 (H, W)} mean of values over the sample pixels of the windows
+    of each size (pixels), NaN values counting as 0 (e.g. intensity outside MTRs)
+    """
+    mask = np.asarray(mask, dtype=bool)
+    totals = summed_area_table(np.where(mask, np.nan_to_num(values), 0))
+    valid = summed_area_table(mask)
+    means = {}
+    for size in sizes:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means[size] = (window_sums(totals, size) / window_sums(valid, size)).astype(
+                np.float32
+            )
+    return means
@@ -0,0 +1,46 @@
+"""
+Inverse pole figure (IPF) colors of hexagonal (Ti-alpha, 6/mmm) orientations.
+
+Same coloring as DREAM3D's "Generate IPF Colors" filter: the sample direction
+is expressed in the crystal frame, brought into the standard stereographic
+triangle (0001) - [2-1-10] - [10-10], and colored red at (0001), green at
+[2-1-10] and blue at [10-10]. Whole Euler angle maps (EulerAngles,
+AvgEulerAngles) are colored at once, for any sample direction, so the maps
+don't need to be generated and stored by the pipeline.
+"""
+
+import numpy as np
+
+from .orientation import crystal_directions
+
+# Standard triangle: polar angle chi in [0, 90], azimuth eta in [0, 30] deg
+CHI_MAX = np.pi / 2
+ETA_MAX = np.pi / 6
+
+
+def hexagonal_ipf_colors(eulers, direction, mask=None) -> np.ndarray:
+    """
+    uint8 RGB IPF colors (..., 3) of the sample direction (3,) for Bunge Euler
+    angles (..., 3), in radians. Pixels outside mask (...), if given, are black.
+    """
+    p = crystal_directions(eulers, direction, dtype=np.float64)
+    x, y, z = np.moveaxis(p, -1, 0)
+
+    # Inversion (Laue group): bring p to the upper hemisphere
+    flip = z < 0
+    x, y, z = np.where(flip, -x, x), np.where(flip, -y, y), np.abs(z)
+
+    # 6-fold axis and mirrors: azimuth modulo 60 deg, folded into [0, 30]
+    eta = np.arctan2(y, x) % (2 * ETA_MAX)
+    eta = np.minimum(eta, 2 * ETA_MAX - eta) / ETA_MAX
+    chi = np.arccos(np.clip(z, -1.0, 1.0)) / CHI_MAX
+
+    rgb = np.stack([1 - chi, (1 - eta) * chi, eta * chi], axis=-1)
+    np.sqrt(rgb, out=rgb)
+    rgb /= rgb.max(axis=-1, keepdims=True)
+    rgb *= 255
+    colors = rgb.astype(np.uint8)
+
+    if mask is not None:
+        colors[~np.broadcast_to(np.asarray(mask, dtype=bool), colors.shape[:-1])] = 0
+    return colors
@@ -0,0 +1,87 @@
+"""
+Per-pixel operations on label maps (e.g. MTRIds) through lookup tables.
+
+Per-feature values (an MTR flag, class code, intensity, new label...) go into a
+lookup table indexed by feature ID, and the per-pixel map is a single gather,
+lut[labels], instead of np.isin (which sorts and searches for every pixel) or a
+loop over features. Label maps are rendered the same way, through a palette
+of colors indexed by label.
+"""
+
+import numpy as np
+
+
+class LabelLUT:
+    """
+    Lookup tables over the feature IDs of a label map (non-negative integers).
+    Features without a value in a table get its fill value.
+    """
+
+    def __init__(self, labels: np.ndarray):
+        self.labels = np.asarray(labels)
+        self.size = int(self.labels.max(initial=0)) + 1
+
+    def table(self, ids, values, fill=0, dtype=None) -> np.ndarray:
+        """LUT with lut[ids] = values, fill for every other feature ID"""
+        values = np.asarray(values)
+        dtype = dtype or np.result_type(values, np.min_scalar_type(fill))
+        ids = np.asarray(ids)
+        lut = np.full(max(self.size, int(ids.max(initial=0)) + 1), fill, dtype=dtype)
+        lut[ids] = values
+        return lut
+
+    def map(self, ids, values, fill=0, dtype=None) -> np.ndarray:
+        """Per-pixel map of the values of features ids, fill elsewhere"""
+        return np.take(self.table(ids, values, fill, dtype), self.labels)
+
+    def mask(self, ids) -> np.ndarray:
+        """Pixels belonging to features ids (np.isin(labels, ids))"""
+        return self.map(ids, True, fill=False, dtype=bool)
+
+    def keep(self, ids) -> np.ndarray:
+        """Label map with features other than ids set to 0"""
+        ids = np.asarray(ids)
+        return self.map(ids, ids, dtype=self.labels.dtype)
+
+    def relabel(self, ids) -> np.ndarray:
+        """Label map with features ids renumbered 1, 2..., in order, 0 elsewhere"""
+        ids = np.asarray(ids)
+        return self.map(ids, np.arange(1, len(ids) + 1), dtype=np.int32)
+
+
+def masked_image(image: np.ndarray, mask: np.ndarray, fill=0) -> np.ndarray:
+    """Copy of image (H x W [x C]) with pixels outside of mask (H x W) set to fill"""
+    if image.ndim > mask.ndim:
+        mask = mask[..., None]
+    return np.where(mask, image, np.asarray(fill, dtype=image.dtype))
+
+
+def find_boundaries(labels: np.ndarray, background=0) -> np.ndarray:
+    """
+    Pixels of (non-background) labels with a 4-connected neighbor of another
+    label, as skimage.segmentation.find_boundaries(labels, mode="inner"),
+    from comparisons of the integer labels with their shifted neighbors
+    """
+    edges = np.zeros(labels.shape, dtype=bool)
+    differ = labels[:, 1:] != labels[:, :-1]  # left / right neighbors
+    edges[:, 1:] |= differ
+    edges[:, :-1] |= differ
+    differ = labels[1:] != labels[:-1]  # top / bottom neighbors
+    edges[1:] |= differ
+    edges[:-1] |= differ
+    edges &= labels != background
+    return edges
+
+
+def render_labels(
+    labels: np.ndarray, palette: np.ndarray, boundary_color=None, out=None
+) -> np.ndarray:
+    """
+    uint8 RGB image of a label map, palette[label] for every pixel (palette:
+    uint8 (max label + 1) x 3), with boundary_color on the label boundaries
+    (see find_boundaries) if given. out: H x W x 3 uint8 buffer to write to.
+    """
+    out = np.take(palette, labels, axis=0, out=out)
+    if boundary_color is not None:
+        out[find_boundaries(labels)] = boundary_color
+    return out
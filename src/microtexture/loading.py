@@ -0,0 +1,169 @@
+"""
+Search of the loading direction that maximizes the area fraction of an MTR
+class (by default "Initiator" MTRs, 40-60 deg c-axis misalignment).
+
+Candidate directions are the pixels of an equal-area (Lambert) projection of
+the upper hemisphere (a direction and its opposite give the same
+misalignments), so that the result is also a directional map. The
+misalignments of every MTR to a block of directions come from a single matrix
+product of the directions with the MTR c-axes (AvgCAxes), they are classified
+at once, and the area fractions of each class are a matrix product of the
+class indicators with the MTR areas.
+
+Stress axes are given as principal axes ("100", "010", "001"), components
+("0.3,0,0.95") or the Bunge Euler angles (deg) of a rotated coupon loaded
+along its z axis ("euler:90,30,0"), see parse_axis.
+"""
+
+import re
+from dataclasses import dataclass
+
+import numpy as np
+
+from .classify import ClassScheme
+from .orientation import euler_to_matrix
+
+DEFAULT_GRID_SIZE = 101  # ~8000 directions, ~1.3 deg apart
+BLOCK = 1024  # directions per matrix product, bounds the (block, n MTRs) arrays
+
+
+def parse_axis(value) -> np.ndarray:
+    """
+    Unit loading direction (3,) in the sample frame, from a stress axis string
+    (see above) or 3 numbers. Raises ValueError for anything else.
+    """
+    axis = value
+    if isinstance(value, str):
+        text = value.strip().lower()
+        euler = text.startswith("euler:")
+        text = text.removeprefix("euler:").strip("[]() ")
+        parts = list(text) if re.fullmatch(r"\d{3}", text) else re.split(r"[,\s]+", text)
+        try:
+            axis = [float(x) for x in parts]
+        except ValueError:
+            axis = []
+        if euler and len(axis) == 3:
+            # z axis of the coupon in the sample frame: third row of g
+            axis = euler_to_matrix(np.radians(axis), dtype=np.float64)[2]
+
+    axis = np.asarray(axis, dtype=np.float64)
+    norm = np.linalg.norm(axis) if axis.shape == (3,) else 0.0
+    if not (np.isfinite(norm) and norm > 0):
+        raise ValueError(
+            f"Invalid stress axis {value!r}, expected e.g. '001', '0.3,0,0.95' "
+            "or 'euler:phi1,Phi,phi2' (deg)"
+        )
+    return axis / norm
+
+
+def parse_axes(values) -> np.ndarray:
+    """Unit loading directions (k, 3) of a stress axis, or of a list of them"""
+    if isinstance(values, str) or np.size(values) == 0:
+        values = [values]  # ValueError from parse_axis if empty
+    elif np.ndim(values) == 1 and not isinstance(values[0], str):
+        values = [values]
+    return np.array([parse_axis(v) for v in values]).reshape(-1, 3)
+
+
+def axis_argument(value: str) -> str:
+    """argparse type of stress axis options: validated, kept as given"""
+    parse_axis(value)
+    return value
+
+
+def hemisphere_grid(size: int = DEFAULT_GRID_SIZE) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Unit directions (size, size, 3) of the pixels of an equal-area projection
+    of the upper hemisphere (x to the right, y up, z at the center), and the
+    mask of the pixels inside the projection disk
+    """
+    u = np.linspace(-1, 1, size)
+    X, Y = np.meshgrid(u, -u)  # row 0 at the top: y = 1
+    r2 = X**2 + Y**2
+    inside = r2 <= 1
+    # Inverse Lambert azimuthal projection, hemisphere onto the unit disk
+    scale = np.sqrt(np.clip(2 - r2, 0, None))
+    directions = np.stack([X * scale, Y * scale, 1 - r2], axis=-1)
+    directions[~inside] = 0
+    return directions, inside
+
+
+def misalignments(directions, caxes) -> np.ndarray:
+    """
+    c-axis misalignment angles (deg, in [0, 90]) of every c-axis (n, 3) to
+    every direction (k, 3), as a (k, n) float32 array
+    """
+    directions = np.asarray(directions, dtype=np.float32)
+    caxes = np.asarray(caxes, dtype=np.float32)
+    cos = directions @ caxes.T
+    norms = np.linalg.norm(directions, axis=1)[:, None] * np.linalg.norm(caxes, axis=1)
+    np.abs(cos, out=cos)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cos /= norms
+    np.minimum(cos, 1, out=cos)
+    return np.degrees(np.arccos(cos, out=cos), out=cos)
+
+
+def class_area_fractions(
+    directions, caxes, areas, total_area: float, mtr_classes: ClassScheme = None
+) -> np.ndarray:
+    """
+    Area fraction (k, n labels) of each MTR class for the loading directions
+    (k, 3), given the MTR c-axes (n, 3), their areas (n,) and the scan area
+    """
+    if mtr_classes is None:
+        mtr_classes = ClassScheme()
+    directions = np.reshape(directions, (-1, 3))
+    areas = np.asarray(areas, dtype=np.float64) / total_area
+    fractions = np.zeros((len(directions), len(mtr_classes.labels)))
+    for start in range(0, len(directions), BLOCK):
+        block = slice(start, start + BLOCK)
+        codes = mtr_classes.classify(misalignments(directions[block], caxes))
+        for code in range(fractions.shape[1]):
+            fractions[block, code] = (codes == code) @ areas
+    return fractions
+
+
+@dataclass(frozen=True)
+class DirectionSearch:
+    label: str  # MTR class whose area fraction is maximized
+    direction: np.ndarray  # (3,) worst-case loading direction (unit, z >= 0)
+    fraction: float  # its area fraction of label
+    directions: np.ndarray  # (k, 3) candidate directions
+    fractions: np.ndarray  # (k, n labels) area fraction of each class
+    fraction_map: np.ndarray  # (size, size) area fraction of label, NaN outside
+
+
+def worst_case_direction(
+    caxes,
+    areas,
+    total_area: float,
+    mtr_classes: ClassScheme = None,
+    label: str = "Initiator",
+    size: int = DEFAULT_GRID_SIZE,
+) -> DirectionSearch:
+    """
+    Loading direction maximizing the area fraction of MTR class label, over
+    the directions of hemisphere_grid(size)
+    """
+    if mtr_classes is None:
+        mtr_classes = ClassScheme()
+    if label not in mtr_classes.labels:
+        raise ValueError(f"Unknown MTR class {label!r}, use one of {mtr_classes.labels}")
+
+    grid, inside = hemisphere_grid(size)
+    directions = grid[inside]
+    fractions = class_area_fractions(directions, caxes, areas, total_area, mtr_classes)
+    column = fractions[:, mtr_classes.labels.index(label)]
+    best = int(np.argmax(column))
+
+    fraction_map = np.full(inside.shape, np.nan)
+    fraction_map[inside] = column
+    return DirectionSearch(
+        label=label,
+        direction=directions[best],
+        fraction=float(column[best]),
+        directions=directions,
+        fractions=fractions,
+        fraction_map=fraction_map,
+    )
@@ -0,0 +1,106 @@
+"""
+Feature neighbor graph and MTR adjacency / clustering queries.
+
+DREAM3D's flat NeighborList2 / SharedSurfaceAreaList2 arrays (see
+features.FeatureTable) are turned into a symmetric sparse matrix indexed by
+feature ID, whose values are shared boundary lengths (um, for 2D scans).
+Class-based queries take an array of class codes per feature ID, with -1 for
+features to ignore (e.g. grains below the MTR size threshold).
+"""
+
+import numpy as np
+from pandas import DataFrame
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+
+from .features import FeatureTable
+
+
+class NeighborGraph:
+
+    def __init__(self, matrix: csr_matrix):
+        self.matrix = matrix.tocsr()
+        coo = self.matrix.tocoo()
+        self._row, self._col, self._length = coo.row, coo.col, coo.data
+
+    @classmethod
+    def from_table(cls, table: FeatureTable, size: int = None) -> "NeighborGraph":
+        """Graph over feature IDs 0 .. size - 1 (default: largest ID + 1)"""
+        if size is None:
+            size = int(max(table.ids.max(initial=0), table.neighbor_ids.max(initial=0))) + 1
+        rows = np.repeat(table.ids, np.diff(table.neighbor_offsets))
+        matrix = csr_matrix(
+            (table.shared_surfaces, (rows, table.neighbor_ids)), shape=(size, size)
+        )
+        return cls(matrix)
+
+    @property
+    def size(self) -> int:
+        return self.matrix.shape[0]
+
+    def class_codes(self, table: FeatureTable) -> np.ndarray:
+        """Class codes of table (e.g. the MTR subset) spread over all feature IDs"""
+        codes = np.full(self.size, -1, dtype=np.int8)
+        codes[table.ids] = table.class_codes
+        return codes
+
+    def _edges(self, codes):
+        """Undirected edges (i < j) between classified features"""
+        i, j = self._row, self._col
+        keep = (i < j) & (codes[i] >= 0) & (codes[j] >= 0)
+        return codes[i[keep]], codes[j[keep]], self._length[keep]
+
+    def class_pairs(self, codes: np.ndarray, labels) -> DataFrame:
+        """Number of boundaries and total shared length for each (unordered) class pair"""
+        k = len(labels)
+        ci, cj, length = self._edges(codes)
+        pair = np.minimum(ci, cj).astype(int) * k + np.maximum(ci, cj)
+        a, b = np.divmod(np.arange(k * k), k)
+        upper = a <= b
+        labels = np.array(list(labels), dtype=object)
+        return DataFrame(
+            {
+                "MTR Class A": labels[a[upper]],
+                "MTR Class B": labels[b[upper]],
+                "Boundaries": np.bincount(pair, minlength=k * k)[upper],
+                "Shared Length, um": np.bincount(pair, weights=length, minlength=k * k)[
+                    upper
+                ],
+            }
+        )
+
+    def degree(self, codes: np.ndarray) -> np.ndarray:
+        """Number of classified neighbors of every feature ID"""
+        i, j = self._row, self._col
+        return np.bincount(i[codes[j] >= 0], minlength=self.size)
+
+    def shared_length(self, codes: np.ndarray, a: int, b: int) -> np.ndarray:
+        """
+        Boundary length of every feature of class a with features of class b,
+        and vice versa (zero for any other feature)
+        """
+        i, j = self._row, self._col
+        keep = ((codes[i] == a) & (codes[j] == b)) | ((codes[i] == b) & (codes[j] == a))
+        return np.bincount(i[keep], weights=self._length[keep], minlength=self.size)
+
+    def clusters(self, codes: np.ndarray) -> np.ndarray:
+        """
+        Label connected clusters of adjacent features that share the same class.
+        Returns a cluster number per feature ID, -1 for unclassified features.
+        """
+        i, j = self._row, self._col
+        keep = (codes[i] == codes[j]) & (codes[i] >= 0)
+        same = csr_matrix(
+            (np.ones(keep.sum(), dtype=np.int8), (i[keep], j[keep])),
+            shape=self.matrix.shape,
+        )
+        _, labels = connected_components(same, directed=False)
+        _, labels = np.unique(np.where(codes >= 0, labels, -1), return_inverse=True)
+        return labels - int((codes < 0).any())
+
+    def cluster_areas(self, codes: np.ndarray, areas: np.ndarray) -> np.ndarray:
+        """Total area of the same-class cluster containing each feature ID (0 if unclassified)"""
+        labels = self.clusters(codes)
+        valid = labels >= 0
+        totals = np.bincount(labels[valid], weights=areas[valid])
+        return np.where(valid, totals[np.maximum(labels, 0)], 0)
@@ -0,0 +1,203 @@
+"""
+Vectorized orientation math on maps of Bunge Euler angles (phi1, Phi, phi2).
+
+Conventions are DREAM3D's (and EDAX / Oxford's): angles in radians, and the
+orientation matrix g (passive, sample -> crystal frame) is
+
+    g = Rz(phi2) Rx(Phi) Rz(phi1)
+
+so that a sample direction v has crystal coordinates g @ v. Quaternions are
+unit (w, x, y, z), scalar first, with w >= 0, and the rotation convention of
+DREAM3D (EbsdLib), i.e. quaternion_to_matrix(euler_to_quaternion(e)) equals
+euler_to_matrix(e). Note that DREAM3D stores its "Quats" arrays vector first.
+
+Functions take arrays of any shape (..., 3) or (..., 4), e.g. whole maps, and
+keep their float dtype (float32 maps stay float32, unless a dtype is given).
+Those with an out argument write their result to it, which may be the input
+array itself when the shapes agree (e.g. c_axes on an EulerAngles map).
+"""
+
+import numpy as np
+
+# Proper rotations of the hexagonal point group 622 (Ti-alpha): 6-fold about
+# c (0001), and 2-fold about the six <2-1-10> / <10-10> axes in the basal plane
+_ANGLES = np.arange(6) * np.pi / 6
+HEXAGONAL_SYMMETRY = np.concatenate(
+    [
+        np.stack([np.cos(_ANGLES), 0 * _ANGLES, 0 * _ANGLES, np.sin(_ANGLES)], axis=-1),
+        np.stack([0 * _ANGLES, np.cos(_ANGLES), np.sin(_ANGLES), 0 * _ANGLES], axis=-1),
+    ]
+)
+
+
+def _float_dtype(array, dtype=None):
+    if dtype is not None:
+        return np.dtype(dtype)
+    return np.result_type(np.asarray(array).dtype, np.float32)
+
+
+def euler_to_matrix(eulers, dtype=None) -> np.ndarray:
+    """Orientation matrices g (..., 3, 3) of Bunge Euler angles (..., 3)"""
+    eulers = np.asarray(eulers, dtype=_float_dtype(eulers, dtype))
+    c1, c, c2 = np.moveaxis(np.cos(eulers), -1, 0)
+    s1, s, s2 = np.moveaxis(np.sin(eulers), -1, 0)
+    g = np.empty(eulers.shape[:-1] + (3, 3), dtype=eulers.dtype)
+    g[..., 0, 0] = c1 * c2 - s1 * s2 * c
+    g[..., 0, 1] = s1 * c2 + c1 * s2 * c
+    g[..., 0, 2] = s2 * s
+    g[..., 1, 0] = -c1 * s2 - s1 * c2 * c
+    g[..., 1, 1] = -s1 * s2 + c1 * c2 * c
+    g[..., 1, 2] = c2 * s
+    g[..., 2, 0] = s1 * s
+    g[..., 2, 1] = -c1 * s
+    g[..., 2, 2] = c
+    return g
+
+
+def crystal_directions(eulers, direction, dtype=None) -> np.ndarray:
+    """
+    Unit vectors (..., 3): the sample direction (3,) in the crystal frame of
+    each orientation, g @ direction. Applied as the three rotations of g in
+    turn, without building the matrices.
+    """
+    eulers = np.asarray(eulers, dtype=_float_dtype(eulers, dtype))
+    v = np.asarray(direction, dtype=float)
+    norm = np.linalg.norm(v)
+    if v.shape != (3,) or not norm > 0:
+        raise ValueError(f"Invalid direction {direction!r}, expected 3 components")
+    x, y, z = (v / norm).astype(eulers.dtype)
+
+    phi1, Phi, phi2 = np.moveaxis(eulers, -1, 0)
+    c, s = np.cos(phi1), np.sin(phi1)  # Rz(phi1)
+    x, y = c * x + s * y, c * y - s * x
+    c, s = np.cos(Phi), np.sin(Phi)  # Rx(Phi)
+    y, z = c * y + s * z, c * z - s * y
+    c, s = np.cos(phi2), np.sin(phi2)  # Rz(phi2)
+    x, y = c * x + s * y, c * y - s * x
+    return np.stack(np.broadcast_arrays(x, y, z), axis=-1)
+
+
+def euler_to_quaternion(eulers, out=None, dtype=None) -> np.ndarray:
+    """Unit quaternions (..., 4) of Bunge Euler angles (..., 3)"""
+    eulers = np.asarray(eulers, dtype=_float_dtype(eulers, dtype))
+    if out is None:
+        out = np.empty(eulers.shape[:-1] + (4,), dtype=eulers.dtype)
+    phi1, Phi, phi2 = np.moveaxis(eulers, -1, 0)
+    half_sum = (phi1 + phi2) / 2
+    half_diff = (phi1 - phi2) / 2
+    c, s = np.cos(Phi / 2), np.sin(Phi / 2)
+    w, x, y, z = np.moveaxis(out, -1, 0)
+    np.cos(half_sum, out=w)
+    w *= c
+    np.cos(half_diff, out=x)
+    x *= -s
+    np.sin(half_diff, out=y)
+    y *= -s
+    np.sin(half_sum, out=z)
+    z *= -c
+    np.negative(out, out=out, where=w[..., None] < 0)
+    return out
+
+
+def quaternion_to_matrix(quats) -> np.ndarray:
+    """Orientation matrices g (..., 3, 3) of unit quaternions (..., 4)"""
+    quats = np.asarray(quats)
+    w, x, y, z = np.moveaxis(quats, -1, 0)
+    qq = w * w - (x * x + y * y + z * z)
+    g = np.empty(quats.shape[:-1] + (3, 3), dtype=np.result_type(quats, np.float32))
+    g[..., 0, 0] = qq + 2 * x * x
+    g[..., 0, 1] = 2 * (x * y - w * z)
+    g[..., 0, 2] = 2 * (x * z + w * y)
+    g[..., 1, 0] = 2 * (y * x + w * z)
+    g[..., 1, 1] = qq + 2 * y * y
+    g[..., 1, 2] = 2 * (y * z - w * x)
+    g[..., 2, 0] = 2 * (z * x - w * y)
+    g[..., 2, 1] = 2 * (z * y + w * x)
+    g[..., 2, 2] = qq + 2 * z * z
+    return g
+
+
+def quaternion_multiply(p, q) -> np.ndarray:
+    """Products p q (..., 4), such that the matrix of p q is g(p) @ g(q)"""
+    p, q = np.asarray(p), np.asarray(q)
+    p0, p1, p2, p3 = np.moveaxis(p, -1, 0)
+    q0, q1, q2, q3 = np.moveaxis(q, -1, 0)
+    return np.stack(
+        [
+            p0 * q0 - p1 * q1 - p2 * q2 - p3 * q3,
+            p0 * q1 + p1 * q0 + p2 * q3 - p3 * q2,
+            p0 * q2 + p2 * q0 + p3 * q1 - p1 * q3,
+            p0 * q3 + p3 * q0 + p1 * q2 - p2 * q1,
+        ],
+        axis=-1,
+    )
+
+
+def c_axes(eulers, out=None, dtype=None) -> np.ndarray:
+    """
+    Unit c-axes (0001) (..., 3) of Bunge Euler angles (..., 3) in the sample
+    frame, flipped into the upper hemisphere (z >= 0) as DREAM3D's
+    Raw_CAxes / AvgCAxes. With out=eulers, the map is converted in place.
+    """
+    if out is None:
+        eulers = np.asarray(eulers, dtype=_float_dtype(eulers, dtype))
+        out = np.empty_like(eulers)
+    phi1, Phi = eulers[..., 0], eulers[..., 1]
+    x, y, z = np.moveaxis(out, -1, 0)
+    # c = g.T @ (0, 0, 1) = (sin(phi1) sin(Phi), -cos(phi1) sin(Phi), cos(Phi)),
+    # in an order that reads each angle before out overwrites it
+    sin_Phi = np.sin(Phi)
+    np.cos(Phi, out=z)
+    np.cos(phi1, out=y)
+    np.sin(phi1, out=x)
+    y *= sin_Phi
+    np.negative(y, out=y)
+    x *= sin_Phi
+    np.negative(out, out=out, where=z[..., None] < 0)
+    return out
+
+
+def caxis_misorientation(a, b, out=None) -> np.ndarray:
+    """
+    Angles (deg, in [0, 90]) between c-axes a and b (..., 3), broadcast
+    against each other. The c-axis is a line: a and -a are the same axis.
+    """
+    a, b = np.asarray(a), np.asarray(b)
+    dtype = np.result_type(a, b, np.float32)
+    cos = np.einsum("...i,...i->...", a, b, dtype=dtype)
+    cos /= np.linalg.norm(a, axis=-1) * np.linalg.norm(b, axis=-1)
+    np.abs(cos, out=cos)
+    np.minimum(cos, 1, out=cos)
+    out = np.arccos(cos, out=out)
+    return np.degrees(out, out=out)
+
+
+def misorientation_angles(q1, q2, symmetry=HEXAGONAL_SYMMETRY) -> np.ndarray:
+    """
+    Misorientation angles (deg, ...) between quaternions q1 and q2 (..., 4):
+    the smallest rotation between them over the symmetry operators (k, 4)
+    """
+    q1, q2 = np.asarray(q1), np.asarray(q2)
+    inverse = q1 * np.array([1, -1, -1, -1], dtype=q1.dtype)
+    delta = quaternion_multiply(q2, inverse)
+    # w of delta S_k for every operator, by a single matrix product
+    w = np.abs(delta @ symmetry.astype(delta.dtype).T).max(axis=-1)
+    np.minimum(w, 1, out=w)
+    return np.degrees(2 * np.arccos(w))
+
+
+def feature_caxis_misorientations(labels, caxes, feature_caxes) -> np.ndarray:
+    """
+    Mean angle (deg) between the c-axes of the pixels of each feature and the
+    feature's c-axis (as DREAM3D's FeatureAvgCAxisMisorientations), indexed by
+    feature ID. labels: feature IDs (...), caxes: pixel c-axes (..., 3),
+    feature_caxes: (n features + 1, 3). NaN for features without pixels.
+    """
+    labels = np.asarray(labels).ravel()
+    n = len(feature_caxes)
+    with np.errstate(invalid="ignore", divide="ignore"):  # e.g. background c-axis 0
+        angles = caxis_misorientation(
+            np.reshape(caxes, (-1, 3)), np.asarray(feature_caxes)[labels]
+        )
+        counts = np.bincount(labels, minlength=n)
+        return np.bincount(labels, weights=angles, minlength=n) / counts
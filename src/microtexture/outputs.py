@@ -0,0 +1,100 @@
+"""
+Background writing of output files (images, tables, workbooks).
+
+The analysis submits finished arrays / tables to an OutputSink and moves on to
+its next stage, while writer threads encode them (PNG compression, CSV / XLSX
+formatting, which mostly release the GIL or wait on disk) and write them.
+Each file is written to a temporary name next to its destination and renamed
+into place once complete, so that a file either doesn't exist yet or is whole,
+even if the analysis is interrupted. flush() is the barrier at the end of a
+scan: it waits for every pending file, and raises the first write error.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from imageio import imsave
+
+
+class OutputError(RuntimeError):
+    """Some of the output files could not be written"""
+
+
+def temp_path(path: str) -> str:
+    """Hidden temporary name in the same directory, keeping the file extension"""
+    directory, name = os.path.split(path)
+    root, ext = os.path.splitext(name)
+    return os.path.join(directory, f".{root}.{os.getpid()}.tmp{ext}")
+
+
+def write_atomic(path: str, write, *args, **kwargs):
+    """write(temp path, *args, **kwargs), then rename the result to path"""
+    tmp = temp_path(path)
+    try:
+        write(tmp, *args, **kwargs)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+class OutputSink:
+    """
+    Write files on worker threads, with at most max_pending files submitted
+    but not written (submit blocks beyond that, bounding the memory held by
+    pending arrays). Submitted data must not be modified afterwards.
+    Use as a context manager, which flushes on exit.
+    """
+
+    def __init__(self, workers: int = 2, max_pending: int = 8):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="writer")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._futures = {}  # future: path
+
+    def submit(self, path: str, write, *args, **kwargs):
+        """Write path with write(path, *args, **kwargs), in the background"""
+        self._slots.acquire()
+        try:
+            future = self._pool.submit(write_atomic, path, write, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures[future] = path
+
+    def image(self, path: str, image):
+        """Save an image array (format from the file extension, e.g. PNG)"""
+        self.submit(path, imsave, image)
+
+    def csv(self, path: str, table, **kwargs):
+        """Save a DataFrame as CSV"""
+        self.submit(path, lambda p: table.to_csv(p, **kwargs))
+
+    def flush(self) -> list[str]:
+        """Wait for all submitted files; return their paths, or raise OutputError"""
+        futures, self._futures = self._futures, {}
+        errors = {}
+        for future, path in futures.items():
+            if e := future.exception():
+                errors[path] = f"{type(e).__name__}: {e}"
+        if errors:
+            raise OutputError(
+                f"Failed to write {len(errors)} file(s): "
+                + "; ".join(f"{p} ({e})" for p, e in errors.items())
+            )
+        return list(futures.values())
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        try:
+            if exc_type is None:
+                self.flush()
+        finally:
+            self.close()
@@ -0,0 +1,167 @@
+"""
+Two-stage pipelined execution of a batch of scans:
+
+    produce (e.g. PipelineRunner) --> bounded queue --> consume (e.g. analysis)
+
+PipelineRunner is an external process, whereas the analysis is Python-heavy,
+so the producer runs in a background thread (mostly waiting on its subprocess)
+while the main thread consumes. Running PipelineRunner on scan n + 1 while
+scan n is analyzed keeps both busy, and a batch takes about max(stage) rather
+than sum(stage) per scan. The producer runs one item at a time, unless given
+a schedule (e.g. scheduler.MemoryScheduler.run) that runs several at once.
+
+With a schedule, items are consumed in the order they are produced, which
+may differ from the input order; the completed items are still returned in
+input order.
+
+At most queue_depth produced items wait for the consumer; when the queue is
+full the producer blocks (back-pressure), which bounds how far PipelineRunner
+runs ahead, and with it the disk space taken by unanalyzed .dream3d files.
+"""
+
+import time
+import queue
+import threading
+
+_DONE = object()
+
+
+def _union(intervals) -> float:
+    """Total length of the union of (start, end) intervals"""
+    total, covered = 0.0, float("-inf")
+    for start, end in sorted(intervals):
+        if end > covered:
+            total += end - max(start, covered)
+            covered = end
+    return total
+
+
+def sequential(items, produce):
+    """Default schedule: produce items one at a time, in order"""
+    for item in items:
+        try:
+            produce(item)
+        except Exception as e:
+            yield item, e
+        else:
+            yield item, None
+
+
+class PipelinedExecutor:
+    """
+    Run produce(item) and then consume(item) for every item, overlapping
+    produce of the next items with consume of the current one.
+    Items that fail in either stage are reported in self.failed, and skipped.
+
+    schedule(items, produce) runs produce over all items, yielding
+    (item, error or None) as each one ends; the default runs them in order.
+    """
+
+    def __init__(self, produce, consume, queue_depth: int = 2, name=str, schedule=None):
+        if queue_depth < 1:
+            raise ValueError(f"queue_depth must be at least 1, got {queue_depth}")
+        self.produce = produce
+        self.consume = consume
+        self.queue_depth = queue_depth
+        self.name = name  # item -> label for log messages
+        self.schedule = schedule or sequential
+
+        self.done = []
+        self.failed = {}  # name: error message
+        self.busy = {"produce": 0.0, "consume": 0.0}  # seconds spent in each stage
+        self.produced = []  # (start, end) of every produce call
+        self.wall = 0.0
+
+        self._queue = queue.Queue(maxsize=queue_depth)
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def run(self, items) -> list:
+        """Process all items, return those that completed both stages"""
+        t0 = time.perf_counter()
+        items = list(items)
+        producer = threading.Thread(
+            target=self._producer, args=(items,), name="producer", daemon=True
+        )
+        producer.start()
+        try:
+            self._consumer()
+        except KeyboardInterrupt:
+            print("Stopping, waiting for the running producer job to finish...")
+            raise
+        finally:
+            self._stop.set()
+            producer.join()
+            self.wall = time.perf_counter() - t0
+            print(self.summary())
+        order = {id(item): n for n, item in enumerate(items)}
+        self.done.sort(key=lambda item: order[id(item)])
+        return self.done
+
+    def _fail(self, item, stage: str, e: Exception):
+        self.failed[self.name(item)] = f"{stage}: {type(e).__name__}: {e}"
+        print(f"Failed {self.name(item)} ({self.failed[self.name(item)]})")
+
+    def _put(self, item) -> bool:
+        """Blocking put, which gives up once stopped"""
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self, item):
+        t = time.perf_counter()
+        try:
+            return self.produce(item)
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self.busy["produce"] += end - t
+                self.produced.append((t, end))
+
+    def _producer(self, items):
+        ended = set()  # ids of the items yielded by the schedule
+        try:
+            for item, error in self.schedule(items, self._produce):
+                ended.add(id(item))
+                if error is not None:
+                    self._fail(item, "produce", error)
+                elif self._stop.is_set() or not self._put(item):
+                    return
+        except Exception as e:
+            # The schedule itself failed: the items it didn't yield are lost
+            for item in items:
+                if id(item) not in ended:
+                    self._fail(item, "produce", e)
+        finally:
+            self._put(_DONE)
+
+    def _consumer(self):
+        while (item := self._queue.get()) is not _DONE:
+            t = time.perf_counter()
+            try:
+                self.consume(item)
+            except Exception as e:
+                self._fail(item, "consume", e)
+            else:
+                self.done.append(item)
+            finally:
+                self.busy["consume"] += time.perf_counter() - t
+
+    def summary(self) -> str:
+        """
+        Counts and times: producing is the time any produce call was running
+        (less than their total with concurrent jobs), idle the time the
+        consumer waited for produced items
+        """
+        with self._lock:
+            producing = _union(self.produced)
+        p, c = self.busy["produce"], self.busy["consume"]
+        return (
+            f"{len(self.done)} done, {len(self.failed)} failed in {self.wall:.1f} s "
+            f"(producing: {producing:.1f} s, {p:.1f} s over all items; "
+            f"consuming: {c:.1f} s, idle {max(0.0, self.wall - c):.1f} s)"
+        )
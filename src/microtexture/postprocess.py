@@ -6,28 +6,97 @@ Generates summary plots and statistics after running a Dream3D pipeline
 
 import sys
 import os
-from typing import Literal
+import queue
+import threading
+import multiprocessing
+from glob import glob
+from collections import deque
+from functools import partial
+from concurrent.futures import wait, FIRST_COMPLETED
 from configargparse import ArgumentParser, Namespace, YAMLConfigFileParser
 import warnings
 import numpy as np
-from pandas import DataFrame, cut, ExcelWriter
-import h5py
+from pandas import DataFrame, ExcelWriter, concat
 from skimage.measure import regionprops
 from PIL.Image import fromarray
 from PIL.ImageFont import truetype
 from PIL.ImageDraw import Draw
-from matplotlib.pyplot import get_cmap
-from matplotlib.colors import to_rgb
-from skimage.segmentation import mark_boundaries
-from imageio import imsave
+
+from .h5io import MappedFile, PreloadedFile, Prefetcher, CroppedFile
+from .features import FeatureTable, FEATURE_DATA, FEATURE_DATASETS
+from .neighbors import NeighborGraph
+from .classify import ClassScheme
+from .labels import LabelLUT, masked_image, render_labels
+from .colormaps import colorize, label_colors
+from .ipf import hexagonal_ipf_colors
+from .orientation import c_axes, feature_caxis_misorientations
+from .loading import worst_case_direction, class_area_fractions, parse_axes, axis_argument
+from .heatmaps import class_fractions, window_means
+from .correlations import two_point_statistics
+from .spacing import class_trees, nearest_distances, neighbor_counts
+from .roi import ROI, parse_roi, roi_argument
+from .workers import WorkerPool
+from .outputs import OutputSink
+from .sharedarrays import SharedArrays, attached
+
+CELL_DATA = "DataContainers/ImageDataContainer/CellData"
+
+# IPF maps: d["ipf_{kind}_{axis}"] holds the IPF_{name}_{AXIS} array, along the
+# sample direction of axis
+IPF_AXES = {"x": (1, 0, 0), "y": (0, 1, 0), "z": (0, 0, 1)}
+IPF_KINDS = {"raw": "Raw", "cleaned": "Cleaned", "avg": "Average", "mtr": "MTR"}
+
+# Raw data columns of the distance to the nearest MTR of each class
+NEAREST = "Nearest "
+
+# Datasets used by read_dream3d_file, e.g. for prefetching
+DREAM3D_DATASETS = FEATURE_DATASETS + tuple(
+    f"{CELL_DATA}/{name}"
+    for name in ["Mask", "Raw_CAxes", "MTRIds", "EulerAngles", "AvgEulerAngles"]
+    + [
+        f"IPF_{kind}_{ax.upper()}" for ax in IPF_AXES for kind in IPF_KINDS.values()
+    ]
+)
 
 
 def analyzeData(
     dream3d_file: str = None,
     output_dir: str = None,
-    stress_axis: Literal["001", "010", "001"] = "001",
+    stress_axis: str | list = "001",
     min_mtr_size: int = 10000,
+    mtr_classes: ClassScheme = None,
+    progress=None,
+    data=None,
+    worst_case_axis: bool = False,
+    worst_case_class: str = "Initiator",
+    heatmap_windows: list = None,
+    correlations: bool = True,
+    spacing_radius: float = None,
+    roi=None,
+    scan_summary: bool = True,
 ):
+    """
+    Analyze a single .dream3d file. Stages are reported as (dream3d_file, stage, None)
+    tuples to the progress queue, if any (see STAGE_PROGRESS).
+    data: the file's datasets, if already read (see h5io.Prefetcher).
+    stress_axis: "100" / "010" / "001", components ("0.3,0,0.95" or 3 numbers),
+    "euler:phi1,Phi,phi2" (deg, see loading.parse_axis), or a list of them. MTRs
+    are classified for the first one; the class area fractions of all of them
+    are written to Stress_Axes.csv.
+    worst_case_axis: also search the loading direction maximizing the area
+    fraction of the worst_case_class MTRs (see loading.worst_case_direction).
+    heatmap_windows: window sizes (um) of heatmaps of the MTR class area
+    fractions and MTR intensity, written to Heatmaps/ (see write_heatmaps).
+    correlations: compute the two-point correlations of the MTR class maps
+    (Two_Point_Correlations.csv) and the correlation lengths of each class
+    (scan areas), see correlations.two_point_statistics.
+    spacing_radius: also count the MTRs of each class within this distance (um)
+    of every MTR, besides the distance to the nearest one (see spacing).
+    roi: analyze only this region of the scan, "x0,y0,x1,y1" (um) or
+    "x0,y0,x1,y1px" (see roi.parse_roi).
+    scan_summary: write the file's Raw_Data.csv and statistics workbook (the GUI
+    only writes those of the whole campaign, see analyzeBatch).
+    """
 
     if not dream3d_file or not os.path.isfile(dream3d_file):
         raise FileNotFoundError(f"Failed to find dream3d file at: {dream3d_file}")
@@ -36,95 +105,338 @@ def analyzeData(
         output_dir = os.path.dirname(dream3d_file)
     assert os.path.isdir(output_dir)
 
-    assert stress_axis in ("001", "010", "001")
-    ref_dir = list(map(int, stress_axis))
+    stress_axes = parse_axes(stress_axis)
+    ref_dir = stress_axes[0]
 
     print(f"Processing {dream3d_file}")
-    d3d = read_dream3d_file(dream3d_file, ref_dir=ref_dir, mtr_size=min_mtr_size)
-
-    # Generate and save MTR ID Map
-    mtr_id_map = array2rgb(d3d["mtr_id_map"], cmap="nipy_spectral")
-    mtr_id_map_w_boundaries = (
-        mark_boundaries(mtr_id_map, d3d["mtr_id_map"], color=(1, 1, 1), mode="inner")
-        * 255
-    ).astype("uint8")
-    mtr_id_map_with_scalebar = add_scalebar(
-        d3d=None,
-        rgb_image=mtr_id_map_w_boundaries,
-        stepsize=d3d["stepsize"],
-        plot=False,
+    _report(progress, dream3d_file, "reading")
+    d3d = read_dream3d_file(
+        dream3d_file,
+        ref_dir=ref_dir,
+        mtr_size=min_mtr_size,
+        mtr_classes=mtr_classes,
+        data=data,
+        roi=roi,
     )
-    imsave(
-        os.path.join(output_dir, "Individual_MTRs.png"),
-        np.array(mtr_id_map_with_scalebar),
-    )
-
-    # Generate and Save IPF Images with Scalebar
-    for ref in ["x", "y", "z"]:
-
-        subdir = os.path.join(output_dir, "IPF_Images", ref.upper())
-        os.makedirs(subdir, exist_ok=True)
 
-        ipf_with_scalebar = add_scalebar(
+    # Images and tables are written in the background while the next ones
+    # are computed, all of them by the end of the with block
+    with OutputSink() as sink:
+        # Generate and save MTR ID Map
+        _report(progress, dream3d_file, "rendering")
+        mtr_id_map_w_boundaries = render_labels(
+            d3d["mtr_id_map"],
+            label_colors(
+                d3d["mtr_id_map"].min(), d3d["mtr_id_map"].max(), "nipy_spectral"
+            ),
+            boundary_color=(255, 255, 255),
+        )
+        mtr_id_map_with_scalebar = add_scalebar(
             d3d=None,
-            rgb_image=d3d[f"ipf_cleaned_{ref.lower()}"],
+            rgb_image=mtr_id_map_w_boundaries,
             stepsize=d3d["stepsize"],
             plot=False,
         )
-        imsave(
-            os.path.join(
-                subdir,
-                f"IPF_Cleaned_{ref.upper()}_Image_w_Scalebar.png",
-            ),
-            ipf_with_scalebar,
+        sink.image(
+            os.path.join(output_dir, "Individual_MTRs.png"),
+            np.array(mtr_id_map_with_scalebar),
         )
 
-        mtr_ipf_with_scalebar = add_scalebar(
+        # MTRs colored by class (black: not an MTR)
+        mtr_class_map = d3d["mtr_class_colors"][d3d["mtr_class_map"]]
+        mtr_class_map_with_scalebar = add_scalebar(
             d3d=None,
-            rgb_image=d3d[f"ipf_mtr_{ref.lower()}"],
+            rgb_image=mtr_class_map,
             stepsize=d3d["stepsize"],
             plot=False,
         )
-        imsave(
-            os.path.join(
-                subdir,
-                f"IPF_MTR_{ref.upper()}_Image_w_Scalebar.png",
-            ),
-            mtr_ipf_with_scalebar,
+        sink.image(
+            os.path.join(output_dir, "MTR_Classes.png"),
+            np.array(mtr_class_map_with_scalebar),
+        )
+
+        # Generate and Save IPF Images with Scalebar
+        for ref in ["x", "y", "z"]:
+
+            subdir = os.path.join(output_dir, "IPF_Images", ref.upper())
+            os.makedirs(subdir, exist_ok=True)
+
+            ipf_with_scalebar = add_scalebar(
+                d3d=None,
+                rgb_image=d3d[f"ipf_cleaned_{ref.lower()}"],
+                stepsize=d3d["stepsize"],
+                plot=False,
+            )
+            sink.image(
+                os.path.join(
+                    subdir,
+                    f"IPF_Cleaned_{ref.upper()}_Image_w_Scalebar.png",
+                ),
+                ipf_with_scalebar,
+            )
+
+            mtr_ipf_with_scalebar = add_scalebar(
+                d3d=None,
+                rgb_image=d3d[f"ipf_mtr_{ref.lower()}"],
+                stepsize=d3d["stepsize"],
+                plot=False,
+            )
+            sink.image(
+                os.path.join(
+                    subdir,
+                    f"IPF_MTR_{ref.upper()}_Image_w_Scalebar.png",
+                ),
+                mtr_ipf_with_scalebar,
+            )
+
+        if tuple(ref_dir) not in IPF_AXES.values():
+            subdir = os.path.join(output_dir, "IPF_Images", "Stress_Axis")
+            os.makedirs(subdir, exist_ok=True)
+            sink.image(
+                os.path.join(subdir, "IPF_Stress_Axis_Image_w_Scalebar.png"),
+                add_scalebar(
+                    d3d=None,
+                    rgb_image=d3d["ipf_stress_axis"],
+                    stepsize=d3d["stepsize"],
+                    plot=False,
+                ),
+            )
+
+        # Load Raw Data and Add to Single Dataframe
+        _report(progress, dream3d_file, "writing")
+        raw_data = DataFrame(
+            data=np.c_[
+                d3d["mtr_sizes"],
+                d3d["mtr_caxis_misalignments"],
+                d3d["mtr_misorientations"],
+                d3d["mtr_solidity"],
+                d3d["mtr_intensity"],
+                d3d["mtr_aspect_ratios"],
+                d3d["mtr_neighbors"],
+                d3d["mtr_hard_soft_boundary"],
+                d3d["mtr_cluster_areas"],
+            ],
+            columns=[
+                "MTR Area, um^2",
+                "MTR Caxis Misalignment, deg",
+                "MTR Misorientation, deg",
+                "Solidity",
+                "MTR Intensity",
+                "MTR Aspect Ratio",
+                "MTR Neighbors",
+                "Hard-Soft Boundary, um",
+                "Cluster Area, um^2",
+            ],
         )
+        raw_data.insert(0, "MTR Class", d3d["mtr_class"])
+        raw_data.insert(0, "Sample", d3d["fname"])
+        spacing = mtr_spacing(d3d["mtrs"], spacing_radius)
+        raw_data = concat([raw_data, spacing], axis=1)
+
+        scan_areas = DataFrame(
+            {
+                "Scan Area, mm2": [d3d["scan_area_mm2"]],
+                "Pixel Fraction Altered By Cleanup": [
+                    d3d["pixel_fraction_altered_by_cleanup"]
+                ],
+            },
+            index=[d3d["fname"]],
+        )
+        if roi is not None:
+            scan_areas["Region of Interest, um"] = str(d3d["roi"])
+        if len(stress_axes) > 1:
+            # Class area fractions of every stress axis, in one product
+            fractions = class_area_fractions(
+                stress_axes,
+                d3d["mtrs"].avg_caxis,
+                d3d["mtr_sizes"],
+                d3d["scan_area_mm2"] * 1e6,
+                mtr_classes,
+            )
+            table = DataFrame(stress_axes, columns=["x", "y", "z"])
+            table.insert(0, "Stress Axis", [str(a) for a in stress_axis])
+            labels = (mtr_classes or ClassScheme()).labels
+            for label, column in zip(labels, fractions.T):
+                table[f"{label} Area Fraction"] = column
+            sink.csv(os.path.join(output_dir, "Stress_Axes.csv"), table, index=False)
+        if worst_case_axis:
+            search = worst_case_direction(
+                d3d["mtrs"].avg_caxis,
+                d3d["mtr_sizes"],
+                d3d["scan_area_mm2"] * 1e6,
+                mtr_classes,
+                worst_case_class,
+            )
+            write_direction_search(output_dir, search, mtr_classes, sink)
+            axis = ",".join(f"{x:.3f}" for x in search.direction)
+            print(f"Worst-case {search.label} axis: {axis} ({search.fraction:.2%})")
+            scan_areas[f"Worst-Case {search.label} Axis"] = axis
+            scan_areas[f"Worst-Case {search.label} Area Fraction"] = search.fraction
+        if heatmap_windows:
+            write_heatmaps(output_dir, d3d, heatmap_windows, mtr_classes, sink)
+        if correlations:
+            labels = (mtr_classes or ClassScheme()).labels
+            stats = two_point_statistics(d3d["mtr_class_map"], len(labels), d3d["mask"])
+            write_correlations(output_dir, stats, labels, d3d["stepsize"], sink)
+            for suffix, lengths in (
+                ("", stats.radial_lengths),
+                (" X", stats.lengths(stats.x)),
+                (" Y", stats.lengths(stats.y)),
+            ):
+                for label, length in zip(labels, lengths):
+                    scan_areas[f"{label} Correlation Length{suffix}, um"] = (
+                        length * d3d["stepsize"]
+                    )
+        adjacency = d3d["mtr_class_pairs"]
+        adjacency.insert(0, "Sample", d3d["fname"])
+        results = dict(
+            raw_data=raw_data, scan_areas=scan_areas, mtr_adjacency=adjacency
+        )
+
+        if raw_data.size == 0:
+            warnings.warn("No MTRs identified using current settings")
+            return results
+
+        drop_missing(raw_data)
+
+        if scan_summary:
+            raw_data_output_path = os.path.join(output_dir, "Raw_Data.csv")
+            sink.csv(raw_data_output_path, raw_data)
+
+            # Save Summary Statistics to Results Folder
+            output_path = os.path.join(
+                output_dir, "Microtexture_Statistics_Summary.xlsx"
+            )
+            sink.submit(output_path, write_summary, raw_data, scan_areas, adjacency)
+
+    print("Program has completed successfully")
+    return results
 
-    # Load Raw Data and Add to Single Dataframe
-    raw_data = DataFrame(
-        data=np.c_[
-            d3d["mtr_sizes"],
-            d3d["mtr_caxis_misalignments"],
-            d3d["mtr_misorientations"],
-            d3d["mtr_solidity"],
-            d3d["mtr_intensity"],
-            d3d["mtr_aspect_ratios"],
-        ],
-        columns=[
-            "MTR Area, um^2",
-            "MTR Caxis Misalignment, deg",
-            "MTR Misorientation, deg",
-            "Solidity",
-            "MTR Intensity",
-            "MTR Aspect Ratio",
-        ],
+
+def write_direction_search(output_dir, search, mtr_classes, sink):
+    """
+    Save the directional map of a worst-case loading direction search (area
+    fraction of its class, white at the worst case), and its area fractions
+    of every class for every direction
+    """
+    image = array2rgb(search.fraction_map)
+    best = np.nanargmax(search.fraction_map)
+    image.reshape(-1, 3)[best] = 255
+    sink.image(
+        os.path.join(output_dir, "Worst_Case_Directions.png"),
+        image.repeat(4, axis=0).repeat(4, axis=1),
     )
-    raw_data.insert(0, "MTR Class", d3d["mtr_class"])
-    raw_data.insert(0, "Sample", d3d["fname"])
+    table = DataFrame(search.directions, columns=["x", "y", "z"])
+    labels = (mtr_classes or ClassScheme()).labels
+    for label, fractions in zip(labels, search.fractions.T):
+        table[f"{label} Area Fraction"] = fractions
+    sink.csv(os.path.join(output_dir, "Worst_Case_Directions.csv"), table, index=False)
 
-    if raw_data.size == 0:
-        warnings.warn("No MTRs identified using current settings")
-        return
 
+def write_heatmaps(output_dir, d3d, windows, mtr_classes, sink):
+    """
+    Save heatmaps of the area fraction of every MTR class and of the mean MTR
+    intensity (0 outside MTRs) over the sample pixels of square windows of each
+    size (um) centered on every pixel: colored images in Heatmaps/<size>um/,
+    all the arrays in Heatmaps/Heatmaps.npz, and the location of the highest
+    area fraction of each class in Heatmaps/Heatmap_Peaks.csv (in um from the top
+    left corner of the scan, like the MTR centroids, with or without a region of
+    interest)
+    """
+    labels = (mtr_classes or ClassScheme()).labels
+    stepsize = d3d["stepsize"]
+    x0, y0 = (d3d["roi"].x0, d3d["roi"].y0) if "roi" in d3d else (0.0, 0.0)
+    sizes = {um: max(1, round(um / stepsize)) for um in windows}  # um: pixels
+    mask = d3d["mask"].astype(bool)
+    fractions = class_fractions(d3d["mtr_class_map"], len(labels), mask, sizes.values())
+    intensities = window_means(d3d["mtr_intensity_map"], mask, sizes.values())
+
+    heatmap_dir = os.path.join(output_dir, "Heatmaps")
+    arrays, peaks = {}, []
+    for um, size in sizes.items():
+        subdir = os.path.join(heatmap_dir, f"{um:g}um")
+        os.makedirs(subdir, exist_ok=True)
+        for label, fraction in zip(labels, fractions[size]):
+            name = label.replace(" ", "_")
+            arrays[f"{name}_Area_Fraction_{um:g}um"] = fraction
+            sink.image(
+                os.path.join(subdir, f"{name}_Area_Fraction.png"),
+                add_scalebar(rgb_image=colorize(fraction), stepsize=stepsize),
+            )
+            if np.isnan(fraction).all():
+                continue
+            row, col = np.unravel_index(np.nanargmax(fraction), fraction.shape)
+            x, y = x0 + col * stepsize, y0 + row * stepsize
+            peaks.append((um, label, float(fraction[row, col]), x, y))
+        arrays[f"MTR_Intensity_{um:g}um"] = intensities[size]
+        sink.image(
+            os.path.join(subdir, "MTR_Intensity.png"),
+            add_scalebar(rgb_image=array2rgb(intensities[size]), stepsize=stepsize),
+        )
+    sink.submit(os.path.join(heatmap_dir, "Heatmaps.npz"), np.savez_compressed, **arrays)
+    table = DataFrame(
+        peaks, columns=["Window, um", "MTR Class", "Peak Area Fraction", "x, um", "y, um"]
+    )
+    sink.csv(os.path.join(heatmap_dir, "Heatmap_Peaks.csv"), table, index=False)
+
+
+def drop_missing(raw_data):
+    """
+    Drop the MTRs with missing (NaN or infinite) measurements from raw_data, in
+    place. Nearest MTR distances are NaN when there is no other MTR of a class,
+    which is kept.
+    """
     raw_data.replace([np.inf, -np.inf], np.nan, inplace=True)
-    raw_data.dropna(inplace=True)
+    nearest = [c for c in raw_data.columns if str(c).startswith(NEAREST)]
+    raw_data.dropna(subset=raw_data.columns.difference(nearest), inplace=True)
+
+
+def mtr_spacing(mtrs, radius=None) -> DataFrame:
+    """
+    Distance (um) from the centroid of every MTR (FeatureTable with classes) to
+    that of the nearest other MTR of each class, and with a radius (um), the
+    number of MTRs of each class within it
+    """
+    labels, codes = mtrs.class_labels, mtrs.class_codes
+    centroids = mtrs.centroids[:, :2]  # x, y
+    trees = class_trees(centroids, codes, len(labels))
+    distances = nearest_distances(centroids, codes, len(labels), trees)
+    spacing = DataFrame(distances, columns=[f"{NEAREST}{label}, um" for label in labels])
+    if radius:
+        counts = neighbor_counts(centroids, codes, len(labels), radius, trees)
+        for label, column in zip(labels, counts.T):
+            spacing[f"{label} Within {radius:g} um"] = column
+    return spacing
+
+
+def write_correlations(output_dir, stats, labels, stepsize, sink):
+    """
+    Save the two-point correlations of the MTR classes against distance:
+    radially averaged for every pair of classes, and along x and y for each
+    class with itself
+    """
+    table = DataFrame({"Distance, um": stats.distances * stepsize})
+    for a, first in enumerate(labels):
+        for b, second in enumerate(labels[a:], start=a):
+            table[f"{first} - {second}"] = stats.radial[a, b]
+    for axis, profiles in (("X", stats.x), ("Y", stats.y)):
+        for label, profile in zip(labels, profiles):
+            table[f"{label} - {label} {axis}"] = profile
+    sink.csv(os.path.join(output_dir, "Two_Point_Correlations.csv"), table, index=False)
+
 
-    raw_data_output_path = os.path.join(output_dir, "Raw_Data.csv")
-    raw_data.to_csv(raw_data_output_path)
+def _analyze_shared(dream3d_file, output_dir, shared: dict, **kwargs):
+    """Worker: analyzeData on datasets placed in shared memory by analyzeBatch"""
+    with attached(shared) as arrays:
+        data = PreloadedFile(dream3d_file, arrays)
+        return analyzeData(dream3d_file, output_dir, data=data, **kwargs)
 
+
+def write_summary(output_path, raw_data, scan_areas, mtr_adjacency):
+    """
+    Write the statistics workbook for the MTRs in raw_data (one or more samples),
+    scan_areas (indexed by sample) and the MTR class adjacency table.
+    """
     # Get Groups by Scan and MTR Class
     grps = raw_data.groupby(["Sample", "MTR Class"])
 
@@ -132,31 +444,16 @@ def analyzeData(
     stats = grps.describe()
 
     # Calculate Area Fraction
+    area_mm2 = scan_areas["Scan Area, mm2"]
     stats2 = grps.agg(Total_Area_um2=("MTR Area, um^2", "sum")).reset_index()
-    stats2["Area Fraction"] = stats2.apply(
-        lambda x: x["Total_Area_um2"] / 1000**2 / d3d["scan_area_mm2"],
-        axis=1,
+    stats2["Area Fraction"] = (
+        stats2["Total_Area_um2"] / 1000**2 / stats2["Sample"].map(area_mm2)
     )
 
     # Calculate Number Density
     counts = grps.agg(Count=("MTR Area, um^2", len)).reset_index()
     stats2["Count"] = counts["Count"]
-    stats2["Number Density (Qty/mm)"] = counts.apply(
-        lambda x: x["Count"] / d3d["scan_area_mm2"], axis=1
-    )
-
-    scan_areas = DataFrame(
-        {
-            "Scan Area, mm2": [d3d["scan_area_mm2"]],
-            "Pixel Fraction Altered By Cleanup": [
-                d3d["pixel_fraction_altered_by_cleanup"]
-            ],
-        },
-        index=[d3d["fname"]],
-    )
-
-    # Save Summary Statistics to Results Folder
-    output_path = os.path.join(output_dir, "Microtexture_Statistics_Summary.xlsx")
+    stats2["Number Density (Qty/mm)"] = counts["Count"] / counts["Sample"].map(area_mm2)
 
     writer = ExcelWriter(output_path)
 
@@ -168,35 +465,293 @@ def analyzeData(
         stats[col].to_excel(writer, sheet_name=col, float_format="%.4f")
 
     stats2.to_excel(writer, sheet_name="Area Fractions", float_format="%.4f")
+    mtr_adjacency.to_excel(writer, sheet_name="MTR Adjacency", float_format="%.4f")
     scan_areas.to_excel(
         writer, sheet_name="Scan Areas and Cleanup Summary", float_format="%.4f"
     )
     writer.close()
 
-    print("Program has completed successfully")
+
+# Fraction of the work on a file done at each stage of analyzeData / analyzeBatch
+STAGE_PROGRESS = dict(
+    queued=0.0,
+    reading=0.05,
+    rendering=0.5,
+    writing=0.8,
+    done=1.0,
+    failed=1.0,
+    cancelled=1.0,
+)
+
+
+def _report(progress, path, stage, info=None):
+    if progress is not None:
+        progress.put((path, stage, info))
+
+
+def find_dream3d_files(paths) -> list[str]:
+    """
+    .dream3d files from file paths, glob patterns and directories. Directories
+    are searched like the GUI does (DIR/*/*.dream3d), plus DIR/*.dream3d.
+    """
+    files = []
+    for path in paths:
+        path = os.path.expanduser(os.path.expandvars(path))
+        if os.path.isdir(path):
+            files += sorted(glob(os.path.join(path, "*.dream3d")))
+            files += sorted(glob(os.path.join(path, "*", "*.dream3d")))
+        elif os.path.isfile(path):
+            files.append(path)
+        else:
+            found = sorted(glob(path))
+            if not found:
+                raise FileNotFoundError(f"No .dream3d files found at: {path}")
+            files += found
+    return list(dict.fromkeys(os.path.abspath(f) for f in files))
+
+
+def analyzeBatch(
+    dream3d_files: list[str],
+    summary_dir: str,
+    output_dir: str = None,
+    workers: int = 1,
+    progress=None,
+    cancel: threading.Event = None,
+    prefetch: int = 2,
+    prefetch_memory: float = None,
+    **kwargs,
+) -> dict | None:
+    """
+    Run analyzeData on every file in parallel processes, writing per-scan outputs
+    (next to each file, or in output_dir, where {basename} stands for the file
+    name), plus a combined 'Raw Data.csv' and 'Microtexture Statistics Summary.xlsx'
+    for the whole campaign in summary_dir, as the GUI does.
+    kwargs are passed on to analyzeData (stress_axis, min_mtr_size, mtr_classes,
+    worst_case_axis...).
+
+    Per-file stages are put on the progress queue as (file, stage, info) tuples;
+    with process workers, it must be a multiprocessing (Manager) queue.
+    Once cancel is set, files not yet started are dropped, the running ones are
+    completed, and None is returned instead of the summary.
+
+    The datasets of up to prefetch files ahead are read on a background thread,
+    taking at most prefetch_memory bytes (None: no limit); prefetch=0 disables
+    this. With a single worker, files are then analyzed in this process, and
+    otherwise handed to the worker processes in shared memory (not counted in
+    prefetch_memory), rather than read again by them. With a region of interest
+    (roi in kwargs), nothing is prefetched: each file's region is read as a
+    hyperslab of the maps where it is analyzed, rather than the whole scan.
+
+    Returns the combined tables, and the errors of scans that failed.
+    """
+    results, failed = {}, {}
+    queued = deque(dream3d_files)
+    if kwargs.get("roi") is not None:
+        prefetch = 0
+
+    def cancelled() -> bool:
+        return cancel is not None and cancel.is_set()
+
+    def scan_output_dir(f: str) -> str | None:
+        if not output_dir:
+            return None
+        basename = os.path.basename(f).split(".dream3d")[0]
+        out = os.path.abspath(output_dir.format(basename=basename))
+        os.makedirs(out, exist_ok=True)
+        return out
+
+    def collect(f: str, result):
+        try:
+            results[f] = result()
+        except Exception as e:
+            failed[f] = f"{type(e).__name__}: {e}"
+            print(f"Failed {f}: {failed[f]}")
+            _report(progress, f, "failed", failed[f])
+        else:
+            _report(progress, f, "done")
+        print(f"{len(results) + len(failed)} / {len(dream3d_files)} scans analyzed")
+
+    if workers == 1 and prefetch:
+        files = Prefetcher(dream3d_files, DREAM3D_DATASETS, prefetch, prefetch_memory)
+        for f, data in files:
+            if cancelled():
+                while queued:
+                    _report(progress, queued.popleft(), "cancelled")
+                break
+            queued.popleft()
+            collect(
+                f,
+                partial(
+                    analyzeData,
+                    f,
+                    scan_output_dir(f),
+                    progress=progress,
+                    data=data,
+                    **kwargs,
+                ),
+            )
+        files.close()
+    else:
+        futures = {}  # submitted, but not done
+        shared = {}  # future: datasets in shared memory
+        if prefetch:
+            files = Prefetcher(dream3d_files, DREAM3D_DATASETS, prefetch, prefetch_memory)
+            files = iter(files)
+        else:
+            files = ((f, None) for f in dream3d_files)
+
+        # Files are handed to the pool only as workers free up, so that the
+        # ones not started yet can still be cancelled
+        with SharedArrays() as segments, WorkerPool(workers, prestart=False) as pool:
+            while queued or futures:
+                while queued and len(futures) < workers and not cancelled():
+                    f, data = next(files)
+                    queued.popleft()
+                    out = scan_output_dir(f)
+                    if data is None:
+                        future = pool.submit(
+                            analyzeData, f, out, progress=progress, **kwargs
+                        )
+                    else:
+                        arrays = segments.share_all(data.arrays)
+                        future = pool.submit(
+                            _analyze_shared, f, out, arrays, progress=progress, **kwargs
+                        )
+                        shared[future] = arrays
+                    futures[future] = f
+
+                if cancelled():
+                    while queued:
+                        _report(progress, queued.popleft(), "cancelled")
+
+                done, _ = wait(futures, timeout=0.5, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect(futures.pop(future), future.result)
+                    segments.release(shared.pop(future, {}))
+        files.close()
+
+    if cancelled():
+        print("Analysis cancelled")
+        return None
+
+    results = [results[f] for f in dream3d_files if f in results]
+    if not results:
+        raise RuntimeError(f"All scans failed: {failed}")
+
+    summary = {
+        key: concat([r[key] for r in results], axis=0)
+        for key in ("raw_data", "scan_areas", "mtr_adjacency")
+    }
+    raw_data = summary["raw_data"]
+    drop_missing(raw_data)
+    raw_data.reset_index(drop=True, inplace=True)
+
+    os.makedirs(summary_dir, exist_ok=True)
+    if len(raw_data):
+        with OutputSink() as sink:
+            sink.csv(os.path.join(summary_dir, "Raw Data.csv"), raw_data)
+            sink.submit(
+                os.path.join(summary_dir, "Microtexture Statistics Summary.xlsx"),
+                write_summary,
+                raw_data,
+                summary["scan_areas"],
+                summary["mtr_adjacency"].reset_index(drop=True),
+            )
+    else:
+        warnings.warn("No MTRs identified using current settings")
+
+    print(f"Campaign summary of {len(results)} scans in: {summary_dir}")
+    summary["failed"] = failed
+    return summary
+
+
+class BackgroundBatch:
+    """
+    analyzeBatch on a background thread, e.g. for the GUI, which polls events()
+    for progress and sets cancel to stop.
+    """
+
+    def __init__(self, dream3d_files: list[str], summary_dir: str, workers: int = 1, **kwargs):
+        self.files = list(dream3d_files)
+        self.stage = dict.fromkeys(self.files, "queued")
+        self.errors = {}
+        self.summary = None
+        self.error = None  # of the batch as a whole
+        self.finished = False
+        self.cancel = threading.Event()
+
+        self._manager = multiprocessing.get_context("spawn").Manager()
+        self._queue = self._manager.Queue()
+        self._thread = threading.Thread(
+            target=self._run, args=(summary_dir, workers, kwargs), daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self, summary_dir, workers, kwargs):
+        try:
+            self.summary = analyzeBatch(
+                self.files,
+                summary_dir,
+                workers=workers,
+                progress=self._queue,
+                cancel=self.cancel,
+                **kwargs,
+            )
+        except Exception as e:
+            self.error = e
+        finally:
+            self._queue.put((None, "finished", None))
+
+    def events(self) -> list[tuple]:
+        """(file, stage, info) progress events received since the last call"""
+        events = []
+        while not self.finished:
+            try:
+                path, stage, info = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if path is None:
+                self.finished = True
+                self._manager.shutdown()
+                continue
+            self.stage[path] = stage
+            if stage == "failed":
+                self.errors[path] = info
+            events.append((path, stage, info))
+        return events
+
+    @property
+    def progress(self) -> float:
+        """Overall progress, 0 - 100 %"""
+        done = sum(STAGE_PROGRESS[s] for s in self.stage.values())
+        return 100.0 * done / max(len(self.files), 1)
 
 
 def array2rgb(arr, cmap="jet", vmin=0, vmax=1, nan_color="k"):
     """
     Takes a 2d array and colormap name, scales the input, and returns a RGB uint8 array
     """
-    scaled = (arr - np.nanmin(arr)) / (np.nanmax(arr) - np.nanmin(arr))
+    lo, hi = np.nanmin(arr), np.nanmax(arr)
+    if np.issubdtype(arr.dtype, np.integer) and 0 <= lo and hi < arr.size:
+        # e.g. label maps: color every value once, then gather
+        return label_colors(lo, hi, cmap, vmin, vmax, nan_color)[arr]
+    scaled = (arr - lo) / (hi - lo)
     scaled = scaled * (vmax - vmin) + vmin
-    cmap = get_cmap(cmap)
-    rgb = cmap(scaled, bytes=True)[:, :, :3]
-    rgb[np.isnan(scaled)] = np.array(to_rgb(nan_color), dtype="uint8") * 255
-    return rgb
+    return colorize(scaled, cmap, nan_color)
 
 
 def calc_misalignment(hkl, ref_dir=[0, 0, 1]):
     """
-    Calculates misalignment angle in deg between ref_dir and hkl
+    Calculates misalignment angle in deg between ref_dir and hkl (n x 3).
+    ref_dir: a direction (3,), or several (k x 3) for a (k x n) result
     """
     # Project to single hemisphere
-    ref_dir = np.array(ref_dir)
-    dotproduct = np.dot(hkl, ref_dir)
+    ref_dir = np.array(ref_dir, dtype=float)
+    dotproduct = np.dot(ref_dir, np.transpose(hkl))
 
-    magA = np.sqrt(np.sum(ref_dir**2, axis=0))
+    magA = np.sqrt(np.sum(ref_dir**2, axis=-1, keepdims=ref_dir.ndim > 1))
     magB = np.sqrt(np.sum(hkl**2, axis=1))
     mtr_caxis = (
         180 / np.pi * np.arccos(dotproduct / (magA * magB))
@@ -218,115 +773,105 @@ def getRegionProp(grainID_map, prop="solidity"):
     return df
 
 
-def read_dream3d_file(d3d, ref_dir=[0, 0, 1], mtr_size=10000):
-    data = h5py.File(d3d, "r")
-    d = {}
-    d["fname"] = os.path.basename(d3d).split(".dream3d")[0]
-    d["eulers"] = data["DataContainers/ImageDataContainer/CellFeatureData/AvgEuler"][1:]
-    d["phases"] = data["DataContainers/ImageDataContainer/CellFeatureData/Phases"][1:]
-    d["num_neighbors"] = data[
-        "DataContainers/ImageDataContainer/CellFeatureData/NumNeighbors2"
-    ][1:]
-    d["sizes"] = data[
-        "DataContainers/ImageDataContainer/CellFeatureData/EquivalentDiameters"
-    ][1:]
-    try:
-        d["neighbor_list"] = data[
-            "DataContainers/ImageDataContainer/CellFeatureData/NeighborList2"
-        ][:].tolist()
-        d["shared_surfaces"] = data[
-            "DataContainers/ImageDataContainer/CellFeatureData/SharedSurfaceAreaList2"
-        ][:].tolist()
-    except:
-        pass
-    d["avg_caxis"] = data["DataContainers/ImageDataContainer/CellFeatureData/AvgCAxes"][
-        1:
-    ]
-    d["mask"] = data["DataContainers/ImageDataContainer/CellData/Mask"][0, :, :, 0]
+def read_dream3d_file(
+    d3d,
+    ref_dir=[0, 0, 1],
+    mtr_size=10000,
+    mmap=True,
+    mtr_classes: ClassScheme = None,
+    data=None,
+    roi=None,
+):
+    """
+    Read a .dream3d file and compute per-MTR metrics. With mmap=True, contiguous
+    uncompressed datasets are read as np.memmap views instead of being copied.
+    MTRs are classified with mtr_classes (default ClassScheme if None).
+    data: DREAM3D_DATASETS already read from d3d (h5io.PreloadedFile), if any.
+    roi: region of interest (roi.ROI or "x0,y0,x1,y1"), if any: only its part
+    of the maps is read, and the features are measured on it.
+    """
+    if mtr_classes is None:
+        mtr_classes = ClassScheme()
 
+    opened = None
+    if data is None:
+        data = opened = MappedFile(d3d, mmap=mmap)
     try:
-        d["raw_caxis"] = data["DataContainers/ImageDataContainer/CellData/Raw_CAxes"][0]
-        d["caxis_misalignments"] = calc_misalignment(
-            d["raw_caxis"].reshape(-1, 3), ref_dir=ref_dir
-        ).reshape(d["raw_caxis"].shape[:2])
-
-    except:
-        pass
-
-    d["cells"] = data["/DataContainers/ImageDataContainer/CellFeatureData/NumCells"][
-        1:
-    ].ravel()
-
-    d["volumes"] = data["DataContainers/ImageDataContainer/CellFeatureData/Volumes"][
-        1:
-    ].ravel()
-    d["centroids"] = data[
-        "DataContainers/ImageDataContainer/CellFeatureData/Centroids"
-    ][1:]
-    d["misorientation"] = data[
-        "DataContainers/ImageDataContainer/CellFeatureData/FeatureAvgCAxisMisorientations"
-    ][1:].ravel()
-    d["grainIDs"] = data["/DataContainers/ImageDataContainer/CellData/MTRIds"][
-        0, :, :, 0
-    ]
-
-    # IPF Z Direction
-    d["ipf_raw_z"] = data["DataContainers/ImageDataContainer/CellData/IPF_Raw_Z"][
-        0
-    ]  # shape (1, 1000, 1001, 3)
-    d["ipf_cleaned_z"] = data[
-        "DataContainers/ImageDataContainer/CellData/IPF_Cleaned_Z"
-    ][
-        0
-    ]  # shape (1, 1000, 1001, 3)
-    d["ipf_avg_z"] = data["DataContainers/ImageDataContainer/CellData/IPF_Average_Z"][
-        0
-    ]  # shape (1, 1000, 1001, 3)
-    d["ipf_mtr_z"] = data["DataContainers/ImageDataContainer/CellData/IPF_MTR_Z"][
-        0
-    ]  # shape (1, 1000, 1001, 3)
-
-    # IPF Y Direction
-    d["ipf_raw_y"] = data["DataContainers/ImageDataContainer/CellData/IPF_Raw_Y"][
-        0
-    ]  # shape (1, 1000, 1001, 3)
-    d["ipf_cleaned_y"] = data[
-        "DataContainers/ImageDataContainer/CellData/IPF_Cleaned_Y"
-    ][
-        0
-    ]  # shape (1, 1000, 1001, 3)
-    d["ipf_avg_y"] = data["DataContainers/ImageDataContainer/CellData/IPF_Average_Y"][
-        0
-    ]  # shape (1, 1000, 1001, 3)
-    d["ipf_mtr_y"] = data["DataContainers/ImageDataContainer/CellData/IPF_MTR_Y"][
-        0
-    ]  # shape (1, 1000, 1001, 3)
-
-    # IPF X Direction
-    d["ipf_raw_x"] = data["DataContainers/ImageDataContainer/CellData/IPF_Raw_X"][
-        0
-    ]  # shape (1, 1000, 1001, 3)
-    d["ipf_cleaned_x"] = data[
-        "DataContainers/ImageDataContainer/CellData/IPF_Cleaned_X"
-    ][
-        0
-    ]  # shape (1, 1000, 1001, 3)
-    d["ipf_avg_x"] = data["DataContainers/ImageDataContainer/CellData/IPF_Average_X"][
-        0
-    ]  # shape (1, 1000, 1001, 3)
-    d["ipf_mtr_x"] = data["DataContainers/ImageDataContainer/CellData/IPF_MTR_X"][
-        0
-    ]  # shape (1, 1000, 1001, 3)
-
-    d["raw_eulers"] = data["DataContainers/ImageDataContainer/CellData/EulerAngles"][
-        0
-    ]  # shape (1, 1000, 1001, 3)
-    d["avg_eulers"] = data["DataContainers/ImageDataContainer/CellData/AvgEulerAngles"][
-        0
-    ]  # shape (1, 1000, 1001, 3)
+        d = {}
+        d["fname"] = os.path.basename(d3d).split(".dream3d")[0]
+        features = FeatureTable.from_dream3d(data)
+        stepsize = np.sqrt(np.mean(features.volumes / features.cells))
+        if roi is not None:
+            shape = data[f"{CELL_DATA}/MTRIds"].shape[1:3]
+            rows, cols = parse_roi(roi).slices(stepsize, shape)
+            data = CroppedFile(data, CELL_DATA, rows, cols)
+            d["roi"] = ROI(
+                *(v * stepsize for v in (cols.start, rows.start, cols.stop, rows.stop))
+            )
+            features = features.within(
+                data[f"{CELL_DATA}/MTRIds"][0, :, :, 0],
+                stepsize,
+                (rows.start, cols.start),
+            )
+        d["features"] = features
+        d["eulers"] = features.eulers
+        d["phases"] = features.phases
+        d["num_neighbors"] = features.num_neighbors
+        d["sizes"] = features.sizes
+        d["avg_caxis"] = features.avg_caxis
+        d["mask"] = data["DataContainers/ImageDataContainer/CellData/Mask"][0, :, :, 0]
+
+        try:
+            if f"{CELL_DATA}/Raw_CAxes" in data:
+                d["raw_caxis"] = data[f"{CELL_DATA}/Raw_CAxes"][0]
+            else:  # from the Euler angles
+                d["raw_caxis"] = c_axes(data[f"{CELL_DATA}/EulerAngles"][0])
+            d["caxis_misalignments"] = calc_misalignment(
+                d["raw_caxis"].reshape(-1, 3), ref_dir=ref_dir
+            ).reshape(d["raw_caxis"].shape[:2])
+
+        except KeyError:
+            pass
+
+        d["cells"] = features.cells
+        d["volumes"] = features.volumes
+        d["centroids"] = features.centroids
+        d["grainIDs"] = data["/DataContainers/ImageDataContainer/CellData/MTRIds"][
+            0, :, :, 0
+        ]
+        misorientations_read = (
+            f"{FEATURE_DATA}/FeatureAvgCAxisMisorientations" in data
+        )
+        if (roi is not None or not misorientations_read) and "raw_caxis" in d:
+            # Mean misorientation of the pixel c-axes of each feature to its c-axis
+            feature_caxes = np.vstack(
+                [np.zeros((1, 3), np.float32), features.avg_caxis]
+            )
+            misorientations = feature_caxis_misorientations(
+                d["grainIDs"], d["raw_caxis"], feature_caxes
+            )
+            features.misorientation = misorientations[features.ids].astype(np.float32)
+        d["misorientation"] = features.misorientation
+
+        # IPF maps stored by the pipeline, if any (computed below otherwise)
+        for ax in IPF_AXES:
+            for kind, name in IPF_KINDS.items():
+                key = f"{CELL_DATA}/IPF_{name}_{ax.upper()}"
+                d[f"ipf_{kind}_{ax}"] = data[key][0] if key in data else None
+
+        d["raw_eulers"] = data[
+            "DataContainers/ImageDataContainer/CellData/EulerAngles"
+        ][0]  # shape (1, 1000, 1001, 3)
+        d["avg_eulers"] = data[
+            "DataContainers/ImageDataContainer/CellData/AvgEulerAngles"
+        ][0]  # shape (1, 1000, 1001, 3)
+    finally:
+        # memmap views and arrays read above remain valid
+        if opened is not None:
+            opened.close()
     d["twist_angles"] = np.abs(d["eulers"][:, -1] * 180 / np.pi) % 30
 
-    ind = np.where(d["volumes"] >= mtr_size)[0]
+    ind = np.where((d["volumes"] >= mtr_size) & (d["cells"] > 0))[0]
     d["Number_MTRS"] = len(ind)
     d["mtr_sizes"] = d["volumes"][ind]
     d["mtr_circle_diameters_um"] = np.sqrt(
@@ -338,22 +883,37 @@ def read_dream3d_file(d3d, ref_dir=[0, 0, 1], mtr_size=10000):
         d["avg_caxis"][ind].reshape(-1, 3), ref_dir=ref_dir
     )
 
-    bins = [0, 25, 40, 60, 70, 100]
-    labels = ["Hard", "Misc", "Initiator", "Misc", "Soft"]
-    df = DataFrame({"misalignment": d["mtr_caxis_misalignments"]})
-    mtr_class = (
-        cut(df["misalignment"], bins, labels=False)
-        .map({i: x for i, x in enumerate(labels)})
-        .values.tolist()
-    )
-    d["mtr_class"] = mtr_class
+    labels = mtr_classes.labels
+    mtr_class = mtr_classes.classify(d["mtr_caxis_misalignments"])
+    d["mtrs"] = features.take(ind).with_classes(mtr_class, labels)
+    d["mtr_class"] = d["mtrs"].classes
 
     mtr_ind = ind + 1
-    mtr_mask = np.isin(d["grainIDs"], mtr_ind)
-    mtr_ids = d["grainIDs"].copy()
-    mtr_ids[~mtr_mask] = 0
+
+    # MTR adjacency: boundaries between MTR classes, same-class clusters
+    graph = NeighborGraph.from_table(features)
+    codes = graph.class_codes(d["mtrs"])
+    areas = np.zeros(graph.size)
+    areas[features.ids] = features.volumes
+    d["neighbor_graph"] = graph
+    d["mtr_neighbors"] = graph.degree(codes)[mtr_ind]
+    if "Hard" in labels and "Soft" in labels:
+        d["mtr_hard_soft_boundary"] = graph.shared_length(
+            codes, labels.index("Hard"), labels.index("Soft")
+        )[mtr_ind]
+    else:
+        d["mtr_hard_soft_boundary"] = np.zeros(len(mtr_ind))
+    d["mtr_cluster_areas"] = graph.cluster_areas(codes, areas)[mtr_ind]
+    d["mtr_class_pairs"] = graph.class_pairs(codes, labels)
+
+    # Per-pixel maps, as lookups by feature ID
+    lut = LabelLUT(d["grainIDs"])
+    mtr_mask = lut.mask(mtr_ind)
+    mtr_ids = lut.keep(mtr_ind)
     d["mtr_mask"] = mtr_mask
     d["mtr_id_map"] = mtr_ids
+    d["mtr_class_map"] = lut.map(mtr_ind, mtr_class, fill=-1, dtype=np.int8)
+    d["mtr_class_colors"] = mtr_classes.colors
 
     minor_axis_length = getRegionProp(mtr_ids, prop="minor_axis_length")
     major_axis_length = getRegionProp(mtr_ids, prop="major_axis_length")
@@ -372,11 +932,35 @@ def read_dream3d_file(d3d, ref_dir=[0, 0, 1], mtr_size=10000):
         / d["mtr_misorientations"]
         / 1e4
     )
+    d["mtr_intensity_map"] = lut.map(
+        mtr_ind, d["mtr_intensity"], fill=np.nan, dtype=np.float32
+    )
 
-    mtr_ipf = d["ipf_cleaned_z"].copy()
-    mtr_ipf[~mtr_mask] = 0
-    d["mtr_ipf"] = mtr_ipf
-    d["stepsize"] = np.sqrt(np.mean(d["volumes"] / d["cells"]))
+    # IPF maps missing from the file, from the Euler angles. Raw maps (before
+    # cleanup) can't be recovered from the cleaned EulerAngles
+    for ax, direction in IPF_AXES.items():
+        if d[f"ipf_cleaned_{ax}"] is None:
+            d[f"ipf_cleaned_{ax}"] = hexagonal_ipf_colors(
+                d["raw_eulers"], direction, mask=d["mask"]
+            )
+        if d[f"ipf_avg_{ax}"] is None:
+            d[f"ipf_avg_{ax}"] = hexagonal_ipf_colors(
+                d["avg_eulers"], direction, mask=d["mask"]
+            )
+        if d[f"ipf_mtr_{ax}"] is None:
+            d[f"ipf_mtr_{ax}"] = masked_image(d[f"ipf_cleaned_{ax}"], mtr_mask)
+
+    # IPF map along the stress axis
+    axis = {v: k for k, v in IPF_AXES.items()}.get(tuple(ref_dir))
+    if axis:
+        d["ipf_stress_axis"] = d[f"ipf_cleaned_{axis}"]
+    else:
+        d["ipf_stress_axis"] = hexagonal_ipf_colors(
+            d["raw_eulers"], ref_dir, mask=d["mask"]
+        )
+
+    d["mtr_ipf"] = masked_image(d["ipf_cleaned_z"], mtr_mask)
+    d["stepsize"] = stepsize
 
     ind = np.sum(d["ipf_cleaned_z"], axis=2) > 0
     scan_area_pct = np.sum(ind.astype("uint8")) / (float(ind.shape[0]) * ind.shape[1])
@@ -388,11 +972,14 @@ def read_dream3d_file(d3d, ref_dir=[0, 0, 1], mtr_size=10000):
     d["scan_area_mm2"] = area
 
     # Calculate fraction alterred
-    elemwise_check = d["ipf_cleaned_z"] == d["ipf_raw_z"]
-    elemwise_delta = np.all(elemwise_check, axis=-1)
-    d["pixel_fraction_altered_by_cleanup"] = (
-        elemwise_delta.size - elemwise_delta.sum()
-    ) / elemwise_delta.size
+    if d["ipf_raw_z"] is None:
+        d["pixel_fraction_altered_by_cleanup"] = np.nan
+    else:
+        elemwise_check = d["ipf_cleaned_z"] == d["ipf_raw_z"]
+        elemwise_delta = np.all(elemwise_check, axis=-1)
+        d["pixel_fraction_altered_by_cleanup"] = (
+            elemwise_delta.size - elemwise_delta.sum()
+        ) / elemwise_delta.size
 
     return d
 
@@ -457,7 +1044,7 @@ def add_scalebar(d3d=None, length_pct=0.25, plot=False, rgb_image=None, stepsize
     w, h = rgb_image.size
 
     # assign font, size, color
-    fontsize = np.floor(0.03 * h).astype("int32")
+    fontsize = max(np.floor(0.03 * h).astype("int32"), 1)  # e.g. small regions of interest
     font = truetype(font_name, size=fontsize)
     # fill = np.random.choice(colors)
 
@@ -537,8 +1124,46 @@ def parse_args() -> Namespace:
         config_file_parser_class=YAMLConfigFileParser,
     )
 
-    p.add_argument('dream3d_file', help="Path to a single .dream3d file (required)")
-    p.add_argument("-o", "--output-dir", default=None, help="Results (sub)directory ")
+    p.add_argument(
+        "dream3d_file",
+        nargs="+",
+        help="Path(s) to .dream3d files, glob patterns, or directories of results "
+        "(DIR/*/*.dream3d) to analyze as a batch (required)",
+    )
+    p.add_argument(
+        "-o",
+        "--output-dir",
+        default=None,
+        help="Results (sub)directory [next to the .dream3d file]. {basename} will be "
+        "replaced by the .dream3d file name without extension.",
+    )
+    p.add_argument(
+        "-s",
+        "--summary-dir",
+        default=None,
+        help="Batch: directory for the combined campaign summary "
+        "[common parent directory of the .dream3d files]",
+    )
+    p.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=max(1, (os.cpu_count() or 2) // 2),
+        help="Batch: number of files analyzed in parallel [%(default)s]",
+    )
+    p.add_argument(
+        "--prefetch",
+        type=int,
+        default=2,
+        help="Batch: files read ahead of those being analyzed, "
+        "0 = off (and with --roi) [%(default)s]",
+    )
+    p.add_argument(
+        "--prefetch-memory",
+        type=float,
+        default=4.0,
+        help="Batch: max. memory (GiB) for files read ahead, 0 = no limit [%(default)s]",
+    )
 
     p.add_argument(
         "--min-mtr-size",
@@ -548,17 +1173,74 @@ def parse_args() -> Namespace:
     )
     p.add_argument(
         "--stress-axis",
-        choices=["100", "010", "001"],
+        type=axis_argument,
+        nargs="+",
         default=cfg["stress_axis"],
-        help="Stress axis direction (x='100', y='010', z='001') ['%(default)s']",
+        help="Stress axis direction: x='100', y='010', z='001', components "
+        "('0.3,0,0.95') or Euler angles of the coupon ('euler:phi1,Phi,phi2', deg). "
+        "Class area fractions are also written for any further axes ['%(default)s']",
+    )
+    p.add_argument(
+        "--worst-case-axis",
+        action="store_true",
+        help="Also search the loading direction maximizing the area fraction of "
+        "--worst-case-class MTRs",
+    )
+    p.add_argument(
+        "--worst-case-class",
+        default="Initiator",
+        help="MTR class of --worst-case-axis ['%(default)s']",
+    )
+    p.add_argument(
+        "--heatmaps",
+        type=float,
+        nargs="+",
+        metavar="UM",
+        help="Also write heatmaps of the MTR class area fractions and MTR intensity "
+        "over windows of these sizes, um",
+    )
+    p.add_argument(
+        "--no-correlations",
+        dest="correlations",
+        action="store_false",
+        help="Skip the two-point correlations and correlation lengths of the MTR classes",
+    )
+    p.add_argument(
+        "--spacing-radius",
+        type=float,
+        metavar="UM",
+        help="Also count the MTRs of each class within this distance of every MTR, um",
+    )
+    p.add_argument(
+        "--roi",
+        type=roi_argument,
+        metavar="X0,Y0,X1,Y1",
+        help="Analyze only this region of the scans, from the top left corner: "
+        "x (columns) and y (rows) ranges in um, or in pixels with a 'px' suffix",
+    )
+    p.add_argument(
+        "--mtr-class-edges",
+        type=float,
+        nargs="+",
+        default=cfg["mtr_class_edges"],
+        help="C-Axis misalignment bin edges (deg) for MTR classes %(default)s",
+    )
+    p.add_argument(
+        "--mtr-class-labels",
+        nargs="+",
+        default=cfg["mtr_class_labels"],
+        help="MTR class label for each bin %(default)s",
     )
 
     p.add_argument("-v", "--verbose", action="store_true")
     args = p.parse_args()
 
-    args.dream3d_file = os.path.abspath(os.path.expanduser(os.path.expandvars(args.dream3d_file)))
+    args.dream3d_file = find_dream3d_files(args.dream3d_file)
     if args.output_dir:
         args.output_dir = os.path.expanduser(os.path.expandvars(args.output_dir))
+    if args.summary_dir is None:
+        # e.g. parent for parent/*/*.dream3d, as the GUI does
+        args.summary_dir = os.path.commonpath([os.path.dirname(f) for f in args.dream3d_file])
 
     if args.verbose:
         print("Parsed Inputs:")
@@ -569,4 +1251,39 @@ def parse_args() -> Namespace:
 
 if __name__ == "__main__":
     args = parse_args()
-    analyzeData(args.dream3d_file, args.output_dir, args.stress_axis, args.min_mtr_size)
+    if len(args.dream3d_file) == 1:
+        output_dir = args.output_dir
+        if output_dir:
+            basename = os.path.basename(args.dream3d_file[0]).split(".dream3d")[0]
+            output_dir = output_dir.format(basename=basename)
+        analyzeData(
+            args.dream3d_file[0],
+            output_dir,
+            args.stress_axis,
+            args.min_mtr_size,
+            ClassScheme.from_config(args),
+            worst_case_axis=args.worst_case_axis,
+            worst_case_class=args.worst_case_class,
+            heatmap_windows=args.heatmaps,
+            correlations=args.correlations,
+            spacing_radius=args.spacing_radius,
+            roi=args.roi,
+        )
+    else:
+        analyzeBatch(
+            args.dream3d_file,
+            args.summary_dir,
+            args.output_dir,
+            args.workers,
+            prefetch=args.prefetch,
+            prefetch_memory=args.prefetch_memory * 2**30 or None,
+            stress_axis=args.stress_axis,
+            min_mtr_size=args.min_mtr_size,
+            mtr_classes=ClassScheme.from_config(args),
+            worst_case_axis=args.worst_case_axis,
+            worst_case_class=args.worst_case_class,
+            heatmap_windows=args.heatmaps,
+            correlations=args.correlations,
+            spacing_radius=args.spacing_radius,
+            roi=args.roi,
+        )
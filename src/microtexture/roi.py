@@ -0,0 +1,76 @@
+"""
+Regions of interest (e.g. the gauge section of a scan) for the analysis.
+
+A region is given as "x0,y0,x1,y1": the x (column) and y (row) ranges from
+the top left corner of the scan, in um, or in pixels with a "px" suffix
+("0,0,500,400px"). Only the matching hyperslab of the CellData maps is read
+(see h5io.CroppedFile), and the per-feature quantities are measured on the
+cropped label map (see features.FeatureTable.within).
+"""
+
+import re
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass(frozen=True)
+class ROI:
+    x0: float
+    y0: float
+    x1: float
+    y1: float
+    pixels: bool = False  # coordinates in pixels, else um
+
+    def slices(self, stepsize: float, shape) -> tuple[slice, slice]:
+        """
+        Rows and columns of a map (H, W, ...) with pixels of stepsize (um)
+        whose centers are within the region, clipped to the map.
+        Raises ValueError if there are none.
+        """
+        scale = 1 if self.pixels else 1 / stepsize
+        # pixel j spans [j, j + 1): its center is within [x0, x1) for j >= x0 - 0.5
+        c0, r0, c1, r1 = (
+            int(np.ceil(v * scale - 0.5)) for v in (self.x0, self.y0, self.x1, self.y1)
+        )
+        rows = slice(max(r0, 0), min(r1, shape[0]))
+        cols = slice(max(c0, 0), min(c1, shape[1]))
+        if rows.start >= rows.stop or cols.start >= cols.stop:
+            raise ValueError(f"Region of interest {self} is outside of the {shape[:2]} map")
+        return rows, cols
+
+    def __str__(self) -> str:
+        return ",".join(f"{v:g}" for v in (self.x0, self.y0, self.x1, self.y1)) + (
+            "px" if self.pixels else ""
+        )
+
+
+def parse_roi(value) -> ROI:
+    """ROI from "x0,y0,x1,y1" (um), "x0,y0,x1,y1px", an ROI or 4 numbers (um)"""
+    if isinstance(value, ROI):
+        return value
+    pixels = False
+    bounds = value
+    if isinstance(value, str):
+        text = value.strip().lower()
+        pixels = text.endswith("px")
+        text = re.sub(r"(px|um)$", "", text).strip("[]() ")
+        try:
+            bounds = [float(x) for x in re.split(r"[,\s]+", text)]
+        except ValueError:
+            bounds = []
+    bounds = np.asarray(bounds, dtype=np.float64)
+    if bounds.shape != (4,) or not (
+        np.isfinite(bounds).all() and bounds[0] < bounds[2] and bounds[1] < bounds[3]
+    ):
+        raise ValueError(
+            f"Invalid region of interest {value!r}, expected 'x0,y0,x1,y1' (um) "
+            "or 'x0,y0,x1,y1px' with x0 < x1 and y0 < y1"
+        )
+    return ROI(*bounds.tolist(), pixels=pixels)
+
+
+def roi_argument(value: str) -> str:
+    """argparse type of --roi: validated, kept as given"""
+    parse_roi(value)
+    return value
@@ -0,0 +1,180 @@
+"""
+Memory-aware scheduling of PipelineRunner jobs.
+
+PipelineRunner's peak memory grows with the number of pixels of a scan, which
+is read from the scan header (NCOLS_ODD / NCOLS_EVEN / NROWS in .ang files,
+XCells / YCells in .ctf files) before launching it. A linear MemoryModel,
+refitted on the peaks observed so far, estimates each job's needs, and the
+MemoryScheduler runs as many jobs at once as fit in a memory budget.
+"""
+
+import os
+import json
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+
+MiB = 2**20
+GiB = 2**30
+
+# Conservative defaults, until there are observed peaks to fit
+DEFAULT_BASE = 400 * MiB
+DEFAULT_PER_PIXEL = 600  # bytes
+MAX_SAMPLES = 200
+
+DEFAULT_MODEL_FILE = "~/.microtexture_memory.json"
+
+
+def _header_value(line: str) -> int | None:
+    try:
+        return int(line.replace(":", " ").split()[-1])
+    except (ValueError, IndexError):
+        return None
+
+
+def scan_pixels(path: str) -> int | None:
+    """
+    Number of pixels of a .ang / .ctf scan, read from its header.
+    None if the header doesn't tell.
+    """
+    keys = {}
+    with open(path, "r", errors="replace") as f:
+        for n, line in enumerate(f):
+            if n > 500:
+                break
+            words = line.lstrip("# \t").replace(":", " ").split()
+            if not words:
+                continue
+            key = words[0].upper()
+            if key in ("NCOLS_ODD", "NCOLS_EVEN", "NROWS", "XCELLS", "YCELLS"):
+                keys[key] = _header_value(line)
+            elif not line.startswith("#") and path.lower().endswith(".ang"):
+                break  # start of .ang data
+            elif key == "PHASE" and "X" in words:
+                break  # start of .ctf data
+
+    if keys.get("XCELLS") and keys.get("YCELLS"):
+        return keys["XCELLS"] * keys["YCELLS"]
+
+    odd, even, rows = (keys.get(k) for k in ("NCOLS_ODD", "NCOLS_EVEN", "NROWS"))
+    if odd and rows:
+        # hexagonal grids alternate odd / even rows, square grids have odd == even
+        even = even or odd
+        return odd * ((rows + 1) // 2) + even * (rows // 2)
+    return None
+
+
+def estimate_pixels(path: str) -> int:
+    """Pixels from the header, or from the file size (~ 80 bytes per pixel)"""
+    return scan_pixels(path) or os.path.getsize(path) // 80
+
+
+class MemoryModel:
+    """
+    Peak memory (bytes) = base + per_pixel * pixels, least-squares fit of
+    observed (pixels, peak) samples, shifted up to cover the worst residual.
+    Samples are kept in a JSON file (if path is given) across runs.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = os.path.expanduser(path) if path else None
+        self.samples = deque(maxlen=MAX_SAMPLES)  # (pixels, peak bytes)
+        self._lock = threading.Lock()
+        if self.path and os.path.isfile(self.path):
+            with open(self.path, "r", encoding="utf8") as f:
+                self.samples.extend(tuple(s) for s in json.load(f)["samples"])
+        self.fit()
+
+    def fit(self):
+        x, y = np.array(self.samples, dtype=float).reshape(-1, 2).T
+        if len(np.unique(x)) < 2:
+            self.base, self.per_pixel = DEFAULT_BASE, DEFAULT_PER_PIXEL
+            if len(x):  # single scan size: keep the default slope, move the intercept
+                self.base = max(0.0, float(np.max(y - self.per_pixel * x)))
+            return
+
+        slope, _ = np.polyfit(x, y, 1)
+        self.per_pixel = max(float(slope), 0.0)
+        self.base = float(np.max(y - self.per_pixel * x))
+
+    def estimate(self, pixels: int) -> float:
+        return self.base + self.per_pixel * pixels
+
+    def record(self, pixels: int, peak: float):
+        """Add an observed peak, refit and save the model"""
+        with self._lock:
+            self.samples.append((int(pixels), int(peak)))
+            self.fit()
+            if self.path:
+                tmp = self.path + ".tmp"
+                with open(tmp, "w", encoding="utf8") as f:
+                    json.dump({"samples": list(self.samples)}, f)
+                os.replace(tmp, self.path)
+
+
+class MemoryScheduler:
+    """
+    Run jobs concurrently (threads, each waiting on a PipelineRunner process)
+    while the sum of their estimated peaks stays within max_memory (bytes).
+    Whenever a job ends, the largest waiting jobs that fit are started
+    (first-fit decreasing). A job larger than the whole budget runs alone.
+    Jobs therefore start largest first rather than in input order, and end
+    (and are reported) in any order.
+    """
+
+    def __init__(self, model: MemoryModel, max_memory: float, max_jobs: int = None):
+        self.model = model
+        self.max_memory = max_memory
+        self.max_jobs = max_jobs or os.cpu_count() or 1
+
+    def run(self, items, produce, pixels=estimate_pixels, name=str):
+        """
+        Call produce(item) for every item, yield (item, error or None) as jobs end
+        (not in the order of items, see above).
+        pixels(item) gives the size of the scan, name(item) a label for messages.
+        produce returns the observed peak memory (bytes) or None.
+        Jobs are only started while the caller iterates (back-pressure).
+        """
+        waiting = sorted(
+            ((item, pixels(item)) for item in items),
+            key=lambda x: self.model.estimate(x[1]),
+            reverse=True,
+        )
+        running = {}  # future: (item, pixels, estimate)
+
+        with ThreadPoolExecutor(max_workers=self.max_jobs) as pool:
+            while waiting or running:
+                used = sum(e for _, _, e in running.values())
+                still_waiting = []
+                for item, n in waiting:
+                    estimate = self.model.estimate(n)
+                    fits = used + estimate <= self.max_memory or not running
+                    if len(running) >= self.max_jobs or not fits:
+                        still_waiting.append((item, n))
+                        continue
+                    if estimate > self.max_memory:
+                        print(
+                            f"Warning: {name(item)} may need {estimate / GiB:.1f} GiB, "
+                            f"more than --max-memory ({self.max_memory / GiB:.1f} GiB)"
+                        )
+                    running[pool.submit(self._run, produce, item, n)] = (item, n, estimate)
+                    used += estimate
+                waiting = still_waiting
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item, _, _ = running.pop(future)
+                    yield item, future.exception()
+
+    def _run(self, produce, item, pixels):
+        t0 = time.perf_counter()
+        peak = produce(item)
+        if peak:
+            self.model.record(pixels, peak)
+            print(
+                f"PipelineRunner peak memory {peak / MiB:.0f} MiB for {pixels} pixels "
+                f"in {time.perf_counter() - t0:.1f} s"
+            )
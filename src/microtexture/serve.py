@@ -0,0 +1,442 @@
+#! /usr/bin/env python
+"""
+Local HTTP job service: python -m microtexture serve [--port 8765] [-j WORKERS]
+
+Jobs take the same parameters as the command line interface (cli.parse_args),
+and run on a single, shared pool of warm worker processes (workers.WorkerPool), so that several users
+of a workstation don't compete with uncoordinated PipelineRunner instances.
+The PipelineRunner, pipeline template, config file and --overwrite are the
+server's own (clients can't set them), and job output directories are
+relative to the server's --output-root, and must stay within it.
+
+    POST   /jobs                    {"argv": ["scan.ang", "--min-mtr-size", "5000"]}
+                                    or {"input_file": "/abs/scan.ang", "min_mtr_size": 5000}
+    GET    /jobs                    all jobs
+    GET    /jobs/<id>               job status
+    DELETE /jobs/<id>               cancel a queued job
+    GET    /jobs/<id>/results       output files of a job
+    GET    /jobs/<id>/results/<f>   download an output file
+    GET    /status                  pool / queue summary
+
+The CLI acts as a client with --server URL (or $MICROTEXTURE_SERVER).
+"""
+
+import os
+import json
+import time
+import shutil
+import itertools
+import threading
+import urllib.request
+import urllib.error
+from argparse import ArgumentParser
+from collections import deque
+from functools import partial
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from configargparse import Namespace
+
+from .cli import get_parser, check_args, process
+from .workers import WorkerPool, DEFAULT_MAX_JOBS_PER_WORKER
+
+DEFAULT_PORT = 8765
+DEFAULT_OUTPUT_ROOT = "~/microtexture_jobs"
+_DERIVED = ("json_path", "basename", "extension", "server", "config")
+# Options from the server's configuration only, rejected in job requests
+SERVER_OPTIONS = ("config", "pipeline_runner", "pipeline_template", "overwrite")
+
+
+def run_job(args: Namespace) -> float:
+    """Worker: process a single scan, return run time in seconds"""
+    t0 = time.perf_counter()
+    process(args)
+    return time.perf_counter() - t0
+
+
+def options_argv(parser, params: dict) -> list[str]:
+    """Command line for option values {dest: value}, to be parsed (and typed) by parser"""
+    actions = {a.dest: a for a in parser._actions if a.option_strings}
+    unknown = set(params) - set(actions)
+    if unknown:
+        raise ValueError(f"Unknown job parameter(s): {', '.join(sorted(unknown))}")
+
+    argv = []
+    for dest, value in params.items():
+        action = actions[dest]
+        option = action.option_strings[-1]
+        if value is None:
+            continue
+        if action.nargs == 0:  # flags, e.g. store_true
+            if value == action.const:
+                argv.append(option)
+        elif action.nargs in ("+", "*"):
+            values = value if isinstance(value, (list, tuple)) else [value]
+            argv += [option] + [str(v) for v in values]
+        else:
+            argv.append(f"{option}={value}")
+    return argv
+
+
+def _config_option(arg: str) -> bool:
+    """
+    Whether a command line argument gives a config file: -c PATH, -cPATH,
+    --config=PATH or an abbreviation of it (e.g. --conf PATH), as configargparse
+    reads them
+    """
+    name = arg.split("=", 1)[0]
+    if name.startswith("--"):
+        return len(name) > 2 and "--config".startswith(name)
+    return name.startswith("-c")
+
+
+def job_args(params: dict, output_root: str = DEFAULT_OUTPUT_ROOT) -> Namespace:
+    """
+    Validated CLI arguments from a job request (argv list or option values),
+    parsed as a command line. Raises ValueError for options that only the
+    server sets (SERVER_OPTIONS) or an output directory outside output_root.
+    Config files are rejected before parsing, so the server never opens them.
+    """
+    p = get_parser()
+    p.add_argument("input_file")
+
+    try:
+        if "argv" in params:
+            argv = [str(a) for a in params["argv"]]
+        else:
+            options = {k: v for k, v in params.items() if k not in _DERIVED + ("input_file",)}
+            argv = [str(params["input_file"])] + options_argv(p, options)
+        if "config" in params or any(_config_option(a) for a in argv):
+            raise ValueError("Job parameter(s) set by the server only: config")
+        args = p.parse_args(argv)
+        defaults = p.parse_args([args.input_file])
+    except SystemExit:
+        raise ValueError(f"Invalid job arguments: {params}")
+    except KeyError:
+        raise ValueError("Job requires 'argv' or 'input_file'")
+
+    forbidden = [k for k in SERVER_OPTIONS if getattr(args, k) != getattr(defaults, k)]
+    if forbidden:
+        raise ValueError(f"Job parameter(s) set by the server only: {', '.join(forbidden)}")
+
+    root = os.path.realpath(os.path.expanduser(output_root))
+    args.output_dir = os.path.join(root, args.output_dir)
+    args.server = None  # run here, even with $MICROTEXTURE_SERVER set
+    args = check_args(args)
+    if not os.path.realpath(args.output_dir).startswith(root + os.sep):
+        raise ValueError(f"Output directory {args.output_dir} is outside of {root}")
+    return args
+
+
+class Job:
+
+    def __init__(self, job_id: str, args: Namespace):
+        self.id = job_id
+        self.args = args
+        self.future = None  # set once the job is handed to a worker
+        self.cancelled = False
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+
+    @property
+    def status(self) -> str:
+        f = self.future
+        if self.cancelled:
+            return "cancelled"
+        if f is None:
+            return "queued"
+        if not f.done():
+            return "running"
+        if f.cancelled():  # e.g. by JobManager.shutdown
+            return "cancelled"
+        return "failed" if f.exception() else "done"
+
+    def results(self) -> list[str]:
+        """Output files, relative to the job's output directory"""
+        root = self.args.output_dir
+        if not os.path.isdir(root):
+            return []
+        return sorted(
+            os.path.relpath(os.path.join(d, f), root)
+            for d, _, files in os.walk(root)
+            for f in files
+        )
+
+    def to_dict(self) -> dict:
+        d = dict(
+            id=self.id,
+            status=self.status,
+            input_file=self.args.input_file,
+            output_dir=self.args.output_dir,
+            submitted=self.submitted,
+            started=self.started,
+            finished=self.finished,
+        )
+        if self.status == "failed":
+            e = self.future.exception()
+            d["error"] = f"{type(e).__name__}: {e}"
+        elif self.status == "done":
+            d["runtime"] = self.future.result()
+        return d
+
+
+class JobManager:
+    """
+    Shared pool of workers, with at most max_jobs queued or running jobs.
+    Jobs are handed to the pool only when a worker is free, in FIFO order.
+    """
+
+    def __init__(
+        self,
+        workers: int = 1,
+        max_jobs: int = 64,
+        max_jobs_per_worker: int = DEFAULT_MAX_JOBS_PER_WORKER,
+        output_root: str = DEFAULT_OUTPUT_ROOT,
+    ):
+        self.pool = WorkerPool(workers, max_jobs_per_worker, prestart=False)
+        self.output_root = output_root
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self.jobs = {}
+        self.queue = deque()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def active(self) -> list[Job]:
+        return [j for j in self.jobs.values() if j.status in ("queued", "running")]
+
+    def submit(self, params: dict) -> Job:
+        args = job_args(params, self.output_root)
+        with self._lock:
+            if len(self.active()) >= self.max_jobs:
+                raise OverflowError(f"Job queue is full ({self.max_jobs} jobs)")
+            job = Job(str(next(self._ids)), args)
+            self.jobs[job.id] = job
+            self.queue.append(job)
+            self._dispatch()
+        print(f"Job {job.id} submitted: {args.input_file}")
+        return job
+
+    def cancel(self, job: Job) -> bool:
+        """Cancel a queued job; running jobs can't be cancelled"""
+        with self._lock:
+            if job not in self.queue:
+                return False
+            self.queue.remove(job)
+            job.cancelled = True
+            job.finished = time.time()
+        return True
+
+    def _dispatch(self):
+        """Start queued jobs on free workers (call with self._lock held)"""
+        running = sum(j.status == "running" for j in self.jobs.values())
+        while self.queue and running < self.workers:
+            job = self.queue.popleft()
+            job.started = time.time()
+            job.future = self.pool.submit(run_job, job.args)
+            job.future.add_done_callback(partial(self._done, job))
+            running += 1
+
+    def _done(self, job: Job, _):
+        job.finished = time.time()
+        with self._lock:
+            self._dispatch()
+
+    def status(self) -> dict:
+        counts = {}
+        for job in self.jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return dict(
+            workers=self.workers,
+            max_jobs=self.max_jobs,
+            max_jobs_per_worker=self.pool.max_jobs_per_worker,
+            worker_pids=self.pool.pids(),
+            jobs=counts,
+        )
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    manager: JobManager = None  # set by serve()
+
+    def _send(self, code: int, body):
+        data = json.dumps(body, indent=4).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _job(self, job_id: str) -> Job | None:
+        job = self.manager.jobs.get(job_id)
+        if job is None:
+            self._send(404, {"error": f"No such job: {job_id}"})
+        return job
+
+    def do_GET(self):
+        parts = self.path.strip("/").split("/", 3)
+
+        if parts == ["status"]:
+            return self._send(200, self.manager.status())
+        if parts == ["jobs"]:
+            return self._send(200, [j.to_dict() for j in self.manager.jobs.values()])
+        if len(parts) < 2 or parts[0] != "jobs" or parts[2:3] not in ([], ["results"]):
+            return self._send(404, {"error": f"Not found: {self.path}"})
+
+        job = self._job(parts[1])
+        if job is None:
+            return
+        if len(parts) == 2:
+            return self._send(200, job.to_dict())
+        if len(parts) == 3:
+            return self._send(200, job.results())
+
+        root = os.path.realpath(job.args.output_dir)
+        path = os.path.realpath(os.path.join(root, parts[3]))
+        if not path.startswith(root + os.sep) or not os.path.isfile(path):
+            return self._send(404, {"error": f"No such result: {parts[3]}"})
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(os.path.getsize(path)))
+        self.end_headers()
+        with open(path, "rb") as f:
+            shutil.copyfileobj(f, self.wfile)
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/jobs":
+            return self._send(404, {"error": f"Not found: {self.path}"})
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            params = json.loads(self.rfile.read(length) or b"{}")
+            job = self.manager.submit(params)
+        except OverflowError as e:
+            return self._send(429, {"error": str(e)})
+        except (ValueError, TypeError, FileNotFoundError, PermissionError) as e:
+            return self._send(400, {"error": f"{type(e).__name__}: {e}"})
+        self._send(201, job.to_dict())
+
+    def do_DELETE(self):
+        parts = self.path.strip("/").split("/")
+        if len(parts) != 2 or parts[0] != "jobs":
+            return self._send(404, {"error": f"Not found: {self.path}"})
+        if job := self._job(parts[1]):
+            if not self.manager.cancel(job):
+                return self._send(409, {"error": f"Job {job.id} is {job.status}"})
+            self._send(200, job.to_dict())
+
+
+def serve(
+    host: str = "127.0.0.1",
+    port: int = DEFAULT_PORT,
+    workers: int = 1,
+    max_jobs: int = 64,
+    max_jobs_per_worker: int = DEFAULT_MAX_JOBS_PER_WORKER,
+    output_root: str = DEFAULT_OUTPUT_ROOT,
+):
+    manager = JobManager(workers, max_jobs, max_jobs_per_worker, output_root)
+    handler = type("Handler", (JobRequestHandler,), {"manager": manager})
+    server = ThreadingHTTPServer((host, port), handler)
+
+    try:
+        print(f"Starting {workers} worker(s)...")
+        manager.pool.prestart()
+        print(f"Serving microtexture jobs on http://{host}:{port} ({workers} worker(s))")
+        print(f"Job outputs in: {os.path.realpath(os.path.expanduser(output_root))}")
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopping, waiting for running jobs to finish...")
+    finally:
+        server.server_close()
+        manager.shutdown()
+
+
+# Client ------------------------------------------------------------------
+
+
+def _request(url: str, method: str = "GET", body: dict = None):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(
+        url, data=data, method=method, headers={"Content-Type": "application/json"}
+    )
+    try:
+        with urllib.request.urlopen(req) as r:
+            return json.load(r)
+    except urllib.error.HTTPError as e:
+        raise RuntimeError(f"{url}: {json.load(e).get('error', e.reason)}") from None
+
+
+def submit_job(server: str, args: Namespace) -> dict:
+    """
+    Submit already parsed CLI arguments to a job server. The output directory
+    is sent relative to the current directory: the server resolves it in its
+    output root.
+    """
+    params = {
+        k: v for k, v in vars(args).items() if k not in _DERIVED + SERVER_OPTIONS
+    }
+    params["output_dir"] = os.path.relpath(args.output_dir)
+    return _request(server.rstrip("/") + "/jobs", "POST", params)
+
+
+def wait_for_job(server: str, job_id: str, interval: float = 2.0) -> dict:
+    """Poll a job until it is no longer queued / running"""
+    url = f"{server.rstrip('/')}/jobs/{job_id}"
+    status = None
+    while True:
+        job = _request(url)
+        if job["status"] != status:
+            status = job["status"]
+            print(f"Job {job_id}: {status}")
+        if status not in ("queued", "running"):
+            return job
+        time.sleep(interval)
+
+
+def main(argv: list[str] = None):
+    p = ArgumentParser(
+        prog="python -m microtexture serve",
+        description="Local HTTP service running microtexture jobs on a shared pool",
+    )
+    p.add_argument("--host", default="127.0.0.1", help="Bind address [%(default)s]")
+    p.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port [%(default)s]")
+    p.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=max(1, (os.cpu_count() or 2) // 2),
+        help="Parallel jobs [%(default)s]",
+    )
+    p.add_argument(
+        "--max-jobs",
+        type=int,
+        default=64,
+        help="Max. queued + running jobs before rejecting new ones [%(default)s]",
+    )
+    p.add_argument(
+        "--max-jobs-per-worker",
+        type=int,
+        default=DEFAULT_MAX_JOBS_PER_WORKER,
+        help="Replace worker processes after this many jobs, 0 = never [%(default)s]",
+    )
+    p.add_argument(
+        "--output-root",
+        default=DEFAULT_OUTPUT_ROOT,
+        help="Directory of the job output directories, which clients can't leave "
+        "[%(default)s]",
+    )
+    args = p.parse_args(argv)
+    serve(
+        args.host,
+        args.port,
+        args.workers,
+        args.max_jobs,
+        args.max_jobs_per_worker,
+        args.output_root,
+    )
+
+
+if __name__ == "__main__":
+    main()
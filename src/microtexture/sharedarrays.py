@@ -0,0 +1,143 @@
+"""
+Shared-memory transport of large arrays between processes.
+
+Passing full-resolution maps (IPF images, MTR ID maps, c-axes...) to a worker
+process pickles a copy of them for every task. Instead, the owner places each
+array once in a multiprocessing.shared_memory segment (SharedArrays.share) and
+sends workers a SharedArray descriptor (segment name, shape, dtype: a few
+bytes), which they map without copying (attached).
+
+Segments are freed by the owner: on release / close (or when the registry is
+garbage collected), and by multiprocessing's resource tracker if the owner
+dies without doing so. Workers only map segments, so a worker crash leaves
+nothing behind.
+"""
+
+import sys
+import weakref
+from contextlib import contextmanager
+from dataclasses import dataclass
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+# Handles whose arrays were still referenced when their with block ended
+_lingering = []
+# Names of the segments created (and tracked) by this process
+_owned = set()
+
+
+@dataclass(frozen=True)
+class SharedArray:
+    """Picklable descriptor of an array in a shared memory segment"""
+
+    name: str
+    shape: tuple
+    dtype: str
+
+    def view(self, shm: SharedMemory, writeable: bool = False) -> np.ndarray:
+        arr = np.ndarray(self.shape, dtype=np.dtype(self.dtype), buffer=shm.buf)
+        arr.flags.writeable = writeable
+        return arr
+
+
+def _unlink(segments: dict):
+    for shm in segments.values():
+        shm.close()
+        shm.unlink()
+        _owned.discard(shm.name)
+    segments.clear()
+
+
+class SharedArrays:
+    """
+    Registry of the shared memory segments created by this (owner) process.
+    Use as a context manager, or call close(), to free them all.
+    """
+
+    def __init__(self):
+        self._segments = {}  # name: SharedMemory
+        self._finalizer = weakref.finalize(self, _unlink, self._segments)
+
+    def share(self, array) -> SharedArray:
+        """Copy array to a new shared memory segment"""
+        array = np.ascontiguousarray(array)
+        shm = SharedMemory(create=True, size=max(array.nbytes, 1))
+        desc = SharedArray(shm.name, array.shape, array.dtype.str)
+        desc.view(shm, writeable=True)[...] = array
+        self._segments[shm.name] = shm
+        _owned.add(shm.name)
+        return desc
+
+    def share_all(self, arrays: dict) -> dict:
+        """{key: SharedArray} for a dict of arrays"""
+        return {key: self.share(a) for key, a in arrays.items()}
+
+    def release(self, descriptors):
+        """Free the segments of a SharedArray, or of a list / dict of them"""
+        if isinstance(descriptors, SharedArray):
+            descriptors = [descriptors]
+        elif isinstance(descriptors, dict):
+            descriptors = descriptors.values()
+        _unlink({d.name: self._segments.pop(d.name) for d in descriptors})
+
+    @property
+    def nbytes(self) -> int:
+        return sum(shm.size for shm in self._segments.values())
+
+    def __len__(self) -> int:
+        return len(self._segments)
+
+    def close(self):
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _close(handles: list):
+    """Close segment handles, keeping those with arrays still in use for later"""
+    for shm in handles:
+        try:
+            shm.close()
+        except BufferError:
+            _lingering.append(shm)
+
+
+def _attach(name: str) -> SharedMemory:
+    """
+    Map an existing segment without registering it with this process's resource
+    tracker, which would otherwise unlink it when the worker exits
+    """
+    if sys.version_info >= (3, 13):
+        return SharedMemory(name=name, track=False)
+    shm = SharedMemory(name=name)
+    if name not in _owned:  # the owner's registration is left as is
+        resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+@contextmanager
+def attached(descriptors: dict, writeable: bool = False):
+    """
+    Map a dict of SharedArray descriptors to a dict of arrays (read-only unless
+    writeable), valid within the with block, at the end of which it is emptied:
+
+        with attached(shared) as arrays:
+            ...
+    """
+    arrays, handles = {}, []
+    try:
+        for key, desc in descriptors.items():
+            handles.append(_attach(desc.name))
+            arrays[key] = desc.view(handles[-1], writeable)
+        yield arrays
+    finally:
+        arrays.clear()
+        lingering = _lingering[:]
+        _lingering.clear()
+        _close(lingering + handles)
@@ -0,0 +1,58 @@
+"""
+Spacing of MTRs by class, e.g. the distance from each Initiator MTR to the
+nearest Hard MTR, from the centroids of the MTRs.
+
+A k-d tree (scipy.spatial.cKDTree) is built over the centroids of the MTRs of
+each class, and queried for all MTRs at once, so that the distances of every
+pair of classes cost O(n log n) rather than O(n^2). An MTR is not its own
+neighbor: within its own class, its nearest neighbor is the next MTR.
+"""
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+def class_trees(points, codes, n_classes: int) -> list:
+    """k-d trees (None for absent classes) of the points (n, d) of each class code"""
+    points, codes = np.asarray(points, dtype=np.float64), np.asarray(codes)
+    return [
+        cKDTree(points[codes == c]) if np.any(codes == c) else None for c in range(n_classes)
+    ]
+
+
+def nearest_distances(points, codes, n_classes: int, trees=None) -> np.ndarray:
+    """
+    Distance (n, n_classes) from each point (n, d) to the nearest other point
+    of every class, NaN if there is none
+    """
+    points, codes = np.asarray(points, dtype=np.float64), np.asarray(codes)
+    if trees is None:
+        trees = class_trees(points, codes, n_classes)
+    distances = np.full((len(points), n_classes), np.nan)
+    for c, tree in enumerate(trees):
+        if tree is None:
+            continue
+        # nearest and second nearest (for the points of the class) of the tree
+        nearest, _ = tree.query(points, k=[1, 2] if tree.n > 1 else [1])
+        own = codes == c
+        distances[~own, c] = nearest[~own, 0]
+        if tree.n > 1:
+            distances[own, c] = nearest[own, 1]
+    return distances
+
+
+def neighbor_counts(points, codes, n_classes: int, radius: float, trees=None) -> np.ndarray:
+    """
+    Number (n, n_classes) of other points of every class within radius of
+    each point (n, d)
+    """
+    points, codes = np.asarray(points, dtype=np.float64), np.asarray(codes)
+    if trees is None:
+        trees = class_trees(points, codes, n_classes)
+    counts = np.zeros((len(points), n_classes), dtype=np.int64)
+    for c, tree in enumerate(trees):
+        if tree is None:
+            continue
+        counts[:, c] = tree.query_ball_point(points, radius, return_length=True)
+        counts[codes == c, c] -= 1  # not the point itself
+    return counts
@@ -1,5 +1,129 @@
+import os
+import tempfile
 import unittest
 
+import numpy as np
+
+
+def make_dream3d(path, ids, step=1.0, caxes=None, ipf=True):
+    """
+    Write a minimal synthetic .dream3d file for the label map ids (H x W, 0 = background)
+    with optional feature c-axes (n+1 x 3). Neighbors / shared lengths follow from ids.
+    ipf=False leaves out the IPF color arrays.
+    """
+    import h5py
+    n = ids.max() + 1
+    counts = np.bincount(ids.ravel(), minlength=n)
+    if caxes is None:
+        caxes = np.tile(np.float32([0, 0, 1]), (n, 1))
+    neighbors = [dict() for _ in range(n)]
+    for a, b in ((ids[:, :-1], ids[:, 1:]), (ids[:-1], ids[1:])):
+        edge = (a != b) & (a > 0) & (b > 0)
+        for u, v in zip(a[edge], b[edge]):
+            neighbors[u][v] = neighbors[u].get(v, 0) + step
+            neighbors[v][u] = neighbors[v].get(u, 0) + step
+    colors = np.where(ids[..., None] > 0, 128, 0).repeat(3, axis=-1).astype('uint8')
+    rows, cols = np.indices(ids.shape)
+    with np.errstate(invalid='ignore'):
+        centroids = np.stack([
+            (np.bincount(ids.ravel(), weights=c.ravel() + 0.5, minlength=n) / counts) * step
+            for c in (cols, rows)
+        ] + [np.zeros(n)], axis=-1)
+    cell = {
+        'MTRIds': ids[None, :, :, None].astype('int32'),
+        'Mask': (ids > 0)[None, :, :, None].astype('uint8'),
+        'Raw_CAxes': caxes[ids][None].astype('float32'),
+        'EulerAngles': np.zeros((1,) + ids.shape + (3,), 'float32'),
+        'AvgEulerAngles': np.zeros((1,) + ids.shape + (3,), 'float32'),
+    }
+    for ax in 'XYZ' if ipf else '':
+        for kind in ('Raw', 'Cleaned', 'Average', 'MTR'):
+            cell[f'IPF_{kind}_{ax}'] = colors[None]
+    feature = {
+        'AvgEuler': np.zeros((n, 3), 'float32'),
+        'AvgCAxes': np.asarray(caxes, 'float32'),
+        'Phases': np.ones((n, 1), 'int32'),
+        'NumNeighbors2': np.array([[len(x)] for x in neighbors], 'int32'),
+        'NeighborList2': np.array([k for x in neighbors for k in sorted(x)], 'int32'),
+        'SharedSurfaceAreaList2': np.array([x[k] for x in neighbors for k in sorted(x)], 'float32'),
+        'EquivalentDiameters': np.sqrt(4 * counts * step**2 / np.pi)[:, None].astype('float32'),
+        'NumCells': counts[:, None].astype('int32'),
+        'Volumes': (counts * step**2)[:, None].astype('float32'),
+        'Centroids': np.nan_to_num(centroids).astype('float32'),
+        'FeatureAvgCAxisMisorientations': np.full((n, 1), 5, 'float32'),
+    }
+    with h5py.File(path, 'w') as f:
+        for name, arr in cell.items():
+            f[f'DataContainers/ImageDataContainer/CellData/{name}'] = arr
+        for name, arr in feature.items():
+            f[f'DataContainers/ImageDataContainer/CellFeatureData/{name}'] = arr
+
+
+def make_mtr_scan(path, step=0.5):
+    """
+    Write a synthetic scan of 3 MTRs over the columns 0-20, 20-45 and 45-60 of a
+    40 x 60 map, with c-axes along z, z and x (Hard, Hard and Soft for a stress
+    axis along z). The pixel c-axes of every other row are 10 deg off those of
+    their MTR: 5 deg mean misorientations.
+    """
+    import h5py
+    ids = np.zeros((40, 60), dtype='int32')
+    ids[:, :20], ids[:, 20:45], ids[:, 45:] = 1, 2, 3
+    make_dream3d(path, ids, step=step, caxes=np.float32([[0, 0, 1], [0, 0, 1], [0, 0, 1], [1, 0, 0]]))
+    with h5py.File(path, 'r+') as f:
+        pixels = f['DataContainers/ImageDataContainer/CellData/Raw_CAxes']
+        c, s = np.cos(np.radians(10)), np.sin(np.radians(10))
+        pixels[0, 1::2] = pixels[0, 1::2] @ np.float32([[c, 0, -s], [0, 1, 0], [s, 0, c]])
+
+
+# Options of the analysis of make_mtr_scan shared by the tests of its outputs
+SCAN_OPTIONS = dict(
+    stress_axis=['001', '0.5,0,0.8'],
+    min_mtr_size=20,
+    worst_case_axis=True,
+    heatmap_windows=[5, 12.5],
+    spacing_radius=15,
+)
+_scans = {}  # options: (temporary directory, results) of analyze_scan
+
+
+def analyze_scan(**options):
+    """
+    Output directory and results of analyzeData with options on a make_mtr_scan
+    file, run once for all the tests that check them
+    """
+    key = repr(sorted(options.items()))
+    if key not in _scans:
+        import warnings
+        from .postprocess import analyzeData
+        tmpdir = tempfile.TemporaryDirectory()
+        path = os.path.join(tmpdir.name, 'scan.dream3d')
+        make_mtr_scan(path)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            _scans[key] = tmpdir, analyzeData(path, **options)
+    tmpdir, results = _scans[key]
+    return tmpdir.name, results
+
+
+def tearDownModule():
+    for tmpdir, _ in _scans.values():
+        tmpdir.cleanup()
+    _scans.clear()
+
+
+def imported(module):
+    """Whether module was imported in this process (run on pool workers)"""
+    import sys
+    return os.getpid(), module in sys.modules
+
+
+def shared_sums(shared):
+    """Sum of each array placed in shared memory (run on pool workers)"""
+    from .sharedarrays import attached
+    with attached(shared) as arrays:
+        return {key: float(a.sum()) for key, a in arrays.items()}
+
 
 class UnitTests(unittest.TestCase):
     """
@@ -27,5 +151,1029 @@ class UnitTests(unittest.TestCase):
         self.assertEqual(len(files), len(self.app.file_paths))
 
 
+class H5IOTests(unittest.TestCase):
+    """
+    Memory-mapped access to .dream3d (HDF5) datasets
+    """
+
+    def setUp(self):
+        import h5py
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'test.dream3d')
+        self.data = np.arange(2 * 3 * 4, dtype='float32').reshape(1, 2, 3, 4)
+        with h5py.File(self.path, 'w') as f:
+            f.create_dataset('contiguous', data=self.data)
+            f.create_dataset('compressed', data=self.data, chunks=True, compression='gzip')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_memmap(self):
+        from .h5io import MappedFile
+        with MappedFile(self.path) as f:
+            view = f['contiguous']
+            fallback = f['compressed']
+            self.assertIsInstance(view, np.memmap)
+            self.assertNotIsInstance(fallback, np.memmap)
+            np.testing.assert_array_equal(fallback[0, :, :, 0], self.data[0, :, :, 0])
+        np.testing.assert_array_equal(view[0, :, :, 0], self.data[0, :, :, 0])
+
+    def test_no_mmap(self):
+        from .h5io import MappedFile
+        with MappedFile(self.path, mmap=False) as f:
+            self.assertNotIsInstance(f['contiguous'], np.memmap)
+
+    def test_prefetch(self):
+        import shutil
+        from .h5io import Prefetcher, datasets_nbytes
+        paths = [os.path.join(self.tmpdir.name, f'{i}.dream3d') for i in range(4)]
+        for path in paths:
+            shutil.copy(self.path, path)
+        paths.insert(2, os.path.join(self.tmpdir.name, 'missing.dream3d'))
+        nbytes = datasets_nbytes(self.path, ['contiguous', '/compressed', 'absent'])
+        self.assertEqual(nbytes, 2 * self.data.nbytes)
+
+        # Budget for one file and a half: read one file ahead at a time
+        prefetcher = Prefetcher(paths, ['contiguous', '/compressed'], depth=3, max_bytes=1.5 * nbytes)
+        seen = []
+        for path, data in prefetcher:
+            self.assertLessEqual(sum(prefetcher._held.values()), 1.5 * nbytes)
+            seen.append(path)
+            if data is None:
+                continue
+            np.testing.assert_array_equal(data['/compressed'], self.data)
+            self.assertIn('contiguous', data)
+            with self.assertRaises(KeyError):
+                data['absent']
+        self.assertEqual(seen, paths)
+        self.assertEqual([d is None for _, d in Prefetcher(paths, ['contiguous'])], [0, 0, 1, 0, 0])
+
+
+class FeatureTableTests(unittest.TestCase):
+    """
+    Per-feature struct-of-arrays with CSR neighbor lists
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'test.dream3d')
+        ids = np.zeros((6, 9), dtype='int32')
+        ids[:, :3], ids[:, 3:6], ids[:3, 6:], ids[3:, 6:] = 1, 2, 3, 4
+        make_dream3d(self.path, ids)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_csr(self):
+        from .h5io import MappedFile
+        from .features import FeatureTable
+        with MappedFile(self.path) as f:
+            table = FeatureTable.from_dream3d(f)
+        self.assertEqual(len(table), 4)
+        self.assertEqual(table.volumes.dtype, np.float32)
+        np.testing.assert_array_equal(table.num_neighbors, [1, 3, 2, 2])
+        ids, shared = table.neighbors(1)
+        np.testing.assert_array_equal(ids, [1, 3, 4])
+        np.testing.assert_array_equal(shared, [6, 3, 3])
+
+    def test_take(self):
+        from .h5io import MappedFile
+        from .features import FeatureTable
+        with MappedFile(self.path) as f:
+            table = FeatureTable.from_dream3d(f)
+        subset = table.take(np.array([3, 1])).with_classes([1, -1], ('A', 'B'))
+        np.testing.assert_array_equal(subset.ids, [4, 2])
+        np.testing.assert_array_equal(subset.neighbors(0)[0], [2, 3])
+        np.testing.assert_array_equal(subset.neighbors(1)[0], [1, 3, 4])
+        self.assertEqual(list(subset.classes), ['B', None])
+
+
+class NeighborGraphTests(unittest.TestCase):
+    """
+    MTR adjacency / clustering on the CSR neighbor graph
+    """
+
+    def setUp(self):
+        from .h5io import MappedFile
+        from .features import FeatureTable
+        from .neighbors import NeighborGraph
+        tmpdir = tempfile.TemporaryDirectory()
+        path = os.path.join(tmpdir.name, 'test.dream3d')
+        ids = np.zeros((6, 9), dtype='int32')
+        ids[:, :3], ids[:, 3:6], ids[:3, 6:], ids[3:, 6:] = 1, 2, 3, 4
+        make_dream3d(path, ids)
+        with MappedFile(path) as f:
+            self.table = FeatureTable.from_dream3d(f)
+        tmpdir.cleanup()
+        self.graph = NeighborGraph.from_table(self.table)
+        # features 1 & 2 'A', 3 'B', 4 unclassified
+        self.codes = self.graph.class_codes(self.table.with_classes([0, 0, 1, -1], 'AB'))
+
+    def test_class_pairs(self):
+        pairs = self.graph.class_pairs(self.codes, 'AB')
+        self.assertEqual(list(pairs['Boundaries']), [1, 1, 0])
+        self.assertEqual(list(pairs['Shared Length, um']), [6, 3, 0])
+
+    def test_queries(self):
+        np.testing.assert_array_equal(self.graph.degree(self.codes), [0, 1, 2, 1, 2])
+        np.testing.assert_array_equal(self.graph.shared_length(self.codes, 0, 1), [0, 0, 3, 3, 0])
+        np.testing.assert_array_equal(self.graph.clusters(self.codes), [-1, 0, 0, 1, -1])
+        areas = np.r_[0, self.table.volumes]
+        np.testing.assert_array_equal(self.graph.cluster_areas(self.codes, areas), [0, 36, 36, 9, 0])
+
+
+class ClassSchemeTests(unittest.TestCase):
+    """
+    MTR classification by c-axis misalignment
+    """
+
+    def test_default(self):
+        from .classify import ClassScheme
+        scheme = ClassScheme()
+        self.assertEqual(scheme.labels, ('Hard', 'Misc', 'Initiator', 'Soft'))
+        angles = [0, 25, 25.1, 40, 60, 65, 70, 90, 90.1, np.nan, -1]
+        codes = scheme.classify(angles)
+        np.testing.assert_array_equal(codes, [0, 0, 1, 1, 2, 1, 1, 3, -1, -1, -1])
+        self.assertEqual(list(scheme.label(codes[-3:])), [None, None, None])
+        self.assertEqual(scheme.classify(30.0), 1)
+        self.assertEqual(scheme.classify(0).shape, ())
+
+    def test_vectorized(self):
+        from .classify import ClassScheme
+        scheme = ClassScheme(edges=[0, 45, 90], bin_labels=['Low', 'High'])
+        codes = scheme.classify(np.array([[10, 50], [45, 89]]))
+        np.testing.assert_array_equal(codes, [[0, 1], [0, 1]])
+
+    def test_invalid(self):
+        from .classify import ClassScheme
+        with self.assertRaises(ValueError):
+            ClassScheme(edges=[0, 45, 90], bin_labels=['A'])
+        with self.assertRaises(ValueError):
+            ClassScheme(edges=[0, 45, 30], bin_labels=['A', 'B'])
+
+    def test_colors(self):
+        from .classify import ClassScheme, CLASS_COLORS
+        scheme = ClassScheme(edges=[0, 30, 60, 90], bin_labels=['Hard', 'Other', 'Last'])
+        colors = scheme.colors
+        self.assertEqual(colors.shape, (4, 3))
+        self.assertEqual(tuple(colors[0]), CLASS_COLORS['Hard'])
+        self.assertNotEqual(tuple(colors[1]), tuple(colors[2]))
+        self.assertEqual(tuple(colors[np.int8(-1)]), (0, 0, 0))
+
+
+class LabelLUTTests(unittest.TestCase):
+    """
+    Per-pixel maps of per-feature values by lookup
+    """
+
+    def test_maps(self):
+        from .labels import LabelLUT, masked_image
+        labels = np.array([[0, 1, 1, 4], [2, 2, 3, 4]], dtype='int32')
+        lut = LabelLUT(labels)
+        ids = np.array([2, 4])
+        np.testing.assert_array_equal(lut.mask(ids), np.isin(labels, ids))
+        np.testing.assert_array_equal(lut.keep(ids), [[0, 0, 0, 4], [2, 2, 0, 4]])
+        np.testing.assert_array_equal(lut.relabel(ids), [[0, 0, 0, 2], [1, 1, 0, 2]])
+        codes = lut.map(ids, np.int8([0, 3]), fill=-1)
+        self.assertEqual(codes.dtype, np.int8)
+        np.testing.assert_array_equal(codes[1], [0, 0, -1, 3])
+        values = lut.map([1, 9], [0.5, 2.0], fill=np.nan)
+        np.testing.assert_array_equal(np.isnan(values), labels != 1)
+
+        image = np.full(labels.shape + (3,), 7, dtype='uint8')
+        masked = masked_image(image, lut.mask(ids))
+        self.assertEqual(masked.dtype, np.uint8)
+        np.testing.assert_array_equal(masked[..., 0], 7 * np.isin(labels, ids))
+
+    def test_render(self):
+        from skimage.segmentation import find_boundaries as skimage_boundaries
+        from .labels import find_boundaries, render_labels
+        labels = np.random.default_rng(0).integers(0, 4, (6, 8)).repeat(3, 0).repeat(2, 1)
+        np.testing.assert_array_equal(find_boundaries(labels), skimage_boundaries(labels, mode='inner'))
+
+        palette = np.uint8([[0, 0, 0], [10, 0, 0], [0, 20, 0], [0, 0, 30]])
+        image = render_labels(labels, palette, boundary_color=(255, 255, 255))
+        self.assertEqual(image.shape, labels.shape + (3,))
+        self.assertEqual(image.dtype, np.uint8)
+        edges = find_boundaries(labels)
+        np.testing.assert_array_equal(image[edges], 255)
+        np.testing.assert_array_equal(image[~edges], palette[labels[~edges]])
+
+
+class ColormapTests(unittest.TestCase):
+    """
+    Colormap lookup tables, without matplotlib
+    """
+
+    def test_matplotlib(self):
+        from matplotlib import colormaps
+        from .colormaps import LUTS, colorize
+        x = np.concatenate([np.linspace(-0.1, 1.1, 2001), np.arange(256) / 255, [np.nan]])
+        for name in LUTS:
+            expected = colormaps[name](x, bytes=True)[:, :3]
+            expected[-1] = 0  # nan_color='k'
+            np.testing.assert_array_equal(colorize(x, name), expected, err_msg=name)
+
+    def test_array2rgb(self):
+        from .postprocess import array2rgb
+        from .colormaps import colorize
+        labels = np.array([[2, 3], [4, 6]])
+        rgb = array2rgb(labels, 'nipy_spectral')  # integer fast path
+        np.testing.assert_array_equal(rgb, colorize((labels - 2) / 4, 'nipy_spectral'))
+        rgb = array2rgb(np.where(labels > 2, labels, np.nan), nan_color='w')
+        np.testing.assert_array_equal(rgb[0, 0], [255, 255, 255])
+        np.testing.assert_array_equal(rgb[1], colorize([1 / 3, 1.0]))
+        with self.assertRaises(ValueError):
+            colorize(0.5, 'viridis')
+
+
+class OrientationTests(unittest.TestCase):
+    """
+    Batched Euler angle / quaternion / c-axis conversions and misorientations
+    """
+
+    def test_conversions(self):
+        from .orientation import (
+            euler_to_matrix, euler_to_quaternion, quaternion_to_matrix, quaternion_multiply, c_axes,
+        )
+        rng = np.random.default_rng(0)
+        eulers = rng.uniform(0, np.pi, (2, 20, 30, 3))
+        quats = euler_to_quaternion(eulers)
+        np.testing.assert_allclose(np.linalg.norm(quats, axis=-1), 1)
+        self.assertTrue(np.all(quats[..., 0] >= 0))
+        g = euler_to_matrix(eulers)
+        np.testing.assert_allclose(quaternion_to_matrix(quats), g, atol=1e-12)
+        np.testing.assert_allclose(
+            quaternion_to_matrix(quaternion_multiply(quats[0], quats[1])), g[0] @ g[1], atol=1e-12
+        )
+
+        caxes = g[..., 2, :] * np.sign(g[..., 2, 2:])  # crystal z in the sample frame, z >= 0
+        np.testing.assert_allclose(c_axes(eulers), caxes, atol=1e-12)
+        euler_map = eulers.astype('float32')
+        self.assertIs(c_axes(euler_map, out=euler_map), euler_map)  # in place
+        np.testing.assert_allclose(euler_map, caxes, atol=1e-6)
+
+    def test_misorientation(self):
+        from .orientation import (
+            HEXAGONAL_SYMMETRY, euler_to_matrix, euler_to_quaternion, quaternion_to_matrix,
+            quaternion_multiply, misorientation_angles, caxis_misorientation, feature_caxis_misorientations,
+        )
+        rng = np.random.default_rng(1)
+        e1, e2 = rng.uniform(0, np.pi, (2, 50, 3))
+        q1, q2 = euler_to_quaternion(e1), euler_to_quaternion(e2)
+        # brute force: smallest rotation angle of S_i g2 g1^T S_j^T
+        ops = quaternion_to_matrix(HEXAGONAL_SYMMETRY)
+        delta = euler_to_matrix(e2) @ np.swapaxes(euler_to_matrix(e1), -1, -2)
+        traces = np.einsum('iab,nbc,jac->nij', ops, delta, ops).reshape(50, -1)
+        expected = np.degrees(np.arccos(np.clip((traces.max(axis=-1) - 1) / 2, -1, 1)))
+        np.testing.assert_allclose(misorientation_angles(q1, q2), expected, atol=1e-6)
+        equivalent = quaternion_multiply(HEXAGONAL_SYMMETRY[7], q1)
+        np.testing.assert_allclose(misorientation_angles(q1, equivalent), 0, atol=1e-3)
+        self.assertEqual(misorientation_angles(q1.astype('float32'), q2.astype('float32')).dtype, np.float32)
+
+        np.testing.assert_allclose(caxis_misorientation([0, 0, 1], [[0, 0, -2], [1, 0, 1], [0, 1, 0]]), [0, 45, 90])
+        labels = np.array([[1, 1, 2], [0, 2, 2]])
+        caxes = np.float32([[[0, 0, 1], [1, 0, 1], [0, 1, 0]], [[0, 0, 1], [0, 1, 0], [0, 0, 1]]])
+        means = feature_caxis_misorientations(labels, caxes, np.float32([[0, 0, 0], [0, 0, 1], [0, 1, 0]]))
+        self.assertTrue(np.isnan(means[0]))
+        np.testing.assert_allclose(means[1:], [22.5, 30], rtol=1e-6)
+
+    def test_read_without_caxes(self):
+        import warnings
+        import h5py
+        from .postprocess import read_dream3d_file
+        ids = np.zeros((20, 30), dtype='int32')
+        ids[2:, :15], ids[2:, 15:] = 1, 2
+        caxes = np.float32([[0, 0, 1], [0, 0, 1], [0, 0, 1]])  # those of the zero Euler angles
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'scan.dream3d')
+            make_dream3d(path, ids, caxes=caxes)
+            with h5py.File(path, 'a') as f:
+                del f['DataContainers/ImageDataContainer/CellData/Raw_CAxes']
+                del f['DataContainers/ImageDataContainer/CellFeatureData/AvgCAxes']
+                del f['DataContainers/ImageDataContainer/CellFeatureData/FeatureAvgCAxisMisorientations']
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                d = read_dream3d_file(path, mtr_size=100)
+        np.testing.assert_allclose(d['raw_caxis'], caxes[ids])
+        np.testing.assert_allclose(d['avg_caxis'], caxes[1:])
+        np.testing.assert_array_equal(d['misorientation'], 0)
+        np.testing.assert_array_equal(d['mtr_caxis_misalignments'], 0)
+
+
+class IPFTests(unittest.TestCase):
+    """
+    Hexagonal IPF colors computed from Euler angle maps
+    """
+
+    def test_colors(self):
+        from .ipf import hexagonal_ipf_colors
+        from .orientation import euler_to_matrix, crystal_directions
+        eulers = np.random.default_rng(0).uniform(0, np.pi, (20, 30, 3)).astype('float32')
+        direction = np.array([0.3, -0.2, 0.9])
+        np.testing.assert_allclose(
+            crystal_directions(eulers, direction),
+            euler_to_matrix(eulers) @ (direction / np.linalg.norm(direction)),
+            atol=1e-6,
+        )
+
+        identity = np.zeros(3)
+        np.testing.assert_array_equal(hexagonal_ipf_colors(identity, [0, 0, 1]), [255, 0, 0])  # (0001)
+        np.testing.assert_array_equal(hexagonal_ipf_colors(identity, [1, 0, 0]), [0, 255, 0])  # [2-1-10]
+        np.testing.assert_array_equal(hexagonal_ipf_colors(identity, [0, 1, 0]), [0, 0, 255])  # [10-10]
+
+        colors = hexagonal_ipf_colors(eulers, direction)
+        self.assertEqual(colors.shape, eulers.shape)
+        self.assertEqual(colors.dtype, np.uint8)
+        # 6-fold symmetry about c, and inversion
+        rotated = eulers + np.float32([0, 0, np.pi / 3])
+        self.assertLessEqual(np.abs(hexagonal_ipf_colors(rotated, direction) - colors.astype(int)).max(), 1)
+        np.testing.assert_array_equal(hexagonal_ipf_colors(eulers, -direction), colors)
+        mask = np.arange(30) < 10
+        np.testing.assert_array_equal(hexagonal_ipf_colors(eulers, direction, mask)[:, 10:], 0)
+
+    def test_read_without_ipf(self):
+        import warnings
+        from .postprocess import read_dream3d_file
+        ids = np.zeros((20, 30), dtype='int32')
+        ids[2:, :15], ids[2:, 15:] = 1, 2
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'scan.dream3d')
+            make_dream3d(path, ids, ipf=False)
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                d = read_dream3d_file(path, ref_dir=[0, 1, 1], mtr_size=100)
+        np.testing.assert_array_equal(d['ipf_cleaned_z'][ids > 0], [[255, 0, 0]] * np.sum(ids > 0))
+        np.testing.assert_array_equal(d['ipf_avg_x'][ids > 0], [[0, 255, 0]] * np.sum(ids > 0))
+        np.testing.assert_array_equal(d['ipf_cleaned_y'][ids == 0], 0)
+        np.testing.assert_array_equal(d['ipf_mtr_z'], d['mtr_ipf'])
+        self.assertEqual(d['ipf_stress_axis'].shape, ids.shape + (3,))
+        self.assertIsNone(d['ipf_raw_z'])
+        self.assertTrue(np.isnan(d['pixel_fraction_altered_by_cleanup']))
+        self.assertAlmostEqual(d['scan_area_mm2'], 540 / 1e6)
+
+
+class LoadingDirectionTests(unittest.TestCase):
+    """
+    Worst-case loading direction search over the hemisphere
+    """
+
+    def test_fractions(self):
+        from .classify import ClassScheme
+        from .loading import hemisphere_grid, class_area_fractions, worst_case_direction
+        from .postprocess import calc_misalignment
+        grid, inside = hemisphere_grid(21)
+        np.testing.assert_allclose(np.linalg.norm(grid[inside], axis=-1), 1)
+        np.testing.assert_allclose(grid[10, 10], [0, 0, 1], atol=1e-12)
+        self.assertTrue(np.all(grid[inside][:, 2] >= 0))
+
+        rng = np.random.default_rng(0)
+        caxes, areas = rng.normal(size=(40, 3)), rng.uniform(1, 2, 40)
+        scheme = ClassScheme()
+        directions = grid[inside][::7]
+        fractions = class_area_fractions(directions, caxes, areas, 100.0, scheme)
+        for direction, row in zip(directions, fractions):
+            codes = scheme.classify(calc_misalignment(caxes, direction))
+            expected = [areas[codes == c].sum() / 100 for c in range(len(scheme.labels))]
+            np.testing.assert_allclose(row, expected)
+
+        # A single MTR along z: Initiator (40-60 deg) for directions 40-60 deg from z
+        search = worst_case_direction([[0, 0, 1]], [50.0], 100.0, scheme, size=41)
+        self.assertEqual(search.fraction, 0.5)
+        self.assertTrue(40 < np.degrees(np.arccos(search.direction[2])) <= 60)
+        self.assertEqual(search.fraction_map.shape, (41, 41))
+        self.assertTrue(np.isnan(search.fraction_map[0, 0]))
+        with self.assertRaises(ValueError):
+            worst_case_direction([[0, 0, 1]], [50.0], 100.0, scheme, label='Brittle')
+
+    def test_axes(self):
+        from .loading import parse_axis, parse_axes
+        from .postprocess import calc_misalignment
+        np.testing.assert_array_equal(parse_axis('010'), [0, 1, 0])
+        np.testing.assert_allclose(parse_axis('0.3,0,0.95'), np.array([0.3, 0, 0.95]) / np.hypot(0.3, 0.95))
+        np.testing.assert_allclose(parse_axis('[1, 1, 0]'), [2**-0.5, 2**-0.5, 0])
+        np.testing.assert_allclose(parse_axis('euler:90,30,0'), [0.5, 0, np.sqrt(3) / 2], atol=1e-12)
+        for value in ('0,0,0', '1,2', 'z', 'euler:1,2', [1, np.nan, 0]):
+            with self.assertRaises(ValueError):
+                parse_axis(value)
+        self.assertEqual(parse_axes('001').shape, (1, 3))
+        self.assertEqual(parse_axes([0, 0, 1]).shape, (1, 3))
+        axes = parse_axes(['001', '0.3,0,0.95', 'euler:45,60,0'])
+        self.assertEqual(axes.shape, (3, 3))
+        with self.assertRaisesRegex(ValueError, 'Invalid stress axis'):
+            parse_axes([])
+
+        caxes = np.random.default_rng(0).normal(size=(20, 3)).astype('float32')
+        angles = calc_misalignment(caxes, axes)
+        self.assertEqual(angles.shape, (3, 20))
+        for axis, row in zip(axes, angles):
+            np.testing.assert_allclose(row, calc_misalignment(caxes, axis))
+        np.testing.assert_array_equal(calc_misalignment(caxes, [0, 0, 1]), calc_misalignment(caxes, axes[0]))
+
+    def test_analysis(self):
+        from pandas import read_csv
+        output_dir, results = analyze_scan(**SCAN_OPTIONS)
+        self.assertTrue(os.path.isfile(os.path.join(output_dir, 'Worst_Case_Directions.png')))
+        self.assertTrue(os.path.isfile(os.path.join(output_dir, 'Worst_Case_Directions.csv')))
+        # along z: the Z IPF maps, no separate stress axis one
+        self.assertFalse(os.path.isdir(os.path.join(output_dir, 'IPF_Images', 'Stress_Axis')))
+        axes = read_csv(os.path.join(output_dir, 'Stress_Axes.csv'))
+        self.assertEqual(list(axes['Stress Axis']), ['001', '0.5,0,0.8'])
+        # classified for the first axis; 32 deg (Misc) and 58 deg (Initiator) from the second
+        np.testing.assert_allclose(results['raw_data']['MTR Caxis Misalignment, deg'], [0, 0, 90], atol=0.01)
+        np.testing.assert_allclose(axes['Hard Area Fraction'], [45 / 60, 0])
+        np.testing.assert_allclose(axes['Initiator Area Fraction'], [0, 15 / 60])
+        areas = results['scan_areas']
+        # all the MTRs are Initiators for axes 40-60 deg from both z and x
+        self.assertEqual(areas['Worst-Case Initiator Area Fraction'].iloc[0], 1)
+        axis = np.array(areas['Worst-Case Initiator Axis'].iloc[0].split(','), dtype=float)
+        self.assertAlmostEqual(np.linalg.norm(axis), 1, places=2)
+        angles = np.degrees(np.arccos(np.clip(np.abs(axis[[0, 2]]), 0, 1)))
+        self.assertTrue(np.all((angles >= 40) & (angles <= 60)), angles)
+
+
+class HeatmapTests(unittest.TestCase):
+    """
+    Windowed MTR class area fractions and intensity from summed-area tables
+    """
+
+    def test_windows(self):
+        from .heatmaps import class_fractions, window_means
+        rng = np.random.default_rng(0)
+        class_map = rng.integers(-1, 3, (13, 17))
+        values = np.where(class_map >= 0, rng.uniform(0, 1, class_map.shape), np.nan)
+        mask = rng.uniform(size=class_map.shape) > 0.2
+        mask[:4, :4] = False
+        fractions = class_fractions(class_map, 3, mask, [1, 4, 7])
+        means = window_means(values, mask, [1, 4, 7])
+        for size in (1, 4, 7):
+            self.assertEqual(fractions[size].shape, (3, 13, 17))
+            half = size // 2
+            for i, j in [(0, 0), (6, 8), (12, 16), (3, 15)]:
+                rows = slice(max(0, i - half), i - half + size)
+                cols = slice(max(0, j - half), j - half + size)
+                window, valid = class_map[rows, cols], mask[rows, cols]
+                if not valid.any():
+                    self.assertTrue(np.isnan(fractions[size][:, i, j]).all())
+                    self.assertTrue(np.isnan(means[size][i, j]))
+                    continue
+                for code in range(3):
+                    expected = ((window == code) & valid).sum() / valid.sum()
+                    self.assertAlmostEqual(fractions[size][code, i, j], expected, places=6)
+                expected = np.nan_to_num(values[rows, cols])[valid].mean()
+                self.assertAlmostEqual(means[size][i, j], expected, places=6)
+
+    def test_analysis(self):
+        from pandas import read_csv
+        output_dir, _ = analyze_scan(**SCAN_OPTIONS)
+        heatmap_dir = os.path.join(output_dir, 'Heatmaps')
+        for window in ('5um', '12.5um'):
+            for name in ('Hard_Area_Fraction.png', 'Soft_Area_Fraction.png', 'MTR_Intensity.png'):
+                self.assertTrue(os.path.isfile(os.path.join(heatmap_dir, window, name)))
+        with np.load(os.path.join(heatmap_dir, 'Heatmaps.npz')) as arrays:
+            hard = arrays['Hard_Area_Fraction_5um']
+            self.assertEqual(arrays['MTR_Intensity_12.5um'].shape, (40, 60))
+        # 10 px windows: only Hard MTRs left of column 40, only Soft right of 50
+        self.assertEqual(hard.shape, (40, 60))
+        np.testing.assert_array_equal(hard[:, :40], 1)
+        np.testing.assert_array_equal(hard[:, 50:], 0)
+        peaks = read_csv(os.path.join(heatmap_dir, 'Heatmap_Peaks.csv'))
+        hard_peaks = peaks[peaks['MTR Class'] == 'Hard']
+        self.assertEqual(list(hard_peaks['Window, um']), [5, 12.5])
+        self.assertTrue((hard_peaks['Peak Area Fraction'] == 1).all())
+
+
+class CorrelationTests(unittest.TestCase):
+    """
+    Two-point correlations of MTR class maps by FFT
+    """
+
+    def test_correlations(self):
+        from .correlations import two_point_statistics
+        rng = np.random.default_rng(0)
+        class_map = rng.integers(-1, 3, (9, 12))
+        mask = rng.uniform(size=class_map.shape) > 0.2
+        stats = two_point_statistics(class_map, 3, mask, max_lag=5)
+        indicators = [(class_map == a) & mask for a in range(3)]
+
+        def pairs(a, b, dy, dx):
+            first = (slice(max(0, -dy), 9 - max(0, dy)), slice(max(0, -dx), 12 - max(0, dx)))
+            second = (slice(max(0, dy), 9 + min(0, dy)), slice(max(0, dx), 12 + min(0, dx)))
+            return (
+                (indicators[a][first] & indicators[b][second]).sum(),
+                (mask[first] & mask[second]).sum(),
+            )
+
+        for a in range(3):
+            for k in range(6):
+                self.assertAlmostEqual(stats.x[a, k], np.divide(*pairs(a, a, 0, k)))
+                self.assertAlmostEqual(stats.y[a, k], np.divide(*pairs(a, a, k, 0)))
+        for a, b in [(0, 1), (2, 2)]:
+            for r in range(6):
+                ring = [
+                    pairs(a, b, dy, dx)
+                    for dy in range(-5, 6)
+                    for dx in range(-5, 6)
+                    if round(np.hypot(dy, dx)) == r
+                ]
+                expected = np.divide(*np.sum(ring, axis=0))
+                self.assertAlmostEqual(stats.radial[a, b, r], expected)
+                self.assertAlmostEqual(stats.radial[b, a, r], expected)
+
+        # Stripes 8 px wide along y: correlated along y, over ~2.5 px along x
+        stripes = np.tile(np.arange(64) // 8 % 2, (40, 1))
+        stats = two_point_statistics(stripes, 3, np.ones(stripes.shape, bool))
+        np.testing.assert_allclose(stats.fractions, [0.5, 0.5, 0])
+        lengths = stats.lengths(stats.x)
+        self.assertTrue(2 < lengths[0] < 3.5 and 2 < lengths[1] < 3.5)
+        self.assertTrue(np.isnan(stats.lengths(stats.y)).all())
+        self.assertTrue(np.isnan(lengths[2]))
+
+    def test_analysis(self):
+        from pandas import read_csv
+        output_dir, results = analyze_scan(**SCAN_OPTIONS)
+        table = read_csv(os.path.join(output_dir, 'Two_Point_Correlations.csv'))
+        self.assertEqual(len(table), 21)
+        self.assertEqual(table['Distance, um'].iloc[-1], 10)
+        self.assertAlmostEqual(table['Hard - Hard'][0], 0.75)
+        self.assertAlmostEqual(table['Hard - Soft'][0], 0)
+        areas = results['scan_areas']
+        self.assertTrue(np.isnan(areas['Hard Correlation Length Y, um'].iloc[0]))
+        self.assertGreater(areas['Hard Correlation Length X, um'].iloc[0], 2)
+
+
+class SpacingTests(unittest.TestCase):
+    """
+    Nearest-neighbour distances and neighbour counts of MTRs by class
+    """
+
+    def test_spacing(self):
+        from .spacing import nearest_distances, neighbor_counts
+        rng = np.random.default_rng(0)
+        points = rng.uniform(0, 100, (200, 2))
+        codes = rng.integers(-1, 3, 200)
+        codes[5] = 3  # the only point of class 3
+        distances = nearest_distances(points, codes, 5)
+        counts = neighbor_counts(points, codes, 5, 15.0)
+        pairwise = np.linalg.norm(points[:, None] - points[None], axis=-1)
+        np.fill_diagonal(pairwise, np.inf)
+        for c in range(3):
+            np.testing.assert_allclose(distances[:, c], pairwise[:, codes == c].min(axis=1))
+            np.testing.assert_array_equal(counts[:, c], (pairwise[:, codes == c] <= 15).sum(axis=1))
+        self.assertTrue(np.isnan(distances[5, 3]))
+        self.assertTrue(np.isnan(distances[:, 4]).all())
+        np.testing.assert_array_equal(counts[:, 4], 0)
+
+    def test_analysis(self):
+        _, results = analyze_scan(**SCAN_OPTIONS)
+        # Centroids at x = 5, 16.25 (Hard) and 26.25 um (Soft)
+        raw = results['raw_data']
+        self.assertEqual(list(raw['MTR Class']), ['Hard', 'Hard', 'Soft'])
+        np.testing.assert_allclose(raw['Nearest Hard, um'], [11.25, 11.25, 10])
+        np.testing.assert_allclose(raw['Nearest Soft, um'][:2], [21.25, 10])
+        self.assertTrue(np.isnan(raw['Nearest Soft, um'][2]))
+        self.assertEqual(list(raw['Hard Within 15 um']), [1, 1, 1])
+        self.assertEqual(list(raw['Soft Within 15 um']), [0, 1, 0])
+
+
+class RegionOfInterestTests(unittest.TestCase):
+    """
+    Analysis of a region of interest, read as a hyperslab of the maps
+    """
+
+    def test_roi(self):
+        from .roi import ROI, parse_roi
+        self.assertEqual(parse_roi('5,0,25,10'), ROI(5, 0, 25, 10))
+        self.assertEqual(parse_roi('[10, 0, 50, 20]px'), ROI(10, 0, 50, 20, pixels=True))
+        for value in ('1,2,3', '5,0,1,10', 'a,b,c,d', '0,0,1,nan'):
+            with self.assertRaises(ValueError):
+                parse_roi(value)
+        self.assertEqual(ROI(5, 0, 25, 10).slices(0.5, (40, 60)), (slice(0, 20), slice(10, 50)))
+        self.assertEqual(ROI(10, 0, 50, 20, pixels=True).slices(0.5, (40, 60)), (slice(0, 20), slice(10, 50)))
+        self.assertEqual(ROI(-5, 30, 100, 100).slices(1, (40, 60)), (slice(30, 40), slice(0, 60)))
+        with self.assertRaises(ValueError):
+            ROI(70, 0, 80, 10).slices(1, (40, 60))
+
+    def test_features(self):
+        from .h5io import MappedFile, CroppedFile
+        from .features import FeatureTable
+        ids = np.zeros((40, 60), dtype='int32')
+        ids[:, :20], ids[:, 20:45], ids[:, 45:] = 1, 2, 3
+        ids[30:, :] = 4
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'scan.dream3d')
+            make_dream3d(path, ids, step=0.5)
+            for mmap in (True, False):
+                with MappedFile(path, mmap=mmap) as data:
+                    full = FeatureTable.from_dream3d(data)
+                    cropped = CroppedFile(data, 'DataContainers/ImageDataContainer/CellData', slice(0, 20), slice(10, 50))
+                    labels = cropped['DataContainers/ImageDataContainer/CellData/MTRIds'][0, :, :, 0]
+                    np.testing.assert_array_equal(labels, ids[:20, 10:50])
+                    self.assertEqual(cropped['DataContainers/ImageDataContainer/CellFeatureData/Volumes'].shape, (5, 1))
+
+        # The whole map gives back the file's features
+        table = full.within(ids, 0.5)
+        for name in ('cells', 'volumes', 'centroids', 'num_neighbors', 'neighbor_offsets', 'neighbor_ids', 'shared_surfaces'):
+            np.testing.assert_allclose(getattr(table, name), getattr(full, name), rtol=1e-6, err_msg=name)
+        table = full.within(labels, 0.5, offset=(0, 10))
+        np.testing.assert_array_equal(table.cells, [200, 500, 100, 0])
+        np.testing.assert_allclose(table.volumes, [50, 125, 25, 0])
+        np.testing.assert_allclose(table.centroids[:3, 0], [7.5, 16.25, 23.75])
+        self.assertTrue(np.isnan(table.centroids[3, 0]))
+        self.assertEqual(list(table.neighbors(1)[0]), [1, 3])
+        np.testing.assert_allclose(table.neighbors(1)[1], [10, 10])
+        np.testing.assert_array_equal(table.num_neighbors, [1, 2, 1, 0])
+
+    def test_analysis(self):
+        from pandas import read_csv
+        from pandas.testing import assert_frame_equal
+        output_dir, results = analyze_scan(roi='5,0,25,10', **SCAN_OPTIONS)
+        _, same = analyze_scan(roi='10,0,50,20px', **SCAN_OPTIONS)
+        raw, areas = results['raw_data'], results['scan_areas']
+        self.assertEqual(list(raw['MTR Class']), ['Hard', 'Hard', 'Soft'])
+        np.testing.assert_allclose(raw['MTR Area, um^2'], [50, 125, 25])
+        np.testing.assert_allclose(raw['Hard-Soft Boundary, um'], [0, 10, 10])
+        np.testing.assert_allclose(raw['Cluster Area, um^2'], [175, 175, 25])
+        np.testing.assert_allclose(raw['MTR Misorientation, deg'], 5, atol=1e-3)
+        self.assertAlmostEqual(areas['Scan Area, mm2'].iloc[0], 200e-6)
+        self.assertEqual(areas['Region of Interest, um'].iloc[0], '5,0,25,10')
+        assert_frame_equal(raw, same['raw_data'])
+        # in scan coordinates, like the centroids: from x = 5 um
+        peaks = read_csv(os.path.join(output_dir, 'Heatmaps', 'Heatmap_Peaks.csv'))
+        peaks = peaks[peaks['Window, um'] == 5].set_index('MTR Class')
+        self.assertEqual(list(peaks.loc[['Hard', 'Soft'], 'x, um']), [5, 24.5])
+        self.assertEqual(list(peaks.loc[['Hard', 'Soft'], 'y, um']), [0, 0])
+
+    def test_batch(self):
+        import warnings
+        from unittest import mock
+        from . import postprocess
+        from .postprocess import analyzeBatch
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'scan.dream3d')
+            make_mtr_scan(path)
+            # the region is read where it is analyzed, not the whole scan ahead
+            with warnings.catch_warnings(), mock.patch.object(
+                postprocess, 'Prefetcher', side_effect=AssertionError('prefetched')
+            ):
+                warnings.simplefilter('ignore')
+                summary = analyzeBatch([path], tmpdir, min_mtr_size=20, roi='5,0,25,10')
+        self.assertEqual(summary['failed'], {})
+        self.assertEqual(len(summary['raw_data']), 3)
+
+
+class WatchTests(unittest.TestCase):
+    """
+    Debouncing of new scan files in the watch-folder daemon
+    """
+
+    def test_debounce(self):
+        from configargparse import Namespace
+        from .watch import PollingWatcher, WatchDaemon
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for name in ('a.ang', 'b.CTF', 'c.txt', 'empty.ang'):
+                with open(os.path.join(tmpdir, name), 'w') as f:
+                    f.write('' if name.startswith('empty') else 'data')
+
+            watcher = PollingWatcher(tmpdir, interval=0)
+            found = sorted(os.path.basename(p) for p in watcher.scan())
+            self.assertEqual(found, ['a.ang', 'b.CTF', 'empty.ang'])
+
+            daemon = WatchDaemon(Namespace(), watcher, settle=0)
+            daemon.ignore([os.path.join(tmpdir, 'b.CTF')])
+            daemon.submit = daemon.collect = lambda: None
+            daemon.step()  # first size check
+            self.assertEqual(len(daemon.backlog), 0)
+            daemon.step()  # size unchanged
+            self.assertEqual([os.path.basename(p) for p, _ in daemon.backlog], ['a.ang'])
+            self.assertEqual(list(map(os.path.basename, daemon.pending)), ['empty.ang'])
+            daemon.pool.shutdown()
+
+
+class JobServiceTests(unittest.TestCase):
+    """
+    Validation of job requests for the HTTP job service
+    """
+
+    def test_job_args(self):
+        from concurrent.futures import Future
+        from .serve import Job, job_args
+        from .cli import parse_args
+        with tempfile.TemporaryDirectory() as tmpdir:
+            scan = os.path.join(tmpdir, 'scan.ang')
+            open(scan, 'w').close()
+            output_dir = os.path.join('Results', '{basename}')
+
+            args = job_args({'argv': [scan, '-R', '-o', output_dir, '--min-mtr-size', '500']}, tmpdir)
+            self.assertEqual(args.min_mtr_size, 500)
+            self.assertEqual(args.output_dir, os.path.join(os.path.realpath(tmpdir), 'Results', 'scan'))
+
+            args = job_args(
+                {'input_file': scan, 'no_runner': True, 'output_dir': output_dir, 'basename': 'x', 'min_mtr_size': 500},
+                tmpdir,
+            )
+            self.assertEqual(args.basename, 'scan')
+            self.assertEqual(args.min_mtr_size, 500)
+
+            with self.assertRaises(ValueError):
+                job_args({'input_file': scan, 'no_runner': True, 'bogus': 1}, tmpdir)
+            with self.assertRaises(ValueError):
+                job_args({'argv': [scan, '--stress-axis', '0,0,0']}, tmpdir)
+            with self.assertRaises(ValueError):
+                job_args({'input_file': scan, 'stress_axis': 'x'}, tmpdir)
+            args = job_args({'argv': [scan, '-R', '-o', output_dir, '--stress-axis', '111', 'euler:0,30,0']}, tmpdir)
+            self.assertEqual(args.stress_axis, ['111', 'euler:0,30,0'])
+            with self.assertRaises(ValueError):
+                job_args({'min_mtr_size': 500}, tmpdir)
+
+            # Option values are typed as on the command line
+            with self.assertRaises(ValueError):
+                job_args({'input_file': scan, 'no_runner': True, 'min_mtr_size': 'abc'}, tmpdir)
+            # Server-side options and output directories outside of the root
+            config = os.path.join(tmpdir, 'config.yaml')
+            with open(config, 'w') as f:
+                f.write('min-mtr-size: 100\n')
+            for params in (
+                {'input_file': scan, 'no_runner': True, 'overwrite': True},
+                {'input_file': scan, 'no_runner': True, 'pipeline_runner': '/bin/true'},
+                {'argv': [scan, '--pipeline-runner', '/bin/true']},
+                {'argv': [scan, '-R', '--pipeline-template', scan]},
+                {'argv': [scan, '-R', '-c', config]},
+                {'input_file': scan, 'no_runner': True, 'output_dir': os.path.join(tmpdir, '..', 'x')},
+                {'argv': [scan, '-R', '-o', '/tmp/x']},
+            ):
+                with self.assertRaises(ValueError, msg=params):
+                    job_args(params, os.path.join(tmpdir, 'jobs'))
+            # Config files are rejected before they are opened (a directory can't be)
+            for params in (
+                {'argv': [scan, '-R', '-c', tmpdir]},
+                {'argv': [scan, '-R', '-c' + tmpdir]},
+                {'argv': [scan, '-R', '--conf=' + tmpdir]},
+                {'input_file': scan, 'no_runner': True, 'config': tmpdir},
+            ):
+                with self.assertRaisesRegex(ValueError, 'server only: config', msg=params):
+                    job_args(params, os.path.join(tmpdir, 'jobs'))
+
+            # A client doesn't need PipelineRunner or an empty output directory
+            argv = [scan, '--pipeline-runner', os.path.join(tmpdir, 'missing'), '-o', tmpdir]
+            with self.assertRaises(PermissionError):
+                parse_args(argv)
+            with self.assertRaises(FileNotFoundError):
+                parse_args(argv + ['--overwrite'])
+            self.assertEqual(parse_args(argv + ['--server', 'http://127.0.0.1:1'])[0].output_dir, tmpdir)
+
+            job = Job('1', args)
+            job.future = Future()
+            job.future.cancel()  # e.g. by JobManager.shutdown
+            self.assertEqual(job.status, 'cancelled')
+
+
+class WorkerPoolTests(unittest.TestCase):
+    """
+    Warm-up and recycling of worker processes
+    """
+
+    def test_recycle(self):
+        from .workers import WorkerPool
+        with WorkerPool(1, max_jobs_per_worker=2) as pool:
+            first = pool.pids()
+            self.assertEqual(len(first), 1)
+            # prestart counted as the first job of the worker
+            pid, warm = pool.submit(imported, 'microtexture.postprocess').result()
+            self.assertEqual([pid], first)
+            self.assertTrue(warm)
+            pid, warm = pool.submit(imported, 'pandas').result()
+            self.assertNotIn(pid, first)
+            self.assertTrue(warm)
+
+
+class PipelinedExecutorTests(unittest.TestCase):
+    """
+    Overlap, back-pressure and failures of the two-stage batch executor
+    """
+
+    def test_pipeline(self):
+        import time
+        from .pipelined import PipelinedExecutor
+        produced, started, ahead = [], [], []
+
+        def produce(i):
+            if i == 2:
+                raise RuntimeError('runner failed')
+            time.sleep(0.05)
+            produced.append(i)
+
+        def consume(i):
+            ahead.append(len(produced) - len(started))
+            started.append(i)
+            time.sleep(0.05)
+            if i == 4:
+                raise ValueError('bad file')
+
+        executor = PipelinedExecutor(produce, consume, queue_depth=1)
+        done = executor.run(range(8))
+        self.assertEqual(done, [0, 1, 3, 5, 6, 7])
+        self.assertEqual(sorted(executor.failed), ['2', '4'])
+        self.assertTrue(executor.failed['2'].startswith('produce: RuntimeError'))
+        # this item + queue (1) + item produced but waiting for the queue
+        self.assertLessEqual(max(ahead), 3)
+        self.assertLess(executor.wall, executor.busy['produce'] + executor.busy['consume'])
+
+    def test_schedule_failure(self):
+        from .pipelined import PipelinedExecutor, sequential
+
+        def schedule(items, produce):
+            yield from sequential(items[:2], produce)
+            raise MemoryError('out of memory')
+
+        executor = PipelinedExecutor(lambda i: None, lambda i: None, schedule=schedule)
+        self.assertEqual(executor.run(range(5)), [0, 1])
+        self.assertEqual(sorted(executor.failed), ['2', '3', '4'])
+        self.assertTrue(executor.failed['3'].startswith('produce: MemoryError'))
+
+    def test_schedule_order(self):
+        from .pipelined import PipelinedExecutor, sequential, _union
+        consumed = []
+
+        def schedule(items, produce):  # e.g. largest first
+            yield from sequential(items[::-1], produce)
+
+        executor = PipelinedExecutor(lambda i: None, consumed.append, schedule=schedule)
+        self.assertEqual(executor.run(range(4)), [0, 1, 2, 3])
+        self.assertEqual(consumed, [3, 2, 1, 0])
+        self.assertEqual(len(executor.produced), 4)
+        # time any (concurrent) producer was running
+        self.assertEqual(_union([(0, 2), (1, 3), (5, 6), (5.5, 5.8)]), 4)
+
+
+class MemorySchedulerTests(unittest.TestCase):
+    """
+    Scan sizes from headers, memory model and memory-bounded scheduling
+    """
+
+    def test_scan_pixels(self):
+        from .scheduler import scan_pixels
+        with tempfile.TemporaryDirectory() as tmpdir:
+            ang = os.path.join(tmpdir, 'hex.ang')
+            with open(ang, 'w') as f:
+                f.write('# GRID: HexGrid\n# NCOLS_ODD: 5\n# NCOLS_EVEN: 4\n# NROWS: 3\n#\n0 0 0\n')
+            ctf = os.path.join(tmpdir, 'scan.ctf')
+            with open(ctf, 'w') as f:
+                f.write('Channel Text File\nXCells\t20\nYCells\t10\nPhases\t1\nPhase\tX\tY\n1\t0\t0\n')
+            self.assertEqual(scan_pixels(ang), 5 + 4 + 5)
+            self.assertEqual(scan_pixels(ctf), 200)
+
+    def test_model(self):
+        from .scheduler import MemoryModel
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'model.json')
+            model = MemoryModel(path)
+            for pixels, peak in ((100, 1100), (200, 2000), (300, 3100)):
+                model.record(pixels, peak)
+            model = MemoryModel(path)
+            self.assertEqual(len(model.samples), 3)
+            # fit shifted to cover the largest observed peak
+            for pixels, peak in model.samples:
+                self.assertGreaterEqual(model.estimate(pixels), peak - 1e-6)
+            self.assertAlmostEqual(model.per_pixel, 10)
+
+    def test_schedule(self):
+        import threading
+        import time
+        from .scheduler import MemoryModel, MemoryScheduler
+        model = MemoryModel()
+        model.base, model.per_pixel = 0, 1
+        scheduler = MemoryScheduler(model, max_memory=10, max_jobs=4)
+        lock = threading.Lock()
+        running, peaks = [], []
+
+        def produce(size):
+            with lock:
+                running.append(size)
+                peaks.append(sum(running))
+            time.sleep(0.02)
+            with lock:
+                running.remove(size)
+
+        sizes = [6, 3, 4, 1, 12, 2]
+        done = [item for item, error in scheduler.run(sizes, produce, pixels=int)]
+        self.assertEqual(sorted(done), sorted(sizes))
+        self.assertEqual(done[0], 12)  # too large for the budget: runs alone, first
+        self.assertLessEqual(max(p for p in peaks if p != 12), 10)
+
+
+class BatchAnalysisTests(unittest.TestCase):
+    """
+    Headless batch analysis of several .dream3d files with a campaign summary
+    """
+
+    def test_batch(self):
+        import warnings
+        from pandas import read_csv, read_excel
+        from .postprocess import find_dream3d_files, analyzeBatch
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for name in ('scan1', 'scan2'):
+                os.makedirs(os.path.join(tmpdir, name))
+                make_mtr_scan(os.path.join(tmpdir, name, name + '.dream3d'))
+
+            files = find_dream3d_files([tmpdir])
+            self.assertEqual([os.path.basename(f) for f in files], ['scan1.dream3d', 'scan2.dream3d'])
+            with self.assertRaises(FileNotFoundError):
+                find_dream3d_files([os.path.join(tmpdir, '*.ang')])
+
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                summary = analyzeBatch(files, tmpdir, min_mtr_size=100)
+            self.assertEqual(summary['failed'], {})
+            self.assertTrue(os.path.isfile(os.path.join(tmpdir, 'scan2', 'Raw_Data.csv')))
+            self.assertTrue(os.path.isfile(os.path.join(tmpdir, 'scan2', 'MTR_Classes.png')))
+            raw = read_csv(os.path.join(tmpdir, 'Raw Data.csv'))
+            self.assertEqual(list(raw.groupby('Sample').size()), [3, 3])
+            fractions = read_excel(os.path.join(tmpdir, 'Microtexture Statistics Summary.xlsx'), 'Area Fractions')
+            self.assertAlmostEqual(fractions.groupby('Sample')['Area Fraction'].sum()['scan1'], 1.0, places=3)
+
+    def test_background(self):
+        import time
+        from .postprocess import BackgroundBatch
+        ids = np.ones((20, 30), dtype='int32')
+        with tempfile.TemporaryDirectory() as tmpdir:
+            files = [os.path.join(tmpdir, f'scan{i}.dream3d') for i in range(3)]
+            for f in files:
+                make_dream3d(f, ids)
+
+            job = BackgroundBatch(files, tmpdir, workers=1, min_mtr_size=100)
+            job.cancel.set()  # before starting: nothing is analyzed
+            job.start()
+            stages = []
+            while not job.finished:
+                stages += [stage for _, stage, _ in job.events()]
+                time.sleep(0.05)
+            self.assertIsNone(job.summary)
+            self.assertEqual(stages, ['cancelled'] * 3)
+            self.assertEqual(job.progress, 100)
+
+
+class OutputSinkTests(unittest.TestCase):
+    """
+    Background, atomic writing of output files
+    """
+
+    def test_sink(self):
+        from pandas import DataFrame, read_csv
+        from imageio import imread
+        from .outputs import OutputSink, OutputError
+        image = np.arange(12 * 16 * 3, dtype='uint8').reshape(12, 16, 3)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with OutputSink(workers=2, max_pending=2) as sink:
+                for i in range(5):
+                    sink.image(os.path.join(tmpdir, f'{i}.png'), image)
+                sink.csv(os.path.join(tmpdir, 'table.csv'), DataFrame({'a': [1, 2]}))
+            np.testing.assert_array_equal(imread(os.path.join(tmpdir, '4.png')), image)
+            self.assertEqual(list(read_csv(os.path.join(tmpdir, 'table.csv'))['a']), [1, 2])
+
+            def fail(path):
+                with open(path, 'w') as f:
+                    f.write('partial')
+                raise OSError('disk full')
+
+            sink = OutputSink()
+            sink.submit(os.path.join(tmpdir, 'broken.txt'), fail)
+            with self.assertRaises(OutputError):
+                sink.flush()
+            sink.close()
+            self.assertEqual(sorted(os.listdir(tmpdir)), [f'{i}.png' for i in range(5)] + ['table.csv'])
+
+
+class SharedArraysTests(unittest.TestCase):
+    """
+    Passing arrays to worker processes in shared memory
+    """
+
+    def test_share(self):
+        from concurrent.futures import ProcessPoolExecutor
+        from .sharedarrays import SharedArrays, attached
+        arrays = {'ids': np.arange(12, dtype='int32').reshape(3, 4), 'empty': np.zeros(0)}
+        with SharedArrays() as segments:
+            shared = segments.share_all(arrays)
+            self.assertEqual(len(segments), 2)
+            with ProcessPoolExecutor(1) as pool:
+                self.assertEqual(pool.submit(shared_sums, shared).result(), {'ids': 66.0, 'empty': 0.0})
+
+            with attached(shared) as views:
+                ids = views['ids']
+                np.testing.assert_array_equal(ids, arrays['ids'])
+                self.assertFalse(ids.flags.writeable)
+            self.assertEqual(views, {})
+
+            segments.release(shared['empty'])
+            self.assertEqual(len(segments), 1)
+            with self.assertRaises(FileNotFoundError):
+                with attached({'empty': shared['empty']}):
+                    pass
+        with self.assertRaises(FileNotFoundError):
+            with attached(shared):
+                pass
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,324 @@
+#! /usr/bin/env python
+"""
+Watch a directory for new .ang / .ctf scans and process them as they land:
+python -m microtexture watch DIR [OPTIONS]
+
+Uses inotify on Linux and falls back to polling elsewhere (or on file systems
+that don't report events, with --poll). Files are queued only once their size
+has been stable for a while, and run through cli.process (template ->
+PipelineRunner -> analysis) on a bounded pool of warm worker processes
+(see workers.WorkerPool).
+"""
+
+import os
+import json
+import time
+import select
+import struct
+import ctypes
+import ctypes.util
+from collections import deque
+
+from configargparse import Namespace
+
+from .cli import get_parser, check_args, process
+from .workers import WorkerPool, DEFAULT_MAX_JOBS_PER_WORKER
+
+EXTENSIONS = (".ang", ".ctf")
+
+# inotify(7) event masks
+_IN_MODIFY = 0x002
+_IN_CLOSE_WRITE = 0x008
+_IN_MOVED_TO = 0x080
+_IN_CREATE = 0x100
+_EVENT = struct.Struct("iIII")
+
+
+class PollingWatcher:
+    """Reports every scan file in directory, on each call to changes()"""
+
+    def __init__(self, directory: str, interval: float = 2.0):
+        self.directory = directory
+        self.interval = interval
+
+    def changes(self) -> set[str]:
+        time.sleep(self.interval)
+        return self.scan()
+
+    def scan(self) -> set[str]:
+        """All scan files currently in directory"""
+        with os.scandir(self.directory) as it:
+            return {
+                e.path
+                for e in it
+                if e.is_file() and e.name.lower().endswith(EXTENSIONS)
+            }
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher(PollingWatcher):
+    """Reports scan files created / written / moved into directory (Linux only)"""
+
+    def __init__(self, directory: str, interval: float = 2.0):
+        super().__init__(directory, interval)
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        mask = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed: {directory}")
+
+    def changes(self) -> set[str]:
+        ready, _, _ = select.select([self.fd], [], [], self.interval)
+        if not ready:
+            return set()
+
+        buffer = os.read(self.fd, 64 * 1024)
+        names = set()
+        offset = 0
+        while offset < len(buffer):
+            _, _, _, length = _EVENT.unpack_from(buffer, offset)
+            offset += _EVENT.size
+            name = buffer[offset : offset + length].rstrip(b"\0")
+            offset += length
+            names.add(os.fsdecode(name))
+
+        return {
+            os.path.join(self.directory, n)
+            for n in names
+            if n.lower().endswith(EXTENSIONS)
+        }
+
+    def close(self):
+        os.close(self.fd)
+
+
+def get_watcher(directory: str, interval: float = 2.0, poll: bool = False):
+    """InotifyWatcher if available (and poll is False), otherwise PollingWatcher"""
+    if not poll:
+        try:
+            return InotifyWatcher(directory, interval)
+        except (OSError, AttributeError, TypeError):
+            pass
+    return PollingWatcher(directory, interval)
+
+
+def run_scan(args: Namespace) -> float:
+    """Worker: process a single scan, return run time in seconds"""
+    t0 = time.perf_counter()
+    process(args)
+    return time.perf_counter() - t0
+
+
+class WatchDaemon:
+    """
+    Debounces candidate files from a watcher, and queues those whose size has
+    not changed for settle seconds into a pool of workers.
+    At most max_queue scans wait for a free worker; the rest stay pending.
+    """
+
+    def __init__(
+        self,
+        args: Namespace,
+        watcher,
+        workers: int = 1,
+        settle: float = 6.0,
+        max_queue: int = 16,
+        status_file: str = None,
+        max_jobs_per_worker: int = DEFAULT_MAX_JOBS_PER_WORKER,
+    ):
+        self.args = args
+        self.watcher = watcher
+        self.settle = settle
+        self.max_queue = max_queue
+        self.status_file = status_file
+
+        self.pool = WorkerPool(workers, max_jobs_per_worker, prestart=False)
+        self.workers = workers
+        self.seen = set()  # files already queued (or skipped)
+        self.pending = {}  # path: (size, size unchanged since, first seen)
+        self.backlog = deque()  # (path, first seen), stable but not yet submitted
+        self.running = {}  # future: (path, first seen)
+        self.latency = {}  # path: seconds from detection to results
+        self.failed = {}  # path: error message
+
+    def ignore(self, paths):
+        """Mark existing files as already processed"""
+        self.seen.update(paths)
+
+    def run_forever(self):
+        print(f"Watching {self.watcher.directory} ({type(self.watcher).__name__})")
+        try:
+            self.pool.prestart()
+            while True:
+                self.step()
+        except KeyboardInterrupt:
+            print("Stopping, waiting for running scans to finish...")
+        finally:
+            self.watcher.close()
+            self.pool.shutdown(wait=True, cancel_futures=True)
+            self.collect()
+
+    def add(self, paths):
+        """Start debouncing new candidate files"""
+        for path in paths:
+            if path not in self.seen and path not in self.pending:
+                now = time.time()
+                self.pending[path] = (-1, now, now)
+
+    def step(self):
+        self.add(self.watcher.changes())
+        self.debounce()
+        self.submit()
+        self.collect()
+
+    def debounce(self):
+        now = time.time()
+        for path, (size, since, t0) in list(self.pending.items()):
+            try:
+                new_size = os.path.getsize(path)
+            except OSError:
+                del self.pending[path]  # removed / renamed while being written
+                continue
+
+            if new_size != size or new_size == 0:
+                self.pending[path] = (new_size, now, t0)
+            elif now - since >= self.settle:
+                del self.pending[path]
+                self.seen.add(path)
+                self.backlog.append((path, t0))
+
+    def submit(self):
+        while self.backlog and len(self.running) < self.workers + self.max_queue:
+            path, t0 = self.backlog.popleft()
+
+            args = Namespace(**vars(self.args))
+            args.input_file = path
+            try:
+                args = check_args(args)
+            except (ValueError, FileNotFoundError, PermissionError) as e:
+                self.failed[path] = str(e)
+                print(f"Skipping {path}: {e}")
+                continue
+
+            self.running[self.pool.submit(run_scan, args)] = (path, t0)
+            print(f"Queued {path} (queue depth: {self.depth})")
+            self.write_status()
+
+    def collect(self):
+        done = [f for f in self.running if f.done()]
+        for future in done:
+            path, t0 = self.running.pop(future)
+            try:
+                runtime = future.result()
+            except Exception as e:
+                self.failed[path] = f"{type(e).__name__}: {e}"
+                print(f"Failed {path}: {self.failed[path]}")
+            else:
+                self.latency[path] = time.time() - t0
+                print(
+                    f"Done {path} in {runtime:.1f} s, "
+                    f"{self.latency[path]:.1f} s after detection "
+                    f"(queue depth: {self.depth})"
+                )
+        if done:
+            self.write_status()
+
+    @property
+    def depth(self) -> int:
+        """Scans waiting for, or running on, a worker"""
+        return len(self.backlog) + len(self.running)
+
+    def status(self) -> dict:
+        return dict(
+            pending=sorted(self.pending),
+            depth=self.depth,
+            running=sorted(p for p, _ in self.running.values()),
+            latency_seconds=self.latency,
+            failed=self.failed,
+        )
+
+    def write_status(self):
+        if not self.status_file:
+            return
+        tmp = self.status_file + ".tmp"
+        with open(tmp, "w", encoding="utf8") as f:
+            json.dump(self.status(), f, indent=4)
+        os.replace(tmp, self.status_file)
+
+
+def main(argv: list[str] = None):
+    p = get_parser(
+        prog="python -m microtexture watch",
+        description="Process .ang / .ctf scans as they appear in a directory",
+    )
+    p.add_argument("directory", help="Directory to watch for new .ang / .ctf files")
+
+    w = p.add_argument_group("watch options")
+    w.add_argument(
+        "-j", "--workers", type=int, default=1, help="Parallel scans [%(default)s]"
+    )
+    w.add_argument(
+        "--max-queue",
+        type=int,
+        default=16,
+        help="Max. scans waiting for a free worker [%(default)s]",
+    )
+    w.add_argument(
+        "--interval",
+        type=float,
+        default=2.0,
+        help="Seconds between (polling / file size) checks [%(default)s]",
+    )
+    w.add_argument(
+        "--settle",
+        type=float,
+        default=6.0,
+        help="Seconds without change in file size before processing [%(default)s]",
+    )
+    w.add_argument(
+        "--poll", action="store_true", help="Poll the directory instead of using inotify"
+    )
+    w.add_argument(
+        "--existing",
+        action="store_true",
+        help="Also process files already in the directory at start-up",
+    )
+    w.add_argument(
+        "--max-jobs-per-worker",
+        type=int,
+        default=DEFAULT_MAX_JOBS_PER_WORKER,
+        help="Replace worker processes after this many scans, 0 = never [%(default)s]",
+    )
+    w.add_argument("--status-file", help="Write queue / latency status (JSON) here")
+
+    args = p.parse_args(argv)
+    directory = os.path.abspath(os.path.expanduser(args.directory))
+    if not os.path.isdir(directory):
+        raise FileNotFoundError(f"Directory {directory} does not exist.")
+
+    watcher = get_watcher(directory, interval=args.interval, poll=args.poll)
+    daemon = WatchDaemon(
+        args,
+        watcher,
+        workers=args.workers,
+        settle=args.settle,
+        max_queue=args.max_queue,
+        status_file=args.status_file,
+        max_jobs_per_worker=args.max_jobs_per_worker,
+    )
+    if args.existing:
+        daemon.add(watcher.scan())
+    else:
+        daemon.ignore(watcher.scan())
+    daemon.run_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Pool of warm worker processes for scan jobs.
+
+Each worker imports the analysis dependencies (pandas, h5py, scikit-image,
+PIL, via postprocess) once, when it starts, instead of once per scan. Workers
+are replaced after max_jobs_per_worker jobs, so that memory held by long-lived
+processes (leaks, fragmentation, caches) is given back regularly; the
+replacement warms up as soon as its predecessor exits, not when the next job
+arrives.
+
+Used by the watch daemon and the job server; the CLI reaches a running pool
+with --server, which only needs the (light) cli / serve imports.
+"""
+
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait
+
+DEFAULT_MAX_JOBS_PER_WORKER = 50
+
+
+def warm_up():
+    """Worker initializer: import the heavy analysis modules ahead of any job"""
+    from . import postprocess  # noqa: F401
+
+
+class WorkerPool(ProcessPoolExecutor):
+    """
+    ProcessPoolExecutor of pre-imported workers, recycled every
+    max_jobs_per_worker jobs (0 / None: never).
+    With prestart, all workers are started (and warmed up) before returning.
+    """
+
+    def __init__(
+        self,
+        workers: int = 1,
+        max_jobs_per_worker: int = DEFAULT_MAX_JOBS_PER_WORKER,
+        prestart: bool = True,
+    ):
+        kwargs = {}
+        if max_jobs_per_worker:
+            # Recycling workers is not supported with the "fork" start method
+            kwargs = dict(
+                max_tasks_per_child=max_jobs_per_worker,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        super().__init__(max_workers=workers, initializer=warm_up, **kwargs)
+        self.workers = workers
+        self.max_jobs_per_worker = max_jobs_per_worker or None
+
+        if prestart:
+            self.prestart()
+
+    def prestart(self):
+        """Start every worker now, rather than on first use"""
+        # Start-up tasks block each other, so that each one lands on a new
+        # worker. With recycling, they count as one job of each worker.
+        with multiprocessing.Manager() as manager:
+            barrier = manager.Barrier(self.workers)
+            wait([self.submit(_started, barrier) for _ in range(self.workers)])
+
+    def pids(self) -> list[int]:
+        return sorted(self._processes or ())
+
+
+def _started(barrier) -> int:
+    barrier.wait()
+    return os.getpid()